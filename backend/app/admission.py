@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import asyncio
+import ipaddress
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable
+
+from fastapi import HTTPException, Request
+
+from .config import Settings, get_settings
+
+LOGGER = logging.getLogger("sentiment-admission")
+
+MAX_TRACKED_CLIENTS = 10_000
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Consume one token; returns 0 on success, else seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+
+class RouteGate:
+    """Concurrency limit with a bounded wait queue and a queue-time budget."""
+
+    def __init__(self, limit: int, max_queue: int, queue_timeout_s: float) -> None:
+        self.limit = max(1, limit)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout_s = queue_timeout_s
+        self._sem = asyncio.Semaphore(self.limit)
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.degraded = 0
+
+    async def enter(self) -> bool:
+        if self._sem.locked() and self.waiting >= self.max_queue:
+            return False
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout=self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        self.admitted += 1
+        return True
+
+    def leave(self) -> None:
+        self.in_flight -= 1
+        self._sem.release()
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "degraded": self.degraded,
+        }
+
+
+@dataclass
+class Ticket:
+    route: str
+    admitted: bool
+    degraded: bool = False
+
+
+class AdmissionController:
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+        self.gates: dict[str, RouteGate] = {}
+        for entry in settings.ADMISSION_LIMITS.split(","):
+            route, _, limit = entry.partition("=")
+            if route.strip() and limit.strip().isdigit():
+                self.gates[route.strip()] = RouteGate(int(limit), settings.ADMISSION_MAX_QUEUE, settings.ADMISSION_QUEUE_TIMEOUT_S)
+        self.buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self.rate_limited = 0
+
+    def _bucket(self, client: str) -> TokenBucket:
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            bucket = TokenBucket(self.settings.ADMISSION_CLIENT_RATE, self.settings.ADMISSION_CLIENT_BURST)
+            self.buckets[client] = bucket
+            if len(self.buckets) > MAX_TRACKED_CLIENTS:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(client)
+        return bucket
+
+    async def acquire(self, route: str, client: str, degrade: bool) -> Ticket:
+        if self.settings.ADMISSION_CLIENT_RATE > 0:
+            wait_s = self._bucket(client).take()
+            if wait_s > 0:
+                self.rate_limited += 1
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many requests for this client.",
+                    headers={"Retry-After": str(max(1, math.ceil(wait_s)))},
+                )
+        gate = self.gates.get(route)
+        if gate is None:
+            return Ticket(route, admitted=False)
+        if await gate.enter():
+            return Ticket(route, admitted=True)
+        if degrade:
+            gate.degraded += 1
+            return Ticket(route, admitted=False, degraded=True)
+        gate.rejected += 1
+        LOGGER.warning("Shedding %s: %s in flight, %s waiting.", route, gate.in_flight, gate.waiting)
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy; please retry shortly.",
+            headers={"Retry-After": str(max(1, math.ceil(gate.queue_timeout_s)))},
+        )
+
+    def release(self, ticket: Ticket) -> None:
+        if ticket.admitted:
+            self.gates[ticket.route].leave()
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "routes": {route: gate.snapshot() for route, gate in self.gates.items()},
+            "rate_limited": self.rate_limited,
+            "tracked_clients": len(self.buckets),
+        }
+
+
+_CONTROLLER: AdmissionController | None = None
+
+
+def get_controller(settings: Settings) -> AdmissionController:
+    global _CONTROLLER
+    if _CONTROLLER is None:
+        _CONTROLLER = AdmissionController(settings)
+    return _CONTROLLER
+
+
+@lru_cache(maxsize=4)
+def _trusted_networks(spec: str) -> tuple[ipaddress.IPv4Network | ipaddress.IPv6Network, ...]:
+    networks = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(part, strict=False))
+        except ValueError:
+            LOGGER.warning("Ignoring invalid ADMISSION_TRUSTED_PROXIES entry %r", part)
+    return tuple(networks)
+
+
+def _is_trusted(host: str, networks: tuple[ipaddress.IPv4Network | ipaddress.IPv6Network, ...]) -> bool:
+    try:
+        addr = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(addr in net for net in networks)
+
+
+def _client_key(request: Request, settings: Settings) -> str:
+    """
+    The peer address, or, when the peer is a trusted proxy, the nearest
+    X-Forwarded-For hop that is not one. Anyone else could put any address in
+    the header and get a fresh token bucket per request.
+    """
+    peer = request.client.host if request.client else "unknown"
+    networks = _trusted_networks(settings.ADMISSION_TRUSTED_PROXIES)
+    forwarded = request.headers.get("x-forwarded-for")
+    if not forwarded or not _is_trusted(peer, networks):
+        return peer
+    # Proxies append, so walk from the right: the first untrusted hop is the client.
+    hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted(hop, networks):
+            return hop
+    return hops[0] if hops else peer
+
+
+def admit(route: str, degrade: bool = False) -> Callable[[Request], AsyncIterator[Ticket]]:
+    """
+    FastAPI dependency guarding an LLM-backed route. Raises 429 (client over its
+    token bucket) or 503 (route saturated) with Retry-After; with `degrade=True`
+    a saturated route instead yields a ticket marked `degraded`.
+    """
+
+    async def dependency(request: Request) -> AsyncIterator[Ticket]:
+        settings = get_settings()
+        if not settings.ADMISSION_ENABLED:
+            yield Ticket(route, admitted=False)
+            return
+        controller = get_controller(settings)
+        ticket = await controller.acquire(route, _client_key(request, settings), degrade)
+        try:
+            yield ticket
+        finally:
+            controller.release(ticket)
+
+    return dependency
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import itertools
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Any
+
+from .config import Settings
+
+LOGGER = logging.getLogger("sentiment-alerts")
+
+# Empty buckets folded into the baseline one at a time are capped; beyond this
+# the baseline has decayed to (1 - alpha) ** cap of its value and is simply reset.
+MAX_FOLD = 64
+
+
+class _Series:
+    """
+    EWMA mean/variance of per-bucket event counts for one (city, category).
+    Buckets are by event time; a bucket stays open while late events can still
+    land in it (ALERTS_MAX_LAG_S) and only then updates the baseline.
+    """
+
+    __slots__ = ("closed", "open", "mean", "var", "buckets", "alerts")
+
+    def __init__(self, closed: int) -> None:
+        # Newest bucket already folded into the baseline.
+        self.closed = closed
+        self.open: dict[int, int] = {}
+        self.mean = 0.0
+        self.var = 0.0
+        self.buckets = 0
+        self.alerts: dict[int, dict[str, Any]] = {}
+
+    def _fold(self, x: float, alpha: float) -> None:
+        diff = x - self.mean
+        incr = alpha * diff
+        self.mean += incr
+        self.var = (1 - alpha) * (self.var + diff * incr)
+        self.buckets += 1
+
+    def roll(self, final: int, alpha: float) -> None:
+        """Fold every bucket up to `final` (no longer reachable by late events) into the baseline."""
+        if final <= self.closed:
+            return
+        span = final - self.closed
+        if span >= MAX_FOLD:
+            self.mean = self.var = 0.0
+            self.buckets += span
+            self.open.clear()
+            self.alerts.clear()
+        else:
+            for bucket in range(self.closed + 1, final + 1):
+                self._fold(self.open.pop(bucket, 0), alpha)
+                self.alerts.pop(bucket, None)
+        self.closed = final
+
+    def zscore(self, count: int, min_sd: float) -> float:
+        return (count - self.mean) / max(math.sqrt(self.var), min_sd)
+
+
+class SpikeDetector:
+    """
+    Streaming spike detection over per-(city, category) event counts.
+
+    Events are counted into ALERTS_BUCKET_S buckets by their own timestamp, so a
+    batch of older posts fetched at once lands where it happened, not in the
+    bucket it arrived in. A bucket updates the EWMA baseline (mean and variance)
+    once it is older than ALERTS_MAX_LAG_S, when no accepted event can still
+    reach it. Open buckets are compared against the baseline on every event, so
+    a spike is raised as soon as a count crosses ALERTS_Z standard deviations
+    (and ALERTS_MIN_COUNT events), but only once the series has
+    ALERTS_MIN_BUCKETS closed buckets: a city seen for the first time has no
+    baseline to spike against. Work per event is O(1) amortized and memory is
+    bounded: series, seen ids and alert history are all capped LRUs/ring buffers.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self.bucket_s = max(1, settings.ALERTS_BUCKET_S)
+        self.alpha = settings.ALERTS_EWMA_ALPHA
+        self.z = settings.ALERTS_Z
+        self.min_count = settings.ALERTS_MIN_COUNT
+        self.min_buckets = max(1, settings.ALERTS_MIN_BUCKETS)
+        self.min_sd = settings.ALERTS_MIN_SD
+        self.max_lag_s = settings.ALERTS_MAX_LAG_S
+        self.max_series = max(1, settings.ALERTS_MAX_SERIES)
+        self.max_seen = max(1, settings.ALERTS_MAX_SEEN)
+        self.series: OrderedDict[tuple[str, str], _Series] = OrderedDict()
+        self.seen: OrderedDict[str, None] = OrderedDict()
+        self.alerts: deque[dict[str, Any]] = deque(maxlen=max(1, settings.ALERTS_HISTORY))
+        self._ids = itertools.count(1)
+        self.observed = 0
+        self.skipped = 0
+
+    def _is_new(self, event_id: str) -> bool:
+        if event_id in self.seen:
+            self.seen.move_to_end(event_id)
+            return False
+        self.seen[event_id] = None
+        if len(self.seen) > self.max_seen:
+            self.seen.popitem(last=False)
+        return True
+
+    def observe(self, event_id: str, city: str | None, category: str, ts: float | None = None, now: float | None = None) -> dict[str, Any] | None:
+        """
+        Count one post or feedback item at its event time `ts`. Returns the alert
+        if this event raised or extended one. Re-observed ids, items without a
+        city and items older than ALERTS_MAX_LAG_S are ignored.
+        """
+        now = time.time() if now is None else now
+        ts = now if ts is None else min(ts, now)
+        if not city or now - ts > self.max_lag_s or not self._is_new(event_id):
+            self.skipped += 1
+            return None
+        self.observed += 1
+        key = (city, category)
+        bucket = int(ts // self.bucket_s)
+        # Accepted events are at most max_lag_s old, so buckets before this one are final.
+        final = int((now - self.max_lag_s) // self.bucket_s) - 1
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = _Series(final)
+            if len(self.series) > self.max_series:
+                self.series.popitem(last=False)
+        else:
+            self.series.move_to_end(key)
+            series.roll(final, self.alpha)
+        count = series.open[bucket] = series.open.get(bucket, 0) + 1
+
+        if count < self.min_count or series.buckets < self.min_buckets:
+            return None
+        z = series.zscore(count, self.min_sd)
+        if z < self.z:
+            return None
+        alert = series.alerts.get(bucket)
+        if alert is not None:
+            alert.update(count=count, zscore=round(z, 2), updated_at=int(now))
+            return alert
+        alert = series.alerts[bucket] = {
+            "id": next(self._ids),
+            "city": city,
+            "category": category,
+            "count": count,
+            "expected": round(series.mean, 2),
+            "zscore": round(z, 2),
+            "window_s": self.bucket_s,
+            "window_start": bucket * self.bucket_s,
+            "raised_at": int(now),
+            "updated_at": int(now),
+        }
+        self.alerts.append(alert)
+        LOGGER.warning(
+            "Spike: %s %s reports in %s within %ss (expected %.1f, z=%.1f).",
+            count, category, city, self.bucket_s, series.mean, z,
+        )
+        return alert
+
+    def recent(self, since_id: int = 0, limit: int = 50) -> list[dict[str, Any]]:
+        """Alerts with id > since_id, newest first."""
+        return [dict(a) for a in reversed(self.alerts) if a["id"] > since_id][:limit]
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "series": len(self.series),
+            "seen_ids": len(self.seen),
+            "observed": self.observed,
+            "skipped": self.skipped,
+            "alerts": len(self.alerts),
+        }
+
+
+_DETECTOR: SpikeDetector | None = None
+
+
+def get_detector(settings: Settings) -> SpikeDetector | None:
+    global _DETECTOR
+    if not settings.ALERTS_ENABLED:
+        return None
+    if _DETECTOR is None:
+        _DETECTOR = SpikeDetector(settings)
+    return _DETECTOR
+
+
+def observe(event_id: str, city: str | None, category: str, ts: float | None, settings: Settings) -> None:
+    detector = get_detector(settings)
+    if detector is not None:
+        detector.observe(event_id, city, category, ts)
@@ -0,0 +1,300 @@
+"""
+Near-duplicate answer cache for JOY's first-turn questions.
+
+Questions are normalized to search.tokenize terms (minus greetings and filler)
+and compared by TF-IDF cosine against every stored question that shares a
+term. A match at CHAT_ANSWER_SIMILARITY or above returns the stored answer
+without an LLM call. Questions that differ in a number ("iphone 14" vs
+"iphone 15", "$35" vs "$50") or in a negation ("esim works" vs "esim doesn't
+work") never match.
+
+Answers learned from the LLM expire after CHAT_ANSWER_TTL_S. They are served
+to every customer, so a question that looks personal (see `personal`) is
+never remembered: the LLM's reply may repeat it. Pinned answers
+are curated by admins, never expire, win over learned ones and are kept in
+CHAT_ANSWER_PINNED_PATH (re-read when another worker changes it).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any
+
+from .config import Settings
+from .search import STOPWORDS, tokenize
+
+LOGGER = logging.getLogger("sentiment-answers")
+
+# Words that change how a question is phrased, not what it asks.
+FILLER = frozenset(
+    "hi hello hey joy please pls thanks thank can could would should just tell know need want help "
+    "do does did how why there".split()
+)
+# Words that flip what a question asks. Kept as terms ("no" and "not" are search
+# stopwords) and, like numbers, required to match exactly.
+NEGATIONS = frozenset("no not never cant wont dont doesnt didnt isnt arent wasnt".split())
+_CONTRACTION_RE = re.compile(r"n[’']t\b")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+# Below this many terms a question is too vague to answer from cache ("help", "hi joy").
+MIN_TERMS = 2
+# How often a worker checks whether the pinned-answers file changed.
+PIN_RELOAD_S = 5.0
+# Four or more digits, possibly split by separators: phone, account, IMEI, PIN,
+# card or ZIP numbers. Model numbers ("iphone 15", "s24", "a54") stay shorter.
+_DIGITS_RE = re.compile(r"\d(?:[\s().+-]?\d){3,}")
+_EMAIL_RE = re.compile(r"\S+@\S+\.\w+")
+# A customer introducing themselves. After "I'm"/"this is" only a capitalized word
+# counts as a name, so "i am having trouble" is still cached.
+_NAME_RE = re.compile(r"\b(?:[Mm]y name is|[Nn]ame'?s|[Cc]all me)\s+[a-zA-Z]+|\b(?:[Ii]'?m|[Ii] am|[Tt]his is)\s+[A-Z][a-z]+")
+# Requests that only make sense for one account.
+_ACCOUNT_RE = re.compile(
+    r"\b(?:my (?:account|acct|number|phone number|bill|address|email|pin|password|ssn|social|card|imei)|"
+    r"account (?:number|pin)|social security)\b",
+    re.IGNORECASE,
+)
+
+
+def normalize(question: str) -> list[str]:
+    text = _CONTRACTION_RE.sub("nt", question.lower()).replace("cannot", "cant")
+    terms = [t for t in tokenize(text) if t not in FILLER]
+    return terms + [w for w in _WORD_RE.findall(text) if w in NEGATIONS and w in STOPWORDS]
+
+
+def personal(question: str) -> bool:
+    """
+    True when `question` may carry personal data: long digit runs, an email
+    address, a name or a request about the asker's own account. Such answers
+    are never shared across customers.
+    """
+    return any(r.search(question) for r in (_DIGITS_RE, _EMAIL_RE, _NAME_RE, _ACCOUNT_RE))
+
+
+def _negations(terms: Counter[str]) -> frozenset[str]:
+    return frozenset(t for t in terms if t in NEGATIONS)
+
+
+class Answer:
+    __slots__ = ("id", "question", "answer", "terms", "numbers", "negations", "pinned", "created_at", "cost", "hits")
+
+    def __init__(self, answer_id: str, question: str, answer: str, pinned: bool, cost: int = 0,
+                 created_at: float | None = None) -> None:
+        self.id = answer_id
+        self.question = question
+        self.answer = answer
+        self.terms = Counter(normalize(question))
+        self.numbers = frozenset(t for t in self.terms if t.isdigit())
+        self.negations = _negations(self.terms)
+        self.pinned = pinned
+        self.created_at = created_at or time.time()
+        # Estimated tokens an LLM call for this question costs: what a hit saves.
+        self.cost = cost
+        self.hits = 0
+
+    def public(self) -> dict[str, Any]:
+        return {"id": self.id, "question": self.question, "answer": self.answer, "hits": self.hits,
+                "created_at": int(self.created_at)}
+
+
+class AnswerCache:
+    def __init__(self, threshold: float, ttl_s: float, max_entries: int, pinned_path: str | None = None) -> None:
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max(1, max_entries)
+        self.pinned_path = pinned_path
+        self._entries: dict[str, Answer] = {}
+        # term -> ids of the entries whose question contains it (also the document frequencies).
+        self._postings: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+        self._pins_mtime = 0.0
+        self._pins_checked = 0.0
+        self.lookups = 0
+        self.hits = 0
+        self.pinned_hits = 0
+        self.tokens_saved = 0
+        self._load_pins()
+
+    # ---- index ----
+
+    def _add(self, entry: Answer) -> None:
+        self._entries[entry.id] = entry
+        for term in entry.terms:
+            self._postings.setdefault(term, set()).add(entry.id)
+
+    def _remove(self, entry_id: str) -> Answer | None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is not None:
+            for term in entry.terms:
+                ids = self._postings.get(term)
+                if ids is not None:
+                    ids.discard(entry_id)
+                    if not ids:
+                        del self._postings[term]
+        return entry
+
+    def _idf(self, term: str) -> float:
+        return math.log((1 + len(self._entries)) / (1 + len(self._postings.get(term, ())))) + 1.0
+
+    def _vector(self, terms: Counter[str]) -> dict[str, float]:
+        weights = {t: c * self._idf(t) for t, c in terms.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values()))
+        return {t: w / norm for t, w in weights.items()} if norm else {}
+
+    def _expired(self, entry: Answer, now: float) -> bool:
+        return not entry.pinned and self.ttl_s > 0 and now - entry.created_at > self.ttl_s
+
+    # ---- lookups ----
+
+    def lookup(self, question: str) -> tuple[Answer, float] | None:
+        terms = Counter(normalize(question))
+        self._maybe_reload_pins()
+        with self._lock:
+            self.lookups += 1
+            if len(terms) < MIN_TERMS:
+                return None
+            numbers = frozenset(t for t in terms if t.isdigit())
+            negations = _negations(terms)
+            query = self._vector(terms)
+            candidates = set().union(*(self._postings.get(t, ()) for t in terms))
+            now = time.time()
+            best: tuple[Answer, float] | None = None
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if self._expired(entry, now):
+                    self._remove(entry_id)
+                    continue
+                if entry.numbers != numbers or entry.negations != negations:
+                    continue
+                vector = self._vector(entry.terms)
+                score = sum(w * vector.get(t, 0.0) for t, w in query.items())
+                if score < self.threshold:
+                    continue
+                if best is None or (entry.pinned, score) > (best[0].pinned, best[1]):
+                    best = (entry, score)
+            if best is None:
+                return None
+            entry = best[0]
+            entry.hits += 1
+            self.hits += 1
+            self.pinned_hits += entry.pinned
+            self.tokens_saved += entry.cost
+            return best
+
+    def remember(self, question: str, answer: str, cost: int) -> None:
+        """Keep an LLM answer for later near-duplicates of `question`, unless it may be personal."""
+        if len(normalize(question)) < MIN_TERMS or personal(question):
+            return
+        with self._lock:
+            learned = [e for e in self._entries.values() if not e.pinned]
+            if len(learned) >= self.max_entries:
+                # Dict order is insertion order: drop the oldest learned answer.
+                self._remove(learned[0].id)
+            self._add(Answer(uuid.uuid4().hex, question, answer, pinned=False, cost=cost))
+
+    # ---- pinned answers ----
+
+    def pinned(self) -> list[dict[str, Any]]:
+        self._maybe_reload_pins()
+        with self._lock:
+            return [e.public() for e in self._entries.values() if e.pinned]
+
+    def pin(self, question: str, answer: str) -> dict[str, Any]:
+        if len(normalize(question)) < MIN_TERMS:
+            raise ValueError("Question is too vague to match: use at least two meaningful words")
+        with self._lock:
+            # A curated answer replaces any learned answer to the same question.
+            for entry in [e for e in self._entries.values() if e.terms == Counter(normalize(question))]:
+                self._remove(entry.id)
+            entry = Answer(uuid.uuid4().hex, question, answer, pinned=True)
+            self._add(entry)
+            self._save_pins()
+        return entry.public()
+
+    def unpin(self, answer_id: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(answer_id)
+            if entry is None or not entry.pinned:
+                return False
+            self._remove(answer_id)
+            self._save_pins()
+        return True
+
+    def _save_pins(self) -> None:
+        if not self.pinned_path:
+            return
+        pins = [{"id": e.id, "question": e.question, "answer": e.answer, "created_at": e.created_at}
+                for e in self._entries.values() if e.pinned]
+        tmp = f"{self.pinned_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(pins, fh, indent=2)
+        os.replace(tmp, self.pinned_path)
+        self._pins_mtime = os.stat(self.pinned_path).st_mtime
+
+    def _load_pins(self) -> None:
+        if not self.pinned_path:
+            return
+        try:
+            mtime = os.stat(self.pinned_path).st_mtime
+            with open(self.pinned_path, encoding="utf-8") as fh:
+                pins = json.load(fh)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as exc:
+            LOGGER.warning("Ignoring unreadable pinned answers %s: %s", self.pinned_path, exc)
+            return
+        with self._lock:
+            for entry in [e for e in self._entries.values() if e.pinned]:
+                self._remove(entry.id)
+            for pin in pins:
+                self._add(Answer(pin["id"], pin["question"], pin["answer"], pinned=True, created_at=pin.get("created_at")))
+            self._pins_mtime = mtime
+        LOGGER.info("Loaded %s pinned answers from %s.", len(pins), self.pinned_path)
+
+    def _maybe_reload_pins(self) -> None:
+        now = time.monotonic()
+        if not self.pinned_path or now - self._pins_checked < PIN_RELOAD_S:
+            return
+        self._pins_checked = now
+        try:
+            changed = os.stat(self.pinned_path).st_mtime != self._pins_mtime
+        except OSError:
+            return
+        if changed:
+            self._load_pins()
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            pinned = sum(e.pinned for e in self._entries.values())
+            return {
+                "entries": len(self._entries) - pinned,
+                "pinned": pinned,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "pinned_hits": self.pinned_hits,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+                "tokens_saved": self.tokens_saved,
+                "threshold": self.threshold,
+            }
+
+
+_CACHE: AnswerCache | None = None
+
+
+def get_cache(settings: Settings) -> AnswerCache | None:
+    global _CACHE
+    if not settings.CHAT_ANSWER_CACHE_ENABLED:
+        return None
+    if _CACHE is None:
+        _CACHE = AnswerCache(
+            settings.CHAT_ANSWER_SIMILARITY,
+            settings.CHAT_ANSWER_TTL_S,
+            settings.CHAT_ANSWER_MAX_ENTRIES,
+            settings.CHAT_ANSWER_PINNED_PATH,
+        )
+    return _CACHE
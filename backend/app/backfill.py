@@ -0,0 +1,299 @@
+"""
+Re-analyze historical feedback after a prompt or model change.
+
+    python -m app.backfill [--concurrency 4] [--tokens-per-minute 60000] [--limit N] [--force] [--restart] [--dry-run]
+
+Streams the `feedback` collection in key order and re-runs the workflow
+analysis for every item whose stored analysis is missing or not at
+services.analysis_version(). Results are written BACKFILL_WRITE_BATCH at a
+time and the last fully written feedback key is checkpointed after every page,
+so an interrupted run resumes where it stopped. A finished run removes its
+checkpoint; running again then only retries what failed.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any
+
+from . import conditional, llm, prompts, search
+from .config import Settings
+from .export import iter_keyed
+from .schemas import FeedbackItem
+from .writebehind import write_records
+
+LOGGER = logging.getLogger("sentiment-backfill")
+
+# The analysis prompt without the feedback text, plus its max_tokens; used to
+# reserve tokens before a call. The real usage is settled afterwards.
+PROMPT_OVERHEAD_TOKENS = 450
+COMPLETION_TOKENS = 700
+
+
+class TokenRate:
+    """Token bucket over LLM tokens per minute; calls reserve an estimate and settle the difference."""
+
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = float(max(1, per_minute))
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, tokens: int) -> None:
+        need = min(float(tokens), self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= need:
+                self.tokens -= tokens
+                return
+            await asyncio.sleep((need - self.tokens) / self.rate)
+
+    def settle(self, delta: int) -> None:
+        """Charge (or refund) the difference between reserved and actual tokens."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+async def _read_versions(settings: Settings) -> dict[str, dict[str, Any]]:
+    """feedback id -> the fields of its current analysis that a re-analysis keeps."""
+    kept: dict[str, dict[str, Any]] = {}
+    async for page in iter_keyed("feedback_analyses", settings):
+        for key, rec in page:
+            kept[str(rec.get("feedback_id") or key)] = {
+                "prompt_version": rec.get("prompt_version"),
+                "analyzed_at": rec.get("analyzed_at"),
+                "incident_id": rec.get("incident_id"),
+                "resolved": bool(rec.get("resolved")),
+            }
+    return kept
+
+
+def _write_batch(records: dict[str, dict[str, Any]], settings: Settings) -> None:
+    # Direct, not through the write-behind buffer: the checkpoint must only move
+    # past records Firebase has accepted.
+    write_records([("feedback_analyses", key, record) for key, record in records.items()], settings)
+
+
+def _index_batch(records: dict[str, dict[str, Any]], settings: Settings) -> None:
+    for record in records.values():
+        search.index_analysis(record, settings)
+
+
+def _load_checkpoint(path: str, version: str) -> dict[str, Any] | None:
+    try:
+        with open(path, encoding="utf-8") as fh:
+            state = json.load(fh)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as exc:
+        LOGGER.warning("Ignoring unreadable checkpoint %s: %s", path, exc)
+        return None
+    if state.get("version") != version:
+        LOGGER.info("Checkpoint %s is for version %s; starting over for %s.", path, state.get("version"), version)
+        return None
+    return state
+
+
+def _save_checkpoint(path: str, state: dict[str, Any]) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(state, fh)
+    os.replace(tmp, path)
+
+
+class Backfill:
+    def __init__(
+        self,
+        settings: Settings,
+        concurrency: int,
+        tokens_per_minute: int,
+        batch_size: int,
+        checkpoint: str,
+        limit: int | None = None,
+        force: bool = False,
+        restart: bool = False,
+        dry_run: bool = False,
+    ) -> None:
+        from .services import analysis_version
+
+        self.settings = settings
+        self.version = analysis_version(settings)
+        self.concurrency = max(1, concurrency)
+        self.rate = TokenRate(tokens_per_minute)
+        self.batch_size = max(1, batch_size)
+        self.checkpoint = checkpoint
+        self.limit = limit
+        self.force = force
+        self.restart = restart
+        self.dry_run = dry_run
+        self.stats = {"seen": 0, "skipped": 0, "analyzed": 0, "failed": 0, "written": 0}
+        self.failed_ids: list[str] = []
+        self._pending: dict[str, dict[str, Any]] = {}
+        self._metered = llm.USAGE.daily.get("feedback_analysis", 0)
+
+    def _stale(self, key: str, kept: dict[str, dict[str, Any]]) -> bool:
+        if self.force:
+            return True
+        return (kept.get(key) or {}).get("prompt_version") != self.version
+
+    async def _analyze(self, key: str, rec: dict[str, Any], previous: dict[str, Any] | None) -> dict[str, Any] | None:
+        from .services import _llm_feedback_analysis
+
+        item = FeedbackItem(
+            id=str(rec.get("id") or key),
+            text=str(rec.get("text") or ""),
+            author=str(rec.get("author") or "customer"),
+            posted_at=rec.get("posted_at"),
+            location_hint=rec.get("location_hint") or None,
+        )
+        text = prompts.clip_tokens(prompts.compact_text(item.text), self.settings.PROMPT_REQUEST_TOKENS)
+        reserved = PROMPT_OVERHEAD_TOKENS + prompts.estimate_tokens(text) + COMPLETION_TOKENS
+        await self.rate.acquire(reserved)
+        try:
+            record = await _llm_feedback_analysis(item, self.settings)
+        finally:
+            # Charge whatever the meter recorded since the last settle. With calls in
+            # flight concurrently this is not exactly this call's usage, but the sum
+            # charged to the bucket is the true total.
+            total = llm.USAGE.daily.get("feedback_analysis", 0)
+            used, self._metered = max(0, total - self._metered), total
+            self.rate.settle(used - reserved)
+        if record is None:
+            return None
+        # Keep the dashboard's chronology and incident links: a re-analysis is not new feedback.
+        previous = previous or {}
+        record["analyzed_at"] = previous.get("analyzed_at") or rec.get("posted_at") or record["analyzed_at"]
+        if previous.get("incident_id"):
+            record["incident_id"] = previous["incident_id"]
+        record["resolved"] = record["resolved"] or previous.get("resolved", False)
+        return record
+
+    async def _flush(self) -> None:
+        if not self._pending:
+            return
+        records, self._pending = self._pending, {}
+        await asyncio.to_thread(_write_batch, records, self.settings)
+        # Through the shared index log, so running workers replace the old analysis text too.
+        await asyncio.to_thread(_index_batch, records, self.settings)
+        self.stats["written"] += len(records)
+        await conditional.bump(self.settings, "analyses")
+
+    async def _page(self, items: list[tuple[str, dict[str, Any]]], kept: dict[str, dict[str, Any]]) -> None:
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def one(key: str, rec: dict[str, Any]) -> tuple[str, dict[str, Any] | None]:
+            async with sem:
+                return key, await self._analyze(key, rec, kept.get(key))
+
+        tasks = [asyncio.create_task(one(key, rec)) for key, rec in items]
+        try:
+            for done in asyncio.as_completed(tasks):
+                key, record = await done
+                if record is None:
+                    self.stats["failed"] += 1
+                    self.failed_ids.append(key)
+                    continue
+                self.stats["analyzed"] += 1
+                self._pending[key] = record
+                if len(self._pending) >= self.batch_size:
+                    await self._flush()
+        finally:
+            for task in tasks:
+                task.cancel()
+        await self._flush()
+
+    async def run(self) -> dict[str, Any]:
+        state = None if self.restart else _load_checkpoint(self.checkpoint, self.version)
+        after = state.get("after") if state else None
+        if after:
+            LOGGER.info("Resuming %s after feedback key %s.", self.version, after)
+        kept = await _read_versions(self.settings)
+        budget = self.limit
+        finished = True
+        async for page in iter_keyed("feedback", self.settings, start_after=after):
+            self.stats["seen"] += len(page)
+            todo = [(k, r) for k, r in page if isinstance(r.get("text"), str) and r["text"].strip() and self._stale(k, kept)]
+            self.stats["skipped"] += len(page) - len(todo)
+            if budget is not None:
+                if budget <= 0:
+                    finished = False
+                    break
+                if len(todo) > budget:
+                    # Stop mid-page; the checkpoint must not move past unprocessed keys.
+                    todo, finished = todo[:budget], False
+                budget -= len(todo)
+            if self.dry_run:
+                self.stats["analyzed"] += len(todo)
+                continue
+            failed_before = self.stats["failed"]
+            await self._page(todo, kept)
+            if todo and self.stats["failed"] - failed_before == len(todo):
+                # Nothing on the page worked: an outage or spent budget, not bad records.
+                LOGGER.warning("Every analysis on this page failed; stopping at checkpoint %s.", after)
+                finished = False
+                break
+            if not finished:
+                break
+            after = page[-1][0]
+            _save_checkpoint(self.checkpoint, {"version": self.version, "after": after, "updated_at": int(time.time()), **self.stats})
+        if finished and not self.dry_run:
+            try:
+                os.remove(self.checkpoint)
+            except FileNotFoundError:
+                pass
+        return {"version": self.version, "finished": finished, **self.stats, "failed_ids": self.failed_ids[:50]}
+
+
+def main(argv: list[str] | None = None) -> int:
+    from .config import get_settings
+    from .services import _ensure_firebase
+
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Re-analyze feedback whose analysis predates the current prompt/model.")
+    parser.add_argument("--concurrency", type=int, default=settings.BACKFILL_CONCURRENCY)
+    parser.add_argument("--tokens-per-minute", type=int, default=settings.BACKFILL_TOKENS_PER_MINUTE)
+    parser.add_argument("--batch-size", type=int, default=settings.BACKFILL_WRITE_BATCH)
+    parser.add_argument("--checkpoint", default=settings.BACKFILL_CHECKPOINT)
+    parser.add_argument("--limit", type=int, default=None, help="Analyze at most this many items in this run.")
+    parser.add_argument("--force", action="store_true", help="Re-analyze items already at the current version too.")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the first feedback key.")
+    parser.add_argument("--dry-run", action="store_true", help="Count what would be re-analyzed; no LLM calls or writes.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    if not llm.configured_providers(settings) and not args.dry_run:
+        print("No LLM provider configured", file=sys.stderr)
+        return 1
+    _ensure_firebase(settings)
+    started = datetime.now(timezone.utc)
+    result = asyncio.run(
+        Backfill(
+            settings,
+            concurrency=args.concurrency,
+            tokens_per_minute=args.tokens_per_minute,
+            batch_size=args.batch_size,
+            checkpoint=args.checkpoint,
+            limit=args.limit,
+            force=args.force,
+            restart=args.restart,
+            dry_run=args.dry_run,
+        ).run()
+    )
+    result["elapsed_s"] = round((datetime.now(timezone.utc) - started).total_seconds(), 1)
+    print(json.dumps(result, indent=2))
+    return 0 if result["finished"] else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
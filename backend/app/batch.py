@@ -0,0 +1,372 @@
+from __future__ import annotations
+
+import math
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Any, Iterable, Iterator
+
+from .schemas import Location, SentimentResult, SocialPost
+
+# Category codes index into this tuple; its order is the issue_counts order.
+CATEGORIES = (
+    "Network Coverage",
+    "Customer Service",
+    "Billing",
+    "Pricing & Plans",
+    "Device and Equipment",
+    "Store Experience",
+    "Mobile App",
+    "Other",
+)
+OTHER = CATEGORIES.index("Other")
+SENTIMENTS = ("negative", "neutral", "positive")
+NEGATIVE, NEUTRAL, POSITIVE = range(3)
+_CATEGORY_CODES = {name: i for i, name in enumerate(CATEGORIES)}
+_SENTIMENT_CODES = {name: i for i, name in enumerate(SENTIMENTS)}
+# Posts are joined with a character no keyword contains, so matches never span two posts.
+_SEP = "\x00"
+
+
+class _Strings:
+    """Dictionary-encoded string column: small value table plus one int code per row (-1 is None)."""
+
+    __slots__ = ("values", "index", "codes")
+
+    def __init__(self) -> None:
+        self.values: list[str] = []
+        self.index: dict[str, int] = {}
+        self.codes = array("i")
+
+    def append(self, value: str | None) -> None:
+        if value is None:
+            self.codes.append(-1)
+            return
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+    def __getitem__(self, row: int) -> str | None:
+        code = self.codes[row]
+        return None if code < 0 else self.values[code]
+
+    def __setitem__(self, row: int, value: str | None) -> None:
+        if value is None:
+            self.codes[row] = -1
+            return
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+        self.codes[row] = code
+
+
+def _offsets(texts: list[str]) -> list[int]:
+    """Start of each text in `_SEP.join(texts)`."""
+    starts: list[int] = []
+    pos = 0
+    for text in texts:
+        starts.append(pos)
+        pos += len(text) + 1
+    return starts
+
+
+def _scan(buffer: str, starts: list[int], keywords: Iterable[str]) -> Iterator[int]:
+    """Row of each (keyword, row) pair where the row's text contains the keyword; one hit per row per keyword."""
+    find = buffer.find
+    n = len(starts)
+    for keyword in keywords:
+        i = find(keyword)
+        while i != -1:
+            row = bisect_right(starts, i) - 1
+            yield row
+            if row + 1 >= n:
+                break
+            # One hit per row is enough: resume at the next row's start.
+            i = find(keyword, starts[row + 1])
+
+
+def _sentiment_code(rating: int) -> int:
+    return POSITIVE if rating >= 4 else NEGATIVE if rating <= 2 else NEUTRAL
+
+
+class PostBatch:
+    """
+    Columnar posts for pipelines that handle thousands of posts at once.
+
+    Texts live in one buffer with start offsets; ids, authors and permalinks are
+    plain lists; timestamps, coordinates, ratings, sentiments and categories are
+    typed arrays; repeated strings (city, state, source) are dictionary-encoded.
+    Keyword heuristics scan the joined lowercase buffer once per keyword instead
+    of once per post and keyword. Pydantic models are only built by `results()`
+    for the rows a response actually returns; the input posts are never mutated.
+    """
+
+    def __init__(self, ids: list[str], texts: list[str]) -> None:
+        self.ids = ids
+        self.buffer = _SEP.join(texts)
+        self.starts = array("I", _offsets(texts))
+        self.authors: list[str] = []
+        self.permalinks: list[str | None] = []
+        self.sources = _Strings()
+        self.posted_at = array("d")
+        self.cities = _Strings()
+        self.states = _Strings()
+        self.raw_locations = _Strings()
+        self.latitudes = array("d")
+        self.longitudes = array("d")
+        n = len(ids)
+        self.ratings = array("b", bytes(n))
+        self.sentiments = array("b", bytes(n))
+        self.categories = array("B", bytes(n))
+        # Sparse per-row strings from LLM enrichment.
+        self.insights: dict[int, str] = {}
+        self.solutions: dict[int, str] = {}
+        self._lowered: tuple[str, list[int]] | None = None
+        # Source models, when built from them, are reused as-is for rows whose
+        # location enrichment did not change (never mutated, only replaced).
+        self._posts: list[SocialPost] | None = None
+        self._relocated: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def text(self, row: int) -> str:
+        end = self.starts[row + 1] - 1 if row + 1 < len(self.starts) else len(self.buffer)
+        return self.buffer[self.starts[row]:end]
+
+    def _add_location(self, location: Location | dict[str, Any] | None) -> None:
+        if isinstance(location, Location):
+            city, state, raw, lat, lng = location.city, location.state, location.raw, location.latitude, location.longitude
+        else:
+            location = location or {}
+            city, state, raw = location.get("city"), location.get("state"), location.get("raw")
+            lat, lng = location.get("latitude"), location.get("longitude")
+        self.cities.append(city)
+        self.states.append(state)
+        self.raw_locations.append(raw)
+        self.latitudes.append(float(lat) if isinstance(lat, (int, float)) else math.nan)
+        self.longitudes.append(float(lng) if isinstance(lng, (int, float)) else math.nan)
+
+    @classmethod
+    def from_posts(cls, posts: list[SocialPost]) -> PostBatch:
+        batch = cls([p.id for p in posts], [p.text for p in posts])
+        batch._posts = posts
+        for post in posts:
+            batch.authors.append(post.author)
+            batch.permalinks.append(post.permalink)
+            batch.sources.append(post.source)
+            batch.posted_at.append(post.posted_at.timestamp())
+            batch._add_location(post.location)
+        return batch
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict[str, Any]]) -> PostBatch:
+        """From plain dicts (e.g. Firebase feedback rows) without building SocialPost models."""
+        rows = [r for r in records if str(r.get("text") or "").strip()]
+        batch = cls([str(r.get("id") or f"row-{i}") for i, r in enumerate(rows)], [str(r["text"]).strip() for r in rows])
+        now = datetime.now(timezone.utc).timestamp()
+        for r in rows:
+            batch.authors.append(str(r.get("author") or "customer"))
+            batch.permalinks.append(r.get("permalink"))
+            batch.sources.append(str(r.get("source") or "feedback"))
+            ts = r.get("posted_at")
+            batch.posted_at.append(float(ts) if isinstance(ts, (int, float)) else now)
+            location = r.get("location")
+            if location is None and r.get("location_hint"):
+                location = {"raw": str(r["location_hint"])}
+            batch._add_location(location)
+        return batch
+
+    # --------------------------- heuristics ---------------------------
+    def _lower(self) -> tuple[str, list[int]]:
+        if self._lowered is None:
+            lowered = self.buffer.lower()
+            if len(lowered) == len(self.buffer):
+                self._lowered = (lowered, list(self.starts))
+                return self._lowered
+            # str.lower() can change lengths (e.g. "İ"); lowercase per text to rebuild offsets.
+            texts = [self.text(i).lower() for i in range(len(self))]
+            self._lowered = (_SEP.join(texts), _offsets(texts))
+        return self._lowered
+
+    def _subset(self, rows: list[int] | None) -> tuple[str, list[int], list[int]]:
+        """Lowercase buffer, offsets and buffer-position -> row map for `rows` (all rows when None)."""
+        buffer, starts = self._lower()
+        if rows is None or len(rows) == len(self):
+            return buffer, starts, list(range(len(self)))
+        ends = starts[1:] + [len(buffer) + 1]
+        texts = [buffer[starts[r]:ends[r] - 1] for r in rows]
+        return _SEP.join(texts), _offsets(texts), list(rows)
+
+    def heuristic_ratings(self, rows: list[int] | None = None) -> dict[int, int]:
+        """
+        Same rule as services._heuristic_rating for `rows` (default all): 3, +1 per
+        positive keyword and -1 per negative keyword present, clamped to 1..5.
+        """
+        from .services import NEGATIVE_KEYWORDS, POSITIVE_KEYWORDS
+
+        buffer, starts, index = self._subset(rows)
+        scores = [3] * len(index)
+        for i in _scan(buffer, starts, POSITIVE_KEYWORDS):
+            scores[i] += 1
+        for i in _scan(buffer, starts, NEGATIVE_KEYWORDS):
+            scores[i] -= 1
+        return {row: 1 if v < 1 else 5 if v > 5 else v for row, v in zip(index, scores)}
+
+    def heuristic_categories(self, rows: list[int] | None = None) -> dict[int, int]:
+        """Same rule as services._heuristic_category for `rows` (default all): first category with any keyword present."""
+        from .services import CATEGORY_KEYWORDS
+
+        buffer, starts, index = self._subset(rows)
+        codes = dict.fromkeys(index, OTHER)
+        for name, keywords in CATEGORY_KEYWORDS.items():
+            hit = set(_scan(buffer, starts, keywords))
+            if not hit:
+                continue
+            code = _CATEGORY_CODES[name]
+            for i in hit:
+                codes[index[i]] = code
+            # Later categories only need the rows still unassigned, so they scan less text.
+            keep = [i for i in range(len(index)) if i not in hit]
+            ends = starts[1:] + [len(buffer) + 1]
+            texts = [buffer[starts[i]:ends[i] - 1] for i in keep]
+            index = [index[i] for i in keep]
+            buffer, starts = _SEP.join(texts), _offsets(texts)
+            if not index:
+                break
+        return codes
+
+    def score(self, enrichments: dict[str, dict[str, Any]]) -> None:
+        """
+        Fill rating, sentiment and category from enrichment (LLM, classifier or
+        cache) where present and valid; heuristics only run for the rows that
+        still lack a rating or category. Enrichment locations only fill rows
+        that have no city.
+        """
+        need_rating: list[int] = []
+        need_category: list[int] = []
+        given_sentiment: dict[int, int] = {}
+        for row, post_id in enumerate(self.ids):
+            item = enrichments.get(post_id) or {}
+            try:
+                self.ratings[row] = max(1, min(5, int(item["rating"])))
+            except (KeyError, TypeError, ValueError):
+                need_rating.append(row)
+            category = _CATEGORY_CODES.get(item.get("category") or "")
+            if category is None:
+                need_category.append(row)
+            else:
+                self.categories[row] = category
+            sentiment = _SENTIMENT_CODES.get(item.get("sentiment") or "")
+            if sentiment is not None:
+                given_sentiment[row] = sentiment
+            if item.get("insight"):
+                self.insights[row] = str(item["insight"])
+            if item.get("solution"):
+                self.solutions[row] = str(item["solution"])
+            if item.get("location") and self.cities[row] is None:
+                self._relocated.add(row)
+                self.raw_locations[row] = str(item["location"])
+                self.states[row] = None
+                self.latitudes[row] = self.longitudes[row] = math.nan
+        if need_rating:
+            for row, rating in self.heuristic_ratings(need_rating).items():
+                self.ratings[row] = rating
+        if need_category:
+            for row, code in self.heuristic_categories(need_category).items():
+                self.categories[row] = code
+        for row, rating in enumerate(self.ratings):
+            self.sentiments[row] = given_sentiment.get(row, _sentiment_code(rating))
+
+    # --------------------------- aggregates ---------------------------
+    def csi(self, rows: list[int] | None = None) -> float:
+        """Customer satisfaction index over scored rows (see `score`), or over `rows` only."""
+        ratings = self.ratings if rows is None else [self.ratings[r] for r in rows]
+        sentiments = self.sentiments if rows is None else [self.sentiments[r] for r in rows]
+        total = len(ratings)
+        if not total:
+            return 50.0
+        positive = negative = 0
+        for rating, sentiment in zip(ratings, sentiments):
+            if sentiment == POSITIVE:
+                positive += rating
+            elif sentiment == NEGATIVE:
+                negative += 6 - rating
+        raw_score = ((positive - negative) / (total * 5)) * 100
+        return max(0.0, min(100.0, round(50 + raw_score / 2, 2)))
+
+    def tally(self, rows: list[int] | None = None) -> dict[str, int]:
+        counts = [0] * len(CATEGORIES)
+        for code in (self.categories if rows is None else [self.categories[r] for r in rows]):
+            counts[code] += 1
+        return dict(zip(CATEGORIES, counts))
+
+    def leading_category(self, rows: list[int] | None = None) -> str | None:
+        """Category of the first non-neutral row (the one carrying an issue or delight), else the first row."""
+        rows = range(len(self)) if rows is None else rows
+        if not len(rows):
+            return None
+        for row in rows:
+            if self.sentiments[row] != NEUTRAL:
+                return CATEGORIES[self.categories[row]]
+        return CATEGORIES[self.categories[rows[0]]]
+
+    # --------------------------- API edge ---------------------------
+    def _location(self, row: int) -> Location | None:
+        city, state, raw = self.cities[row], self.states[row], self.raw_locations[row]
+        lat, lng = self.latitudes[row], self.longitudes[row]
+        if city is None and state is None and raw is None and math.isnan(lat) and math.isnan(lng):
+            return None
+        return Location(
+            city=city,
+            state=state,
+            country="USA",
+            latitude=None if math.isnan(lat) else lat,
+            longitude=None if math.isnan(lng) else lng,
+            raw=raw,
+        )
+
+    def result(self, row: int, default_solution: Any = None) -> SentimentResult:
+        if default_solution is None:
+            from .services import _default_solution as default_solution
+
+        rating = self.ratings[row]
+        sentiment = SENTIMENTS[self.sentiments[row]]
+        category = CATEGORIES[self.categories[row]]
+        text = self.text(row)
+        issues: list[str] = []
+        delights: list[str] = []
+        if sentiment == "negative":
+            issues.append(self.insights.get(row) or f"Negative feedback on {category.lower()}")
+        elif sentiment == "positive":
+            delights.append(self.insights.get(row) or f"Positive note on {category.lower()}")
+        if self._posts is not None and row not in self._relocated:
+            post = self._posts[row]
+        else:
+            post = SocialPost(
+                id=self.ids[row],
+                text=text,
+                author=self.authors[row],
+                posted_at=datetime.fromtimestamp(self.posted_at[row], tz=timezone.utc),
+                location=self._location(row),
+                permalink=self.permalinks[row],
+                source=self.sources[row] or "reddit",
+            )
+        return SentimentResult(
+            post=post,
+            sentiment=sentiment,  # type: ignore[arg-type]
+            confidence=min(0.95, 0.5 + abs(rating - 3) * 0.15),
+            rating=rating,
+            solution=self.solutions.get(row) or default_solution(category, sentiment, text),
+            category=category,  # type: ignore[arg-type]
+            issues=issues,
+            delights=delights,
+        )
+
+    def results(self, rows: Iterable[int] | None = None) -> list[SentimentResult]:
+        from .services import _default_solution
+
+        return [self.result(row, _default_solution) for row in (range(len(self)) if rows is None else rows)]
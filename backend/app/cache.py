@@ -0,0 +1,421 @@
+from __future__ import annotations
+
+import abc
+import hashlib
+import json
+import logging
+import socket
+import sqlite3
+import threading
+import time
+from typing import Any
+from urllib.parse import urlparse
+
+from . import profiling
+from .config import Settings
+
+LOGGER = logging.getLogger("sentiment-cache")
+
+KEY_PREFIX = "tsa:"
+# After a backend error, reads are misses and writes are dropped for this long
+# instead of paying a connect timeout on every call.
+DOWN_COOLDOWN_S = 30.0
+
+
+def cache_key(namespace: str, *parts: Any) -> str:
+    digest = hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return f"{namespace}:{digest}"
+
+
+class CacheBackend(abc.ABC):
+    """
+    Minimal key/value interface shared by all backends. Values must be
+    JSON-serializable; `ttl_s` <= 0 means no expiry. The `a*` variants run
+    blocking backends in a thread so request handlers keep the event loop free.
+    """
+
+    name = "base"
+    # Whether calls do I/O (and so belong off the event loop).
+    blocking = True
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._down_until = 0.0
+
+    @abc.abstractmethod
+    def _get(self, key: str) -> str | None: ...
+
+    @abc.abstractmethod
+    def _set(self, key: str, value: str, ttl_s: float) -> None: ...
+
+    def _get_many(self, keys: list[str]) -> list[str | None]:
+        return [self._get(key) for key in keys]
+
+    def _set_many(self, items: list[tuple[str, str]], ttl_s: float) -> None:
+        for key, value in items:
+            self._set(key, value, ttl_s)
+
+    @abc.abstractmethod
+    def _delete(self, key: str) -> None: ...
+
+    @abc.abstractmethod
+    def _incr(self, key: str) -> int: ...
+
+    def _down(self) -> bool:
+        return time.monotonic() < self._down_until
+
+    def _failed(self, op: str, exc: Exception) -> None:
+        self._down_until = time.monotonic() + DOWN_COOLDOWN_S
+        LOGGER.warning("Cache %s failed (%s): %s; treating it as empty for %.0fs.", op, self.name, exc, DOWN_COOLDOWN_S)
+
+    def get(self, key: str) -> Any | None:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: list[str]) -> dict[str, Any]:
+        """The cached values of `keys` that are present, in one backend round trip."""
+        raws: list[str | None] = [None] * len(keys)
+        if keys and not self._down():
+            try:
+                raws = self._get_many([KEY_PREFIX + key for key in keys])
+            except Exception as exc:
+                self._failed("get", exc)
+        found: dict[str, Any] = {}
+        for key, raw in zip(keys, raws):
+            if raw is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                found[key] = json.loads(raw)
+        return found
+
+    def set(self, key: str, value: Any, ttl_s: float) -> None:
+        self.set_many({key: value}, ttl_s)
+
+    def set_many(self, values: dict[str, Any], ttl_s: float) -> None:
+        if not values or self._down():
+            return
+        try:
+            self._set_many([(KEY_PREFIX + key, json.dumps(value, default=str)) for key, value in values.items()], ttl_s)
+        except Exception as exc:
+            self._failed("set", exc)
+
+    def delete(self, key: str) -> None:
+        if self._down():
+            return
+        try:
+            self._delete(KEY_PREFIX + key)
+        except Exception as exc:
+            self._failed("delete", exc)
+
+    def incr(self, key: str) -> int | None:
+        """The incremented counter, or None when the backend is down."""
+        if self._down():
+            return None
+        try:
+            return self._incr(KEY_PREFIX + key)
+        except Exception as exc:
+            self._failed("incr", exc)
+            return None
+
+    async def _call(self, fn: Any, *args: Any) -> Any:
+        if not self.blocking:
+            return fn(*args)
+        return await profiling.to_thread(fn, *args)
+
+    async def aget(self, key: str) -> Any | None:
+        return await self._call(self.get, key)
+
+    async def aget_many(self, keys: list[str]) -> dict[str, Any]:
+        return await self._call(self.get_many, keys)
+
+    async def aset(self, key: str, value: Any, ttl_s: float) -> None:
+        await self._call(self.set, key, value, ttl_s)
+
+    async def aset_many(self, values: dict[str, Any], ttl_s: float) -> None:
+        await self._call(self.set_many, values, ttl_s)
+
+    async def aincr(self, key: str) -> int | None:
+        return await self._call(self.incr, key)
+
+    def stats(self) -> dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "backend": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "down": self._down(),
+        }
+
+
+class MemoryCache(CacheBackend):
+    """Process-local; the default, equivalent to having no shared cache."""
+
+    name = "memory"
+    blocking = False
+
+    def __init__(self, max_entries: int = 10_000) -> None:
+        super().__init__()
+        self.max_entries = max_entries
+        self._data: dict[str, tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at and expires_at < time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def _set(self, key: str, value: str, ttl_s: float) -> None:
+        with self._lock:
+            if len(self._data) >= self.max_entries and key not in self._data:
+                # Evict the oldest insertion; good enough for a fallback backend.
+                self._data.pop(next(iter(self._data)))
+            self._data[key] = (time.time() + ttl_s if ttl_s > 0 else 0.0, value)
+
+    def _delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def _incr(self, key: str) -> int:
+        with self._lock:
+            _, value = self._data.get(key, (0.0, "0"))
+            new = int(value) + 1
+            self._data[key] = (0.0, str(new))
+            return new
+
+
+class SQLiteCache(CacheBackend):
+    """Single-host cache shared by every worker through one SQLite file in WAL mode."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        self._last_sweep = 0.0
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get(self, key: str) -> str | None:
+        row = self._conn().execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at and expires_at < time.time():
+            return None
+        return value
+
+    def _set(self, key: str, value: str, ttl_s: float) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (key, value, now + ttl_s if ttl_s > 0 else 0.0),
+        )
+        if now - self._last_sweep > 60:
+            self._last_sweep = now
+            conn.execute("DELETE FROM kv WHERE expires_at > 0 AND expires_at < ?", (now,))
+
+    def _get_many(self, keys: list[str]) -> list[str | None]:
+        now = time.time()
+        found: dict[str, str] = {}
+        conn = self._conn()
+        # Stay under SQLite's bound-parameter limit.
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = conn.execute(
+                f"SELECT key, value, expires_at FROM kv WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            found.update((key, value) for key, value, expires_at in rows if not expires_at or expires_at >= now)
+        return [found.get(key) for key in keys]
+
+    def _set_many(self, items: list[tuple[str, str]], ttl_s: float) -> None:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key, value in items:
+                self._set(key, value, ttl_s)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def _incr(self, key: str) -> int:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO kv (key, value, expires_at) VALUES (?, '1', 0) "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+                (key,),
+            )
+            (value,) = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return int(value)
+
+
+class RedisCache(CacheBackend):
+    """
+    Speaks RESP2 directly over a socket (MGET/SET PX/DEL/INCR), so any
+    Redis-compatible server or local stand-in works without extra dependencies.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, timeout_s: float = 1.0) -> None:
+        super().__init__()
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout_s = timeout_s
+        self._local = threading.local()
+
+    def _connect(self) -> tuple[socket.socket, Any]:
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout_s)
+        reader = sock.makefile("rb")
+        self._local.conn = (sock, reader)
+        if self.password:
+            self._roundtrip("AUTH", self.password)
+        if self.db:
+            self._roundtrip("SELECT", str(self.db))
+        return sock, reader
+
+    @staticmethod
+    def _encode(*args: str) -> bytes:
+        out = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg.encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    @staticmethod
+    def _read(reader: Any) -> Any:
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("connection closed")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RuntimeError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            return [RedisCache._read(reader) for _ in range(int(body))]
+        raise RuntimeError(f"unexpected RESP reply {line!r}")
+
+    def _roundtrip(self, *args: str) -> Any:
+        return self._pipeline([args])[0]
+
+    def _pipeline(self, commands: list[tuple[str, ...]]) -> list[Any]:
+        """Send every command in one write, then read the replies in order."""
+        sock, reader = self._local.conn
+        sock.sendall(b"".join(self._encode(*args) for args in commands))
+        return [self._read(reader) for _ in commands]
+
+    def _close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn[0].close()
+            except OSError:
+                pass
+
+    def _commands(self, commands: list[tuple[str, ...]]) -> list[Any]:
+        for attempt in range(2):
+            try:
+                # Connecting is inside the retry: a refused or timed-out connect is a failure like any other.
+                if getattr(self._local, "conn", None) is None:
+                    self._connect()
+                return self._pipeline(commands)
+            except (OSError, ConnectionError):
+                self._close()
+                if attempt:
+                    raise
+            except Exception:
+                # An error reply can leave later replies of the pipeline unread.
+                self._close()
+                raise
+        return []
+
+    def _command(self, *args: str) -> Any:
+        return self._commands([args])[0]
+
+    def _get(self, key: str) -> str | None:
+        return self._command("GET", key)
+
+    def _get_many(self, keys: list[str]) -> list[str | None]:
+        return self._command("MGET", *keys)
+
+    def _set_many(self, items: list[tuple[str, str]], ttl_s: float) -> None:
+        expiry = ("PX", str(int(ttl_s * 1000))) if ttl_s > 0 else ()
+        self._commands([("SET", key, value, *expiry) for key, value in items])
+
+    def _set(self, key: str, value: str, ttl_s: float) -> None:
+        self._set_many([(key, value)], ttl_s)
+
+    def _delete(self, key: str) -> None:
+        self._command("DEL", key)
+
+    def _incr(self, key: str) -> int:
+        return int(self._command("INCR", key))
+
+
+_CACHE: CacheBackend | None = None
+_CACHE_CONFIG: tuple[str, str | None] | None = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache(settings: Settings) -> CacheBackend:
+    global _CACHE, _CACHE_CONFIG
+    config = (settings.CACHE_BACKEND, settings.CACHE_URL)
+    with _CACHE_LOCK:
+        if _CACHE is None or _CACHE_CONFIG != config:
+            backend = settings.CACHE_BACKEND.lower()
+            try:
+                if backend == "sqlite":
+                    _CACHE = SQLiteCache(settings.CACHE_URL or "cache.sqlite3")
+                elif backend == "redis":
+                    _CACHE = RedisCache(settings.CACHE_URL or "redis://localhost:6379/0")
+                else:
+                    _CACHE = MemoryCache()
+            except Exception as exc:
+                LOGGER.warning("Cache backend %s unavailable (%s); using in-process memory.", backend, exc)
+                _CACHE = MemoryCache()
+            _CACHE_CONFIG = config
+            LOGGER.info("Using %s cache backend.", _CACHE.name)
+        return _CACHE
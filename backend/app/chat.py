@@ -0,0 +1,290 @@
+"""
+Server-side JOY chat sessions.
+
+The client sends only its newest message and a session id. Each prompt is the
+fixed system prompt, a rolling summary of older turns and the last
+CHAT_HISTORY_TURNS exchanges, trimmed to CHAT_PROMPT_TOKENS, so a turn costs
+about the same however long the conversation has run. Exchanges that fall out
+of the window are folded into the summary off the request path.
+
+Sessions live in a process-local LRU; with CHAT_SESSION_DB set they are also
+written to a SQLite file (WAL, like app/cache.py) so they survive restarts and
+are shared by the workers on one host. Every open then reads the row, and a
+copy another worker updated more recently replaces the local one.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any
+
+from . import llm, profiling, prompts
+from .config import Settings
+
+LOGGER = logging.getLogger("sentiment-chat")
+
+_SESSION_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s")
+# Per-line budget when old exchanges are summarized without the LLM.
+_EXTRACT_TOKENS = 40
+_SUMMARY_PROMPT = (
+    "You maintain the running summary of a support chat between a T‑Mobile customer and JOY. "
+    "Merge the new exchanges into the summary. Keep the customer's devices, plan, account details, "
+    "reported problems and what JOY already told them to try. Plain sentences, no greeting, "
+    "at most {words} words."
+)
+
+
+class ChatSession:
+    __slots__ = ("id", "summary", "turns", "pending", "updated_at", "lock", "folding")
+
+    def __init__(self, session_id: str, summary: str = "", turns: list[dict[str, str]] | None = None,
+                 pending: list[dict[str, str]] | None = None, updated_at: float | None = None) -> None:
+        self.id = session_id
+        self.summary = summary
+        # Recent messages, oldest first: {"role": "user"|"assistant", "content": ...}.
+        self.turns = turns or []
+        # Messages that left the window but are not folded into the summary yet.
+        self.pending = pending or []
+        self.updated_at = updated_at or time.time()
+        # Serializes turns of one session; a second tab waits instead of interleaving.
+        self.lock = asyncio.Lock()
+        self.folding = False
+
+    @property
+    def is_new(self) -> bool:
+        return not (self.turns or self.pending or self.summary)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"summary": self.summary, "turns": self.turns, "pending": self.pending, "updated_at": self.updated_at}
+
+    @classmethod
+    def from_dict(cls, session_id: str, data: dict[str, Any]) -> "ChatSession":
+        return cls(session_id, data.get("summary") or "", data.get("turns") or [], data.get("pending") or [],
+                   data.get("updated_at"))
+
+    def adopt(self, other: "ChatSession") -> None:
+        """Take over the conversation state of a newer copy, keeping this object's lock."""
+        self.summary = other.summary
+        self.turns = other.turns
+        self.pending = other.pending
+        self.updated_at = other.updated_at
+
+
+class SessionStore:
+    """LRU of live sessions, optionally backed by a SQLite table of serialized sessions."""
+
+    def __init__(self, max_sessions: int, ttl_s: float, db_path: str | None = None) -> None:
+        self.max_sessions = max(1, max_sessions)
+        self.ttl_s = ttl_s
+        self.db_path = db_path
+        self._sessions: OrderedDict[str, ChatSession] = OrderedDict()
+        self._local = threading.local()
+        self._last_sweep = 0.0
+        if db_path:
+            conn = self._conn()
+            conn.execute("CREATE TABLE IF NOT EXISTS chat_sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _expired(self, updated_at: float) -> bool:
+        return self.ttl_s > 0 and updated_at < time.time() - self.ttl_s
+
+    def _remember(self, session: ChatSession) -> None:
+        self._sessions[session.id] = session
+        self._sessions.move_to_end(session.id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def _read(self, session_id: str) -> ChatSession | None:
+        if not self.db_path:
+            return None
+        try:
+            row = self._conn().execute("SELECT data FROM chat_sessions WHERE id = ?", (session_id,)).fetchone()
+        except sqlite3.Error as exc:
+            LOGGER.warning("Chat session read failed: %s", exc)
+            return None
+        return ChatSession.from_dict(session_id, json.loads(row[0])) if row else None
+
+    async def open(self, session_id: str | None) -> ChatSession:
+        """
+        The session for `session_id`, or a new one when it is unknown or expired.
+        With a database the row is read in a thread and wins over the LRU copy
+        when it is newer, i.e. the last turn was served by another worker.
+        """
+        if session_id and _SESSION_ID_RE.match(session_id):
+            session = self._sessions.get(session_id)
+            stored = await profiling.to_thread(self._read, session_id) if self.db_path else None
+            if session is None:
+                session = stored
+            elif stored is not None and stored.updated_at > session.updated_at:
+                # A turn or fold in this process owns the local copy until it finishes.
+                if not (session.lock.locked() or session.folding):
+                    session.adopt(stored)
+            if session is not None and not self._expired(session.updated_at):
+                self._remember(session)
+                return session
+            self._sessions.pop(session_id, None)
+        session = ChatSession(uuid.uuid4().hex)
+        self._remember(session)
+        return session
+
+    def save(self, session: ChatSession) -> None:
+        """Write the session to SQLite; blocking, so callers run it in a thread."""
+        if not self.db_path:
+            return
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT INTO chat_sessions (id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (session.id, json.dumps(session.to_dict()), session.updated_at),
+            )
+            if self.ttl_s > 0 and now - self._last_sweep > 300:
+                self._last_sweep = now
+                conn.execute("DELETE FROM chat_sessions WHERE updated_at < ?", (now - self.ttl_s,))
+        except sqlite3.Error as exc:
+            LOGGER.warning("Chat session write failed: %s", exc)
+
+    def stats(self) -> dict[str, Any]:
+        return {"live_sessions": len(self._sessions), "max_sessions": self.max_sessions, "persistent": bool(self.db_path)}
+
+
+_STORE: SessionStore | None = None
+_BACKGROUND: set[asyncio.Task] = set()
+
+
+def get_store(settings: Settings) -> SessionStore | None:
+    global _STORE
+    if not settings.CHAT_SESSIONS_ENABLED:
+        return None
+    if _STORE is None:
+        _STORE = SessionStore(settings.CHAT_MAX_SESSIONS, settings.CHAT_SESSION_TTL_S, settings.CHAT_SESSION_DB)
+    return _STORE
+
+
+# --------------------------- prompt assembly ---------------------------
+
+
+def _extract(messages: list[dict[str, str]]) -> str:
+    """One short line per message: the first sentence, clipped. Used until the LLM summary catches up."""
+    lines = []
+    for m in messages:
+        text = prompts.compact_text(m.get("content") or "")
+        first = _SENTENCE_RE.split(text, maxsplit=1)[0]
+        who = "Customer" if m.get("role") == "user" else "JOY"
+        lines.append(f"{who}: {prompts.clip_tokens(first, _EXTRACT_TOKENS)}")
+    return "\n".join(lines)
+
+
+def _tail_tokens(text: str, max_tokens: int) -> str:
+    """Keep the newest end of `text` within max_tokens (prompts.clip_tokens keeps the start)."""
+    if max_tokens <= 0 or prompts.estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[-max_tokens * 4:]
+    newline = cut.find("\n")
+    if 0 <= newline < len(cut) // 2:
+        cut = cut[newline + 1:]
+    return "…" + cut
+
+
+def build_messages(system: str, session: ChatSession, message: str, settings: Settings) -> list[dict[str, str]]:
+    """
+    System prompt, the summary of older turns, as many recent exchanges as fit
+    in CHAT_PROMPT_TOKENS (newest kept first) and the new message.
+    """
+    head = [{"role": "system", "content": system}]
+    earlier = "\n".join(p for p in (session.summary, _extract(session.pending)) if p)
+    if earlier:
+        earlier = _tail_tokens(earlier, settings.CHAT_SUMMARY_TOKENS)
+        head.append({"role": "system", "content": f"Earlier in this conversation:\n{earlier}"})
+    budget = settings.CHAT_PROMPT_TOKENS - prompts.estimate_message_tokens(head)
+    user = {"role": "user", "content": prompts.clip_tokens(message, max(settings.CHAT_TURN_TOKENS, budget // 2))}
+    budget -= prompts.estimate_message_tokens([user])
+    recent: list[dict[str, str]] = []
+    for m in reversed(session.turns):
+        clipped = {"role": m["role"], "content": prompts.clip_tokens(m["content"], settings.CHAT_TURN_TOKENS)}
+        cost = prompts.estimate_message_tokens([clipped])
+        if cost > budget:
+            break
+        recent.append(clipped)
+        budget -= cost
+    recent.reverse()
+    # Never open the window on a dangling assistant reply.
+    if recent and recent[0]["role"] == "assistant":
+        recent = recent[1:]
+    return head + recent + [user]
+
+
+# --------------------------- rolling summary ---------------------------
+
+
+async def _summarize(summary: str, messages: list[dict[str, str]], settings: Settings) -> str:
+    words = max(30, settings.CHAT_SUMMARY_TOKENS * 3 // 4)
+    transcript = "\n".join(
+        f"{'Customer' if m['role'] == 'user' else 'JOY'}: {prompts.clip_tokens(prompts.compact_text(m['content']), settings.CHAT_TURN_TOKENS)}"
+        for m in messages
+    )
+    completion = await llm.chat_completion(
+        [
+            {"role": "system", "content": _SUMMARY_PROMPT.format(words=words)},
+            {"role": "user", "content": f"Summary so far:\n{summary or '(none)'}\n\nNew exchanges:\n{transcript}"},
+        ],
+        settings,
+        operation="chat_summary",
+        budget_s=settings.LLM_CHAT_BUDGET_S,
+        prefer="openrouter",
+        temperature=0.1,
+        max_tokens=settings.CHAT_SUMMARY_TOKENS,
+    )
+    text = (completion.choices[0].message.content or "").strip() if completion is not None and completion.choices else ""
+    if not text:
+        # Outage or spent budget: keep a compact transcript instead of losing the turns.
+        text = "\n".join(p for p in (summary, _extract(messages)) if p)
+    return _tail_tokens(text, settings.CHAT_SUMMARY_TOKENS)
+
+
+async def _fold(store: SessionStore, session: ChatSession, settings: Settings) -> None:
+    try:
+        batch = list(session.pending)
+        session.summary = await _summarize(session.summary, batch, settings)
+        # Turns that overflowed meanwhile stay pending for the next fold.
+        del session.pending[: len(batch)]
+        await profiling.to_thread(store.save, session)
+    except Exception as exc:  # the extractive lines still cover the pending turns
+        LOGGER.warning("Chat summary for %s failed: %s", session.id, exc)
+    finally:
+        session.folding = False
+
+
+async def record_turn(store: SessionStore, session: ChatSession, message: str, reply: str, settings: Settings) -> None:
+    """Append an exchange, move overflow to the summary queue and persist."""
+    session.turns.append({"role": "user", "content": message})
+    session.turns.append({"role": "assistant", "content": reply})
+    session.updated_at = time.time()
+    keep = max(1, settings.CHAT_HISTORY_TURNS) * 2
+    if len(session.turns) > keep:
+        session.pending.extend(session.turns[:-keep])
+        del session.turns[:-keep]
+    await profiling.to_thread(store.save, session)
+    # Fold a few exchanges per summary call; the extractive lines cover them meanwhile.
+    if len(session.pending) >= max(2, keep // 2) and not session.folding:
+        session.folding = True
+        task = asyncio.get_running_loop().create_task(_fold(store, session, settings))
+        _BACKGROUND.add(task)
+        task.add_done_callback(_BACKGROUND.discard)
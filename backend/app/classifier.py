@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import re
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from typing import Any, Iterable
+
+LOGGER = logging.getLogger("sentiment-classifier")
+
+MAGIC = b"TSC1"
+DEFAULT_FEATURES = 1 << 18
+CATEGORIES = [
+    "Network Coverage",
+    "Customer Service",
+    "Billing",
+    "Pricing & Plans",
+    "Device and Equipment",
+    "Store Experience",
+    "Mobile App",
+    "Other",
+]
+RATINGS = ["1", "2", "3", "4", "5"]
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9'&+-]*")
+
+
+def featurize(text: str, n_features: int) -> list[int]:
+    """Hashed word unigrams + bigrams (crc32, stable across processes)."""
+    tokens = _TOKEN_RE.findall(text.lower())
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    return list({zlib.crc32(g.encode("utf-8")) % n_features for g in grams})
+
+
+def _softmax(scores: list[float]) -> list[float]:
+    top = max(scores)
+    exps = [math.exp(s - top) for s in scores]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+class _Head:
+    """Multinomial logistic regression over hashed features, stored sparsely."""
+
+    def __init__(self, labels: list[str]) -> None:
+        self.labels = labels
+        self.weights: dict[int, list[float]] = {}
+        self.bias = [0.0] * len(labels)
+
+    def scores(self, feats: list[int]) -> list[float]:
+        out = list(self.bias)
+        k = len(out)
+        for f in feats:
+            w = self.weights.get(f)
+            if w is not None:
+                for i in range(k):
+                    out[i] += w[i]
+        return out
+
+    def predict(self, feats: list[int]) -> tuple[str, float]:
+        probs = _softmax(self.scores(feats))
+        best = max(range(len(probs)), key=probs.__getitem__)
+        return self.labels[best], probs[best]
+
+    def sgd_step(self, feats: list[int], target: int, lr: float, l2: float) -> None:
+        probs = _softmax(self.scores(feats))
+        k = len(probs)
+        grads = [probs[i] - (1.0 if i == target else 0.0) for i in range(k)]
+        for i in range(k):
+            self.bias[i] -= lr * grads[i]
+        for f in feats:
+            w = self.weights.get(f)
+            if w is None:
+                w = self.weights[f] = [0.0] * k
+            for i in range(k):
+                w[i] -= lr * (grads[i] + l2 * w[i])
+
+    def to_bytes(self) -> bytes:
+        idx = array("I", sorted(self.weights))
+        vals = array("f", [v for f in idx for v in self.weights[f]])
+        bias = array("f", self.bias)
+        return struct.pack("<I", len(idx)) + idx.tobytes() + bias.tobytes() + vals.tobytes()
+
+    @classmethod
+    def from_bytes(cls, labels: list[str], blob: memoryview) -> tuple["_Head", int]:
+        head = cls(labels)
+        k = len(labels)
+        (n,) = struct.unpack_from("<I", blob, 0)
+        off = 4
+        idx = array("I")
+        idx.frombytes(blob[off : off + 4 * n])
+        off += 4 * n
+        bias = array("f")
+        bias.frombytes(blob[off : off + 4 * k])
+        off += 4 * k
+        vals = array("f")
+        vals.frombytes(blob[off : off + 4 * n * k])
+        off += 4 * n * k
+        head.bias = list(bias)
+        head.weights = {f: list(vals[j * k : (j + 1) * k]) for j, f in enumerate(idx)}
+        return head, off
+
+
+class LocalClassifier:
+    """Predicts (category, rating) for a post with a softmax confidence for each."""
+
+    def __init__(self, n_features: int = DEFAULT_FEATURES) -> None:
+        self.n_features = n_features
+        self.category = _Head(CATEGORIES)
+        self.rating = _Head(RATINGS)
+
+    def predict(self, text: str) -> dict[str, Any]:
+        feats = featurize(text, self.n_features)
+        category, cat_conf = self.category.predict(feats)
+        rating, rating_conf = self.rating.predict(feats)
+        return {
+            "category": category,
+            "rating": int(rating),
+            "confidence": min(cat_conf, rating_conf),
+        }
+
+    def fit(self, examples: list[dict[str, Any]], epochs: int = 5, lr: float = 0.2, l2: float = 1e-6, seed: int = 7) -> None:
+        rng = random.Random(seed)
+        rows = [
+            (featurize(ex["text"], self.n_features), CATEGORIES.index(ex["category"]), RATINGS.index(str(ex["rating"])))
+            for ex in examples
+        ]
+        for epoch in range(epochs):
+            rng.shuffle(rows)
+            step = lr / (1 + epoch)
+            for feats, cat, rating in rows:
+                self.category.sgd_step(feats, cat, step, l2)
+                self.rating.sgd_step(feats, rating, step, l2)
+
+    # --------------------------- On-disk format ---------------------------
+    # MAGIC | u32 header length | JSON header | zlib(category head | rating head)
+    # Each head: u32 n | n u32 feature ids | k f32 bias | n*k f32 weights.
+    def save(self, path: str) -> None:
+        header = json.dumps({"n_features": self.n_features, "categories": CATEGORIES, "ratings": RATINGS}).encode("utf-8")
+        body = zlib.compress(self.category.to_bytes() + self.rating.to_bytes(), 9)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(MAGIC + struct.pack("<I", len(header)) + header + body)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LocalClassifier":
+        with open(path, "rb") as fh:
+            data = fh.read()
+        if data[:4] != MAGIC:
+            raise ValueError(f"{path} is not a classifier model")
+        (hlen,) = struct.unpack_from("<I", data, 4)
+        header = json.loads(data[8 : 8 + hlen])
+        model = cls(header["n_features"])
+        blob = memoryview(zlib.decompress(data[8 + hlen :]))
+        model.category, off = _Head.from_bytes(header["categories"], blob)
+        model.rating, _ = _Head.from_bytes(header["ratings"], blob[off:])
+        return model
+
+
+_MODEL_CACHE: dict[str, tuple[float, LocalClassifier]] = {}
+_MODEL_LOCK = threading.Lock()
+
+
+def get_model(path: str | None) -> LocalClassifier | None:
+    """Load (and reload on change) the model at `path`; None when absent or unreadable."""
+    if not path:
+        return None
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _MODEL_LOCK:
+        cached = _MODEL_CACHE.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            model = LocalClassifier.load(path)
+        except (OSError, ValueError, zlib.error, KeyError) as exc:
+            LOGGER.warning("Failed to load classifier model %s: %s", path, exc)
+            return None
+        _MODEL_CACHE[path] = (mtime, model)
+        LOGGER.info("Loaded local classifier from %s", path)
+        return model
+
+
+def log_training_examples(path: str, examples: Iterable[dict[str, Any]]) -> None:
+    """Append LLM-labelled examples (text, category, rating) for later training."""
+    lines = [json.dumps(ex, ensure_ascii=False) + "\n" for ex in examples]
+    if not lines:
+        return
+    with open(path, "a", encoding="utf-8") as fh:
+        fh.writelines(lines)
+
+
+def _read_examples(path: str) -> list[dict[str, Any]]:
+    examples: list[dict[str, Any]] = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                ex = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if ex.get("text") and ex.get("category") in CATEGORIES and str(ex.get("rating")) in RATINGS:
+                examples.append(ex)
+    # The same post can be enriched many times; keep the latest label per text.
+    return list({ex["text"]: ex for ex in examples}.values())
+
+
+def _evaluate(model: LocalClassifier, examples: list[dict[str, Any]], threshold: float) -> dict[str, float]:
+    if not examples:
+        return {"examples": 0}
+    confident = cat_ok = rating_ok = conf_ok = 0
+    for ex in examples:
+        pred = model.predict(ex["text"])
+        good = pred["category"] == ex["category"] and pred["rating"] == int(ex["rating"])
+        cat_ok += pred["category"] == ex["category"]
+        rating_ok += pred["rating"] == int(ex["rating"])
+        if pred["confidence"] >= threshold:
+            confident += 1
+            conf_ok += good
+    n = len(examples)
+    return {
+        "examples": n,
+        "category_accuracy": round(cat_ok / n, 3),
+        "rating_accuracy": round(rating_ok / n, 3),
+        "coverage_at_threshold": round(confident / n, 3),
+        "accuracy_when_confident": round(conf_ok / confident, 3) if confident else 0.0,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Train/evaluate the local post classifier.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    train = sub.add_parser("train", help="Train from an enrichment log and write the model file.")
+    train.add_argument("--data", required=True, help="JSONL written via CLASSIFIER_TRAINING_LOG")
+    train.add_argument("--out", required=True)
+    train.add_argument("--epochs", type=int, default=5)
+    train.add_argument("--features", type=int, default=DEFAULT_FEATURES)
+    train.add_argument("--holdout", type=float, default=0.1)
+    train.add_argument("--threshold", type=float, default=0.7)
+    evaluate = sub.add_parser("evaluate", help="Report accuracy and confident coverage on a labelled file.")
+    evaluate.add_argument("--model", required=True)
+    evaluate.add_argument("--data", required=True)
+    evaluate.add_argument("--threshold", type=float, default=0.7)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "train":
+        examples = _read_examples(args.data)
+        if not examples:
+            print("no usable examples", file=sys.stderr)
+            return 1
+        random.Random(13).shuffle(examples)
+        cut = int(len(examples) * (1 - args.holdout))
+        model = LocalClassifier(args.features)
+        model.fit(examples[:cut], epochs=args.epochs)
+        model.save(args.out)
+        print(json.dumps({"trained_on": cut, "model_bytes": os.path.getsize(args.out), "holdout": _evaluate(model, examples[cut:], args.threshold)}))
+        return 0
+
+    model = LocalClassifier.load(args.model)
+    print(json.dumps(_evaluate(model, _read_examples(args.data), args.threshold)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
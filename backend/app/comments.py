@@ -0,0 +1,104 @@
+"""
+Reddit comment expansion for search results.
+
+Outage threads carry most of their signal ("down in Plano too", "no LTE since
+noon on I-35") in the comments. For the top submissions of a search this
+fetches each comment tree once, at most REDDIT_COMMENTS_DEPTH levels deep and
+REDDIT_COMMENTS_PER_THREAD comments per thread. Fetches share one
+process-wide concurrency cap, and the whole stage gives up after
+REDDIT_COMMENTS_BUDGET_S, keeping whatever threads arrived by then.
+services.py turns the relevant comments into SocialPosts.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any
+
+import httpx
+
+from . import tracing
+from .config import Settings
+
+LOGGER = logging.getLogger("sentiment-comments")
+
+SKIP_AUTHORS = frozenset({"AutoModerator", "[deleted]"})
+SKIP_BODIES = frozenset({"[deleted]", "[removed]"})
+
+_SEMAPHORE: asyncio.Semaphore | None = None
+
+
+def _semaphore(settings: Settings) -> asyncio.Semaphore:
+    # Shared by every request in the process so a burst of /analyze calls cannot
+    # multiply the fan-out against Reddit's rate limit.
+    global _SEMAPHORE
+    if _SEMAPHORE is None:
+        _SEMAPHORE = asyncio.Semaphore(max(1, settings.REDDIT_COMMENTS_CONCURRENCY))
+    return _SEMAPHORE
+
+
+def flatten(listing: Any, max_depth: int, max_comments: int) -> list[dict[str, Any]]:
+    """
+    Comment nodes of a /comments response, breadth-first (top-level replies
+    first), at most `max_depth` levels and `max_comments` comments. "Load more"
+    stubs and deleted or bot comments are skipped.
+    """
+    if not isinstance(listing, list) or len(listing) < 2:
+        return []
+    queue: deque[tuple[dict[str, Any], int]] = deque(
+        (child, 1) for child in (listing[1].get("data") or {}).get("children") or []
+    )
+    out: list[dict[str, Any]] = []
+    while queue and len(out) < max_comments:
+        child, depth = queue.popleft()
+        if child.get("kind") != "t1":
+            continue
+        node = child.get("data") or {}
+        body = (node.get("body") or "").strip()
+        if body and body not in SKIP_BODIES and node.get("author") not in SKIP_AUTHORS:
+            out.append(node)
+        replies = node.get("replies")
+        if depth < max_depth and isinstance(replies, dict):
+            queue.extend((reply, depth + 1) for reply in (replies.get("data") or {}).get("children") or [])
+    return out
+
+
+async def fetch_threads(
+    client: httpx.AsyncClient, headers: dict[str, str], submission_ids: list[str], settings: Settings
+) -> dict[str, list[dict[str, Any]]]:
+    """submission id -> flattened comment nodes, for the threads fetched within the budget."""
+    depth = max(1, settings.REDDIT_COMMENTS_DEPTH)
+    per_thread = max(1, settings.REDDIT_COMMENTS_PER_THREAD)
+    sem = _semaphore(settings)
+
+    async def fetch(submission_id: str) -> tuple[str, list[dict[str, Any]]]:
+        async with sem:
+            with tracing.span("reddit.comments", submission=submission_id) as sp:
+                resp = await client.get(
+                    f"/comments/{submission_id}",
+                    # Ask for a little more than we keep: stubs and deleted comments are dropped.
+                    params={"depth": depth, "limit": per_thread * 2, "sort": "top", "raw_json": 1},
+                    headers=headers,
+                )
+                sp.set(status_code=resp.status_code)
+                resp.raise_for_status()
+                return submission_id, flatten(resp.json(), depth, per_thread)
+
+    tasks = [asyncio.create_task(fetch(sid)) for sid in dict.fromkeys(submission_ids)]
+    if not tasks:
+        return {}
+    done, pending = await asyncio.wait(tasks, timeout=settings.REDDIT_COMMENTS_BUDGET_S)
+    for task in pending:
+        task.cancel()
+    if pending:
+        LOGGER.info("Comment budget of %.1fs spent; skipped %s of %s threads.", settings.REDDIT_COMMENTS_BUDGET_S, len(pending), len(tasks))
+    threads: dict[str, list[dict[str, Any]]] = {}
+    for task in done:
+        exc = task.exception()
+        if exc is not None:
+            LOGGER.warning("Reddit comment fetch failed: %s", exc)
+            continue
+        submission_id, nodes = task.result()
+        threads[submission_id] = nodes
+    return threads
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import zlib
+from typing import Any
+
+try:  # optional: brotli is only offered when the package is installed
+    import brotli
+except ImportError:  # pragma: no cover - depends on environment
+    brotli = None  # type: ignore[assignment]
+
+# Already-compressed or incremental formats that must not be buffered or re-encoded.
+SKIP_TYPES = ("text/event-stream", "image/", "video/", "audio/", "application/zip", "application/gzip", "application/vnd.apache.parquet")
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Pick br or gzip from Accept-Encoding, honoring q=0; br wins ties when available."""
+    offered: dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip()] = q
+    star = offered.get("*", 0.0)
+    best, best_q = None, 0.0
+    for name in ("br", "gzip") if brotli is not None else ("gzip",):
+        q = offered.get(name, star)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class _Encoder:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int) -> None:
+        self.encoding = encoding
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._gz = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        # Flush per chunk so streamed bodies (exports, long lists) stay incremental.
+        if self.encoding == "br":
+            return self._br.process(data) + self._br.flush()
+        return self._gz.compress(data) + self._gz.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._br.process(data) + self._br.finish()
+        return self._gz.compress(data) + self._gz.flush()
+
+
+class CompressionMiddleware:
+    """
+    Negotiated gzip/brotli for responses of at least `minimum_size` bytes.
+
+    Bodies that end below the threshold pass through untouched; larger or
+    streamed bodies are compressed chunk by chunk. Server-sent events, bodies that
+    already carry a Content-Encoding and 204/304 responses are never touched.
+    """
+
+    def __init__(self, app: Any, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: dict[str, Any] | None = None
+        encoder: _Encoder | None = None
+        passthrough = False
+        pending: list[bytes] = []
+
+        async def send_wrapper(message: dict[str, Any]) -> None:
+            nonlocal start, encoder, passthrough
+            if message["type"] == "http.response.start":
+                headers = {k.lower(): v for k, v in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                passthrough = (
+                    message["status"] in (204, 304)
+                    or b"content-encoding" in headers
+                    or any(content_type.startswith(t) for t in SKIP_TYPES)
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if start is not None:
+                # Buffer until the threshold is reached or the body ends; app
+                # middlewares often deliver even tiny bodies in several chunks.
+                pending.append(body)
+                size = sum(len(b) for b in pending)
+                if more and size < self.minimum_size:
+                    return
+                first, start = start, None
+                body = b"".join(pending)
+                pending.clear()
+                if not more and size < self.minimum_size:
+                    passthrough = True
+                    await send(first)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                encoder = _Encoder(encoding, self.gzip_level, self.brotli_quality)
+                vary = [v for k, v in first.get("headers", []) if k.lower() == b"vary"]
+                headers = [(k, v) for k, v in first.get("headers", []) if k.lower() not in (b"content-length", b"vary")]
+                headers += [
+                    (b"content-encoding", encoding.encode()),
+                    (b"vary", b", ".join([*vary, b"Accept-Encoding"])),
+                ]
+                if not more:
+                    payload = encoder.finish(body)
+                    headers.append((b"content-length", str(len(payload)).encode()))
+                    await send({**first, "headers": headers})
+                    await send({"type": "http.response.body", "body": payload})
+                    return
+                await send({**first, "headers": headers})
+            assert encoder is not None
+            payload = encoder.chunk(body) if more else encoder.finish(body)
+            await send({"type": "http.response.body", "body": payload, "more_body": more})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import uuid
+from typing import Any
+
+from fastapi import Request, Response
+
+from .cache import get_cache
+from .config import Settings
+
+# Revalidate on every use: browsers send If-None-Match and get a body-less 304
+# when nothing changed, instead of reusing a possibly stale copy.
+CACHE_CONTROL = "no-cache"
+
+
+def _digest(*parts: Any) -> str:
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:12]
+
+
+async def bump(settings: Settings, namespace: str) -> None:
+    """Invalidate every ETag derived from `namespace`; call after writes that change it."""
+    # A failed or skipped bump (backend down) only costs a stale 304 window; the
+    # cache logs it and never fails the write.
+    await get_cache(settings).aincr(f"version:{namespace}")
+
+
+async def version_etag(settings: Settings, namespace: str, *parts: Any) -> str | None:
+    """
+    Weak ETag from the namespace's write counter plus the request parameters,
+    or None unless the cache is shared by every writer. A per-process counter
+    misses bumps from other workers, backfill and the console, and restarts at
+    zero, so it could answer 304 for a list that changed.
+    """
+    cache = get_cache(settings)
+    if cache.name != "redis":
+        return None
+    current = await cache.aget(f"version:{namespace}")
+    if current is None:
+        # Never bumped, or Redis unreachable: a guessed 0 could match a stale tag.
+        return None
+    return f'W/"{namespace}-{current}-{_digest(*parts)}"'
+
+
+def data_etag(namespace: str, *parts: Any) -> str:
+    """Weak ETag from what a handler actually read, e.g. the records it returns."""
+    return f'W/"{namespace}-{_digest(*parts)}"'
+
+
+async def stamp_cached(settings: Settings, cache_key: str, ttl_s: float) -> None:
+    """Give a freshly cached response a new ETag that lives exactly as long as the entry."""
+    await get_cache(settings).aset(f"etag:{cache_key}", f'W/"{uuid.uuid4().hex[:16]}"', ttl_s)
+
+
+async def cached_etag(settings: Settings, cache_key: str) -> str | None:
+    return await get_cache(settings).aget(f"etag:{cache_key}")
+
+
+def not_modified(request: Request, etag: str | None) -> bool:
+    if not etag:
+        return False
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison (RFC 9110 13.1.2): compression must not break revalidation.
+    wanted = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == wanted for tag in header.split(","))
+
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: str | None) -> None:
+    if etag:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = CACHE_CONTROL
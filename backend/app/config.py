@@ -49,6 +49,213 @@ class Settings(BaseSettings):
     FIREBASE_STORE: str = "realtime"  # or "firestore"
     FIREBASE_DATABASE_URL: Optional[str] = None
 
+    # Tracing: fraction of requests traced (0 disables). Spans go to the OTLP
+    # endpoint when set (e.g. http://localhost:4318/v1/traces), else to a JSONL file.
+    TRACE_SAMPLE_RATE: float = 0.0
+    TRACE_EXPORT_PATH: str = "traces.jsonl"
+    TRACE_OTLP_ENDPOINT: Optional[str] = None
+
+    # On-demand profiling. A request to one of PROFILE_ROUTES is profiled when it
+    # carries X-Profile-Token == PROFILE_ADMIN_TOKEN, or at PROFILE_SAMPLE_RATE.
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_ADMIN_TOKEN: Optional[str] = None
+    PROFILE_ROUTES: str = "/analyze,/feedback/analyses"
+    PROFILE_INTERVAL_MS: float = 5.0
+    PROFILE_FORMAT: str = "speedscope"  # or "collapsed"
+    PROFILE_OUTPUT_DIR: str = "profiles"
+
+    # Startup: import/initialize the SDKs this deployment uses during lifespan
+    # startup instead of inside the first request. Warn when warm-up exceeds budget.
+    STARTUP_PREWARM: bool = True
+    STARTUP_BUDGET_MS: int = 3000
+
+    # Build response models without re-validation and serialize with orjson
+    # (see app/responses.py). Only affects routes whose payloads we produce ourselves.
+    FAST_RESPONSES: bool = False
+
+    # LLM routing (app/llm.py): providers are tried in LLM_PROVIDER_ORDER, each
+    # behind its own circuit breaker. LLM_LOCAL_* adds any OpenAI-compatible server.
+    LLM_PROVIDER_ORDER: str = "nemotron,openrouter,local"
+    LLM_LOCAL_BASE_URL: Optional[str] = None
+    LLM_LOCAL_MODEL: Optional[str] = None
+    LLM_LOCAL_API_KEY: Optional[str] = None
+    LLM_ENRICH_BUDGET_S: float = 20.0
+    LLM_FEEDBACK_BUDGET_S: float = 30.0
+    LLM_CHAT_BUDGET_S: float = 30.0
+    LLM_BREAKER_FAILURES: int = 3
+    LLM_BREAKER_RESET_S: float = 30.0
+    LLM_HEDGE_ENABLED: bool = False
+    # Stream enrichment output and build entries per item while generation runs.
+    LLM_STREAMING: bool = False
+    # Per-operation daily token caps, e.g. "enrich=2000000,chat=500000"; once spent,
+    # calls for that operation degrade like an LLM outage until UTC midnight.
+    LLM_DAILY_TOKEN_BUDGETS: str = ""
+    # Prompt compaction (app/prompts.py): estimated-token budgets per post and per
+    # enrichment request.
+    PROMPT_POST_TOKENS: int = 160
+    PROMPT_REQUEST_TOKENS: int = 3000
+    # POST /analyze/batch: at most this many queries per call; their deduplicated
+    # posts are enriched in concurrent LLM requests of ANALYZE_BATCH_ENRICH_POSTS.
+    ANALYZE_BATCH_MAX_QUERIES: int = 10
+    ANALYZE_BATCH_ENRICH_POSTS: int = 25
+
+    # JOY chat sessions (app/chat.py): the server keeps each conversation; prompts hold
+    # the system prompt, a rolling summary of older turns (CHAT_SUMMARY_TOKENS) and the
+    # last CHAT_HISTORY_TURNS exchanges, within CHAT_PROMPT_TOKENS. CHAT_SESSION_DB is
+    # an optional SQLite file that keeps sessions across restarts and workers.
+    CHAT_SESSIONS_ENABLED: bool = True
+    CHAT_HISTORY_TURNS: int = 4
+    CHAT_PROMPT_TOKENS: int = 2000
+    CHAT_SUMMARY_TOKENS: int = 250
+    CHAT_TURN_TOKENS: int = 400
+    CHAT_MAX_SESSIONS: int = 10_000
+    CHAT_SESSION_TTL_S: int = 24 * 3600
+    CHAT_SESSION_DB: Optional[str] = None
+
+    # JOY answer cache (app/answers.py): an opening question whose TF-IDF similarity to a
+    # cached one is at least CHAT_ANSWER_SIMILARITY gets that answer without an LLM call.
+    # Learned answers expire after CHAT_ANSWER_TTL_S; pinned answers are managed under
+    # /chat/answers/pinned with X-Admin-Token == CHAT_ANSWER_ADMIN_TOKEN.
+    CHAT_ANSWER_CACHE_ENABLED: bool = True
+    CHAT_ANSWER_SIMILARITY: float = 0.8
+    CHAT_ANSWER_TTL_S: int = 3 * 86400
+    CHAT_ANSWER_MAX_ENTRIES: int = 2000
+    CHAT_ANSWER_PINNED_PATH: Optional[str] = "pinned_answers.json"
+    CHAT_ANSWER_ADMIN_TOKEN: Optional[str] = None
+
+    # Write-behind (app/writebehind.py): feedback and analysis writes are logged to a
+    # local WAL under WRITE_BEHIND_DIR and acknowledged; a flusher writes them to
+    # Firebase WRITE_BEHIND_BATCH at a time or after WRITE_BEHIND_FLUSH_S. Past
+    # WRITE_BEHIND_MAX_BACKLOG buffered records, writes go straight to Firebase again.
+    # Opt-in: WRITE_BEHIND_DIR must be a persistent volume shared by every worker,
+    # or an acknowledged write dies with the container (e.g. Cloud Run).
+    WRITE_BEHIND_ENABLED: bool = False
+    WRITE_BEHIND_DIR: str = "write_behind"
+    WRITE_BEHIND_BATCH: int = 100
+    WRITE_BEHIND_FLUSH_S: float = 1.0
+    WRITE_BEHIND_MAX_BACKLOG: int = 50_000
+    WRITE_BEHIND_FSYNC: bool = True
+    WRITE_BEHIND_DRAIN_S: float = 10.0
+
+    # Reddit comment expansion (app/comments.py): comments of the top
+    # REDDIT_COMMENTS_TOP_N submissions per search become posts too. Fetches share a
+    # process-wide cap of REDDIT_COMMENTS_CONCURRENCY and stop after REDDIT_COMMENTS_BUDGET_S.
+    REDDIT_COMMENTS_ENABLED: bool = False
+    REDDIT_COMMENTS_TOP_N: int = 5
+    REDDIT_COMMENTS_DEPTH: int = 3
+    REDDIT_COMMENTS_PER_THREAD: int = 20
+    REDDIT_COMMENTS_MAX: int = 50
+    REDDIT_COMMENTS_CONCURRENCY: int = 4
+    REDDIT_COMMENTS_BUDGET_S: float = 4.0
+
+    # Employee endpoints (app/employees.py): bcrypt runs in a process pool and the
+    # blocking Firebase Auth/Firestore calls in a bounded thread pool.
+    BCRYPT_ROUNDS: int = 12
+    EMPLOYEE_HASH_WORKERS: int = 2
+    EMPLOYEE_IO_WORKERS: int = 8
+
+    # Push channel for feedback analyses (app/events.py, GET /feedback/analyses/stream).
+    # One poller per process picks up analyses stored by other workers.
+    EVENTS_BUFFER_SIZE: int = 500
+    EVENTS_CATCHUP_LIMIT: int = 100
+    EVENTS_POLL_S: float = 15.0
+    EVENTS_HEARTBEAT_S: float = 15.0
+    EVENTS_SUBSCRIBER_QUEUE: int = 100
+    EVENTS_RETRY_MS: int = 3000
+
+    # Response compression (app/compression.py): gzip, or brotli when installed
+    # and accepted, for bodies of at least COMPRESSION_MIN_BYTES.
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_BYTES: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+
+    # Exports (app/export.py, GET /export/*): Firebase is read EXPORT_PAGE_SIZE records
+    # at a time. /analyze sentiments are kept in a `sentiments` collection for export.
+    EXPORT_PAGE_SIZE: int = 500
+    EXPORT_RECORD_SENTIMENTS: bool = True
+
+    # Spike detection (app/alerts.py, GET /alerts): per-(city, category) arrival
+    # counts in ALERTS_BUCKET_S event-time buckets against an EWMA baseline. A bucket
+    # raises an alert once it holds ALERTS_MIN_COUNT events and is ALERTS_Z deviations
+    # up, and only after the series has ALERTS_MIN_BUCKETS closed buckets of baseline.
+    ALERTS_ENABLED: bool = True
+    ALERTS_BUCKET_S: int = 300
+    ALERTS_EWMA_ALPHA: float = 0.1
+    ALERTS_Z: float = 4.0
+    ALERTS_MIN_COUNT: int = 5
+    ALERTS_MIN_BUCKETS: int = 12
+    ALERTS_MIN_SD: float = 1.0
+    ALERTS_MAX_LAG_S: int = 1800
+    ALERTS_MAX_SERIES: int = 5000
+    ALERTS_MAX_SEEN: int = 100_000
+    ALERTS_HISTORY: int = 200
+
+    # Geo aggregation (app/geo.py, GET /insights/geo): located posts and feedback are
+    # counted into geohash cells at each of GEO_PRECISIONS; each worker merges what it
+    # counted into GEO_SNAPSHOT_PATH every GEO_SAVE_INTERVAL_S and on shutdown, and the
+    # snapshot is loaded at startup.
+    GEO_ENABLED: bool = True
+    GEO_PRECISIONS: str = "2,3,4,5"
+    GEO_MAX_SEEN: int = 200_000
+    GEO_SNAPSHOT_PATH: Optional[str] = "geo_cells.json"
+    GEO_SAVE_INTERVAL_S: float = 60.0
+    GEO_MAX_CELLS: int = 2000
+
+    # Full-text search (app/search.py): BM25 index over feedback text and analysis
+    # fields, persisted under SEARCH_INDEX_DIR (unset disables /feedback/search).
+    SEARCH_INDEX_DIR: Optional[str] = "search_index"
+    SEARCH_PREVIEW_CHARS: int = 160
+    # How often each worker applies the index adds other workers logged.
+    SEARCH_REFRESH_S: float = 10.0
+
+    # Incident clustering (app/incidents.py): feedback similar to an open incident in
+    # the same location (cosine >= INCIDENT_SIMILARITY, last member within
+    # INCIDENT_WINDOW_S) reuses that incident's workflow analysis instead of an LLM call.
+    INCIDENTS_ENABLED: bool = True
+    INCIDENT_SIMILARITY: float = 0.5
+    INCIDENT_WINDOW_S: int = 6 * 3600
+    INCIDENT_MAX_OPEN: int = 500
+    INCIDENT_HISTORY: int = 50
+    INCIDENT_WAIT_S: float = 45.0
+
+    # Re-analysis backfill (python -m app.backfill): feedback whose analysis is not at
+    # services.analysis_version() is re-analyzed with at most BACKFILL_CONCURRENCY
+    # calls in flight and BACKFILL_TOKENS_PER_MINUTE tokens spent, written
+    # BACKFILL_WRITE_BATCH at a time. Progress is checkpointed after every page.
+    BACKFILL_CONCURRENCY: int = 4
+    BACKFILL_TOKENS_PER_MINUTE: int = 60_000
+    BACKFILL_WRITE_BATCH: int = 50
+    BACKFILL_CHECKPOINT: str = "backfill_checkpoint.json"
+
+    # Local classifier (app/classifier.py). Posts predicted with confidence at or
+    # above the threshold skip the LLM. The training log collects LLM labels.
+    CLASSIFIER_MODEL_PATH: Optional[str] = None
+    CLASSIFIER_MIN_CONFIDENCE: float = 0.8
+    CLASSIFIER_TRAINING_LOG: Optional[str] = None
+
+    # Shared cache (app/cache.py): "memory" (per process), "sqlite" (CACHE_URL is a
+    # file path shared by all workers on the host) or "redis" (CACHE_URL redis://...).
+    CACHE_BACKEND: str = "memory"
+    CACHE_URL: Optional[str] = None
+    ENRICH_CACHE_TTL_S: int = 86400
+    RESPONSE_CACHE_TTL_S: int = 0  # /posts and /analyze; 0 disables
+
+    # Admission control for LLM-backed routes (app/admission.py): per-route
+    # concurrency ("route=limit,..."), bounded wait queue with a queue-time budget,
+    # and a per-client token bucket (requests/second, burst). Rate 0 disables it.
+    # Behind a proxy, set ADMISSION_TRUSTED_PROXIES before enabling the bucket, or
+    # every client is keyed by the proxy's address and they all share one bucket.
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_LIMITS: str = "/analyze=8,/analyze/batch=2,/chat=16,/feedback/analyze=8"
+    ADMISSION_MAX_QUEUE: int = 32
+    ADMISSION_QUEUE_TIMEOUT_S: float = 2.0
+    ADMISSION_CLIENT_RATE: float = 0.0
+    ADMISSION_CLIENT_BURST: float = 10.0
+    # Comma-separated IPs/CIDRs of reverse proxies whose X-Forwarded-For is
+    # believed; other peers are keyed by their own address. Empty trusts none.
+    ADMISSION_TRUSTED_PROXIES: str = ""
+
     @field_validator("ALLOWED_ORIGINS", mode="before")
     @classmethod
     def _normalize_origins(cls, value):
@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from typing import Any, Callable, TypeVar
+
+from . import profiling, tracing
+from .config import Settings
+from .schemas import EmployeeRecord, EmployeeSignupRequest, EmployeeUpdateRequest
+
+LOGGER = logging.getLogger("sentiment-employees")
+
+T = TypeVar("T")
+
+
+def _hash_password(password: str, rounds: int) -> str:
+    # Runs in a worker process; module-level so it pickles.
+    import bcrypt  # type: ignore
+
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _stamped(func: Callable[..., T], *args: Any) -> tuple[float, T]:
+    # Wall-clock start time travels back with the result so queue wait can be
+    # measured for process workers too.
+    return time.time(), func(*args)
+
+
+class MeteredPool:
+    """An executor plus submitted/in-flight/queue-wait/run-time counters."""
+
+    def __init__(self, name: str, factory: Callable[[], Executor], max_workers: int) -> None:
+        self.name = name
+        self.max_workers = max_workers
+        self._factory = factory
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self.run_ms_total = 0.0
+
+    def _get(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._factory()
+            return self._executor
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        self.submitted += 1
+        self.in_flight += 1
+        queued_at = time.time()
+        try:
+            started_at, result = await loop.run_in_executor(self._get(), _stamped, func, *args)
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        done_at = time.time()
+        wait_ms = max(0.0, started_at - queued_at) * 1000
+        self.completed += 1
+        self.wait_ms_total += wait_ms
+        self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+        self.run_ms_total += (done_at - started_at) * 1000
+        return result
+
+    def reset(self) -> None:
+        """Drop a broken executor; the next call creates a fresh one."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def snapshot(self) -> dict[str, Any]:
+        done = self.completed or 1
+        return {
+            "max_workers": self.max_workers,
+            "started": self._executor is not None,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "in_flight": self.in_flight,
+            "queued": max(0, self.in_flight - self.max_workers),
+            "avg_wait_ms": round(self.wait_ms_total / done, 2),
+            "max_wait_ms": round(self.wait_ms_max, 2),
+            "avg_run_ms": round(self.run_ms_total / done, 2),
+        }
+
+
+_HASH_POOL: MeteredPool | None = None
+_IO_POOL: MeteredPool | None = None
+_POOLS_LOCK = threading.Lock()
+
+
+def _pools(settings: Settings) -> tuple[MeteredPool, MeteredPool]:
+    global _HASH_POOL, _IO_POOL
+    with _POOLS_LOCK:
+        if _HASH_POOL is None:
+            workers = settings.EMPLOYEE_HASH_WORKERS
+            # spawn, not fork: the server process already runs threads (SDK clients, exporters).
+            _HASH_POOL = MeteredPool(
+                "bcrypt",
+                lambda: ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")),
+                workers,
+            )
+        if _IO_POOL is None:
+            workers = settings.EMPLOYEE_IO_WORKERS
+            _IO_POOL = MeteredPool(
+                "firebase_io",
+                lambda: ThreadPoolExecutor(max_workers=workers, thread_name_prefix="employees-io"),
+                workers,
+            )
+        return _HASH_POOL, _IO_POOL
+
+
+async def hash_password(password: str, settings: Settings) -> str:
+    hash_pool, _ = _pools(settings)
+    with tracing.span("employees.hash_password", rounds=settings.BCRYPT_ROUNDS):
+        try:
+            return await hash_pool.run(_hash_password, password, settings.BCRYPT_ROUNDS)
+        except BrokenProcessPool:
+            LOGGER.warning("bcrypt process pool broke; restarting it.")
+            hash_pool.reset()
+            return await hash_pool.run(_hash_password, password, settings.BCRYPT_ROUNDS)
+
+
+async def _blocking(settings: Settings, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking Firebase SDK call on the bounded I/O pool, keeping trace/profile context."""
+    _, io_pool = _pools(settings)
+    ctx = contextvars.copy_context()
+    call = profiling.tracked(lambda: func(*args, **kwargs))
+    return await io_pool.run(ctx.run, call)
+
+
+def pool_stats(settings: Settings) -> dict[str, Any]:
+    hash_pool, io_pool = _pools(settings)
+    return {hash_pool.name: hash_pool.snapshot(), io_pool.name: io_pool.snapshot()}
+
+
+def shutdown() -> None:
+    for pool in (_HASH_POOL, _IO_POOL):
+        if pool is not None:
+            pool.shutdown()
+
+
+# --------------------------- Employees ---------------------------
+async def upsert_employee(req: EmployeeUpdateRequest, settings: Settings) -> EmployeeRecord:
+    from .services import _ensure_firebase
+
+    try:
+        await _blocking(settings, _ensure_firebase, settings)
+        from firebase_admin import auth, firestore
+        # Update auth user if needed
+        kwargs: dict[str, Any] = {}
+        if req.email:
+            kwargs["email"] = req.email
+        if req.new_password:
+            kwargs["password"] = req.new_password
+        if kwargs:
+            with tracing.span("firebase.auth_update_user"):
+                await _blocking(settings, auth.update_user, req.emp_id, **kwargs)
+        # Store profile in Firestore 'employees' (always use Firestore for employees)
+        client = await _blocking(settings, firestore.client)
+        record = {
+            "Emp_ID": req.emp_id,
+            "Name": req.name or "",
+            "FName": req.first_name or "",
+            "LName": req.last_name or "",
+            "Email": req.email or "",
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+        with tracing.span("firebase.write_employee"):
+            await _blocking(settings, client.collection("employees").document(req.emp_id).set, record, merge=True)
+        return EmployeeRecord(emp_id=req.emp_id, name=req.name, email=req.email)
+    except Exception as exc:
+        LOGGER.warning("Failed to upsert employee: %s", exc)
+        return EmployeeRecord(emp_id=req.emp_id, name=req.name, email=req.email)
+
+
+async def signup_employee(req: EmployeeSignupRequest, settings: Settings) -> EmployeeRecord:
+    from .services import _ensure_firebase
+
+    try:
+        await _blocking(settings, _ensure_firebase, settings)
+        from firebase_admin import auth, firestore
+        display_name = f"{req.first_name} {req.last_name}"
+        # Hashing does not depend on Firebase; start it while the Auth calls run.
+        pw_hash_task = asyncio.ensure_future(hash_password(req.password, settings))
+        try:
+            # Create or update auth user
+            user = None
+            if req.emp_id:
+                try:
+                    with tracing.span("firebase.auth_get_user"):
+                        user = await _blocking(settings, auth.get_user, req.emp_id)
+                except Exception:
+                    user = None
+            with tracing.span("firebase.auth_upsert_user", existing=bool(user)):
+                if user:
+                    await _blocking(
+                        settings, auth.update_user, user.uid, email=req.email, password=req.password, display_name=display_name
+                    )
+                    emp_id = user.uid
+                else:
+                    user = await _blocking(
+                        settings, auth.create_user, email=req.email, password=req.password, display_name=display_name
+                    )
+                    emp_id = user.uid
+        except BaseException:
+            pw_hash_task.cancel()
+            raise
+        # Hash password for Firestore storage (never plaintext)
+        pw_hash = await pw_hash_task
+        # Write to Firestore employees
+        client = await _blocking(settings, firestore.client)
+        doc = {
+            "Emp_ID": emp_id,
+            "FName": req.first_name,
+            "LName": req.last_name,
+            "Email": req.email,
+            "PasswordHash": pw_hash,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+        with tracing.span("firebase.write_employee"):
+            await _blocking(settings, client.collection("employees").document(emp_id).set, doc, merge=True)
+        return EmployeeRecord(emp_id=emp_id, name=display_name, email=req.email)
+    except Exception as exc:
+        LOGGER.warning("Employee signup failed: %s", exc)
+        return EmployeeRecord(emp_id=req.emp_id or "", name=f"{req.first_name} {req.last_name}", email=req.email)
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from .config import Settings
+
+LOGGER = logging.getLogger("sentiment-events")
+
+
+def event_id(record: dict[str, Any]) -> str:
+    return f"{int(record.get('analyzed_at') or 0)}:{record.get('feedback_id') or ''}"
+
+
+def _position(eid: str | None) -> tuple[int, str] | None:
+    """Parse an event id (or a bare `analyzed_at`) into a comparable resume position."""
+    if not eid:
+        return None
+    ts, _, fid = eid.partition(":")
+    try:
+        return int(float(ts)), fid
+    except ValueError:
+        return None
+
+
+def _key(record: dict[str, Any]) -> tuple[int, str]:
+    return int(record.get("analyzed_at") or 0), str(record.get("feedback_id") or "")
+
+
+def format_sse(record: dict[str, Any]) -> str:
+    return f"event: analysis\nid: {event_id(record)}\ndata: {json.dumps(record, default=str, separators=(',', ':'))}\n\n"
+
+
+class AnalysisBroker:
+    """
+    In-process fan-out of stored feedback analyses to SSE subscribers.
+
+    Records stored by this worker are published directly. With several workers,
+    one shared poller per process picks up records stored elsewhere, so Firebase
+    reads scale with workers rather than with open dashboards. The poller
+    publishes every record it has not seen, whatever its `analyzed_at`: records
+    reach Firebase late (write-behind flushes, other workers storing in the same
+    second), so "newer than the newest buffered" would drop them. A ring buffer
+    of recent records serves resumes; older resumes fall back to one Firebase read.
+    """
+
+    def __init__(self, settings: Settings, fetch: Callable[[int], Awaitable[list[dict[str, Any]]]]) -> None:
+        self.settings = settings
+        self.fetch = fetch
+        self.buffer: deque[dict[str, Any]] = deque(maxlen=max(1, settings.EVENTS_BUFFER_SIZE))
+        # Keys already published, kept longer than the buffer so that a poll
+        # returning records evicted from the buffer does not publish them again.
+        self.seen: OrderedDict[tuple[int, str], None] = OrderedDict()
+        self.max_seen = 4 * max(settings.EVENTS_BUFFER_SIZE, settings.EVENTS_CATCHUP_LIMIT, 1)
+        self.subscribers: set[asyncio.Queue] = set()
+        self.published = 0
+        self.dropped_subscribers = 0
+        self.catchup_reads = 0
+        self._poller: asyncio.Task | None = None
+
+    def _remember(self, record: dict[str, Any]) -> bool:
+        key = _key(record)
+        if key in self.seen:
+            return False
+        self.seen[key] = None
+        if len(self.seen) > self.max_seen:
+            self.seen.popitem(last=False)
+        self.buffer.append(record)
+        return True
+
+    def publish(self, record: dict[str, Any]) -> None:
+        if not self._remember(record):
+            return
+        self.published += 1
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(record)
+            except asyncio.QueueFull:
+                # A stalled client: close its stream. The browser reconnects with
+                # Last-Event-ID and catches up from the buffer or Firebase.
+                self.subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                self.dropped_subscribers += 1
+
+    async def _catch_up(self, since: tuple[int, str]) -> list[dict[str, Any]]:
+        # The buffer is in arrival order, not key order.
+        oldest = min(map(_key, self.buffer)) if self.buffer else None
+        if oldest is not None and oldest <= since:
+            return sorted((r for r in self.buffer if _key(r) > since), key=_key)
+        self.catchup_reads += 1
+        records = await self.fetch(self.settings.EVENTS_CATCHUP_LIMIT)
+        merged = {_key(r): r for r in [*records, *self.buffer] if _key(r) > since}
+        return [merged[k] for k in sorted(merged)]
+
+    async def _poll(self) -> None:
+        interval = self.settings.EVENTS_POLL_S
+        primed = False
+        while self.subscribers:
+            if primed:
+                await asyncio.sleep(interval)
+            try:
+                records = await self.fetch(self.settings.EVENTS_CATCHUP_LIMIT)
+            except Exception as exc:
+                LOGGER.warning("Analysis poll failed: %s", exc)
+                if not primed:
+                    await asyncio.sleep(interval)
+                continue
+            records.sort(key=_key)
+            if not primed:
+                # What is already stored when polling starts is not new.
+                for record in records:
+                    self._remember(record)
+                primed = True
+                continue
+            for record in records:
+                self.publish(record)
+        self._poller = None
+
+    async def subscribe(self, since: str | None) -> AsyncIterator[str]:
+        """Yield SSE frames: catch-up after `since`, then live records and heartbeats."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.settings.EVENTS_SUBSCRIBER_QUEUE)
+        self.subscribers.add(queue)
+        if self.settings.EVENTS_POLL_S > 0 and self._poller is None:
+            self._poller = asyncio.create_task(self._poll())
+        try:
+            yield f"retry: {int(self.settings.EVENTS_RETRY_MS)}\n\n"
+            # The position only selects the catch-up; live records are never compared
+            # to it, since a late record can carry an older key than one already sent.
+            caught_up: set[tuple[int, str]] = set()
+            position = _position(since)
+            if position is not None:
+                for record in await self._catch_up(position):
+                    caught_up.add(_key(record))
+                    yield format_sse(record)
+            while True:
+                try:
+                    record = await asyncio.wait_for(queue.get(), timeout=self.settings.EVENTS_HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if record is None:
+                    return
+                if _key(record) in caught_up:
+                    continue
+                yield format_sse(record)
+        finally:
+            self.subscribers.discard(queue)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "subscribers": len(self.subscribers),
+            "buffered": len(self.buffer),
+            "published": self.published,
+            "dropped_subscribers": self.dropped_subscribers,
+            "catchup_reads": self.catchup_reads,
+            "polling": self._poller is not None,
+        }
+
+
+_BROKER: AnalysisBroker | None = None
+
+
+def get_broker(settings: Settings) -> AnalysisBroker:
+    global _BROKER
+    if _BROKER is None:
+        from .services import list_feedback_analyses
+
+        _BROKER = AnalysisBroker(settings, lambda limit: list_feedback_analyses(limit, settings))
+    return _BROKER
+
+
+def publish_analysis(record: dict[str, Any], settings: Settings) -> None:
+    get_broker(settings).publish(record)
@@ -0,0 +1,314 @@
+from __future__ import annotations
+
+import asyncio
+import csv
+import io
+import json
+import logging
+from typing import Any, AsyncIterator, Iterable
+
+from .config import Settings
+
+try:  # optional: Parquet export is offered only when pyarrow is installed
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on environment
+    pa = None  # type: ignore[assignment]
+    pq = None  # type: ignore[assignment]
+
+LOGGER = logging.getLogger("sentiment-export")
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+# CSV/NDJSON text is yielded once this much has accumulated, not per row.
+FLUSH_BYTES = 64 * 1024
+
+# Column name -> Parquet type name; the order is the CSV header order.
+ANALYSIS_COLUMNS: dict[str, str] = {
+    "feedback_id": "string",
+    "name": "string",
+    "problem": "string",
+    "resolved": "bool_",
+    "analyzed_at": "int64",
+    "incident_id": "string",
+    "prompt_version": "string",
+    "intake_classification": "string",
+    "intake_summary": "string",
+    "intake_tags": "string",
+    "sentiment_tone": "string",
+    "sentiment_score": "float64",
+    "sentiment_urgency": "string",
+    "sentiment_notes": "string",
+    "routing_priority": "string",
+    "routing_team": "string",
+    "routing_action_count": "int64",
+    "routing_actions": "string",
+    "insights_type": "string",
+    "insights": "string",
+}
+SENTIMENT_COLUMNS: dict[str, str] = {
+    "post_id": "string",
+    "source": "string",
+    "author": "string",
+    "posted_at": "string",
+    "analyzed_at": "int64",
+    "query": "string",
+    "text": "string",
+    "city": "string",
+    "state": "string",
+    "latitude": "float64",
+    "longitude": "float64",
+    "permalink": "string",
+    "sentiment": "string",
+    "confidence": "float64",
+    "rating": "int64",
+    "category": "string",
+    "solution": "string",
+    "issues": "string",
+    "delights": "string",
+}
+
+# Lists inside a flattened cell are joined with this separator.
+LIST_SEP = "; "
+
+
+def _join(values: Any) -> str:
+    return LIST_SEP.join(str(v) for v in values if v not in (None, "")) if isinstance(values, list) else ""
+
+
+def flatten_analysis(record: dict[str, Any]) -> dict[str, Any]:
+    """One flat row per normalized analysis; nested lists become joined strings."""
+    intake = record.get("intake") or {}
+    sentiment = record.get("sentiment") or {}
+    routing = record.get("routing") or {}
+    insights = record.get("insights") or {}
+    actions = routing.get("actions") or []
+    steps = [
+        f"{a.get('step')}" + (f" ({a['owner']})" if a.get("owner") else "") + (f": {a['detail']}" if a.get("detail") else "")
+        for a in actions
+    ]
+    if insights.get("type") == "flowchart":
+        parts = [f"{s.get('title')}: {s.get('description')}" for s in insights.get("flowchart") or []]
+    else:
+        parts = [f"{c.get('title')}: {c.get('body')}" for c in insights.get("cards") or []]
+    return {
+        "feedback_id": record.get("feedback_id"),
+        "name": record.get("name"),
+        "problem": record.get("problem"),
+        "resolved": bool(record.get("resolved")),
+        "analyzed_at": record.get("analyzed_at"),
+        "incident_id": record.get("incident_id"),
+        "prompt_version": record.get("prompt_version"),
+        "intake_classification": intake.get("classification"),
+        "intake_summary": intake.get("summary"),
+        "intake_tags": _join(intake.get("tags")),
+        "sentiment_tone": sentiment.get("tone"),
+        "sentiment_score": sentiment.get("score"),
+        "sentiment_urgency": sentiment.get("urgency"),
+        "sentiment_notes": sentiment.get("notes"),
+        "routing_priority": routing.get("priority"),
+        "routing_team": routing.get("team"),
+        "routing_action_count": len(actions),
+        "routing_actions": " | ".join(steps),
+        "insights_type": insights.get("type"),
+        "insights": " | ".join(parts),
+    }
+
+
+def flatten_sentiment(record: dict[str, Any]) -> dict[str, Any]:
+    """One flat row per stored /analyze sentiment (see services._record_sentiments)."""
+    post = record.get("post") or {}
+    location = post.get("location") or {}
+    return {
+        "post_id": post.get("id"),
+        "source": post.get("source"),
+        "author": post.get("author"),
+        "posted_at": post.get("posted_at"),
+        "analyzed_at": record.get("analyzed_at"),
+        "query": record.get("query"),
+        "text": post.get("text"),
+        "city": location.get("city"),
+        "state": location.get("state"),
+        "latitude": location.get("latitude"),
+        "longitude": location.get("longitude"),
+        "permalink": post.get("permalink"),
+        "sentiment": record.get("sentiment"),
+        "confidence": record.get("confidence"),
+        "rating": record.get("rating"),
+        "category": record.get("category"),
+        "solution": record.get("solution"),
+        "issues": _join(record.get("issues")),
+        "delights": _join(record.get("delights")),
+    }
+
+
+# --------------------------- Firebase paging ---------------------------
+def _read_page(collection: str, cursor: Any, page_size: int, settings: Settings) -> tuple[list[tuple[str, dict[str, Any]]], Any]:
+    """One page of (key, record) in key order after `cursor`; returns it and the next cursor (None when done)."""
+    if settings.FIREBASE_STORE == "realtime":
+        from firebase_admin import db
+
+        query = db.reference(collection).order_by_key()
+        if cursor is not None:
+            # start_at is inclusive, so fetch one extra and drop the cursor row.
+            query = query.start_at(cursor)
+        snapshot = query.limit_to_first(page_size + (cursor is not None)).get() or {}
+        items = [(k, v) for k, v in snapshot.items() if k != cursor] if isinstance(snapshot, dict) else []
+        records = [(k, v) for k, v in items if isinstance(v, dict)]
+        return records, (items[-1][0] if len(items) >= page_size else None)
+
+    from firebase_admin import firestore
+
+    query = firestore.client().collection(collection).order_by("__name__").limit(page_size)
+    if cursor is not None:
+        query = query.start_after(cursor)
+    docs = list(query.stream())
+    records = [(doc.id, doc.to_dict() or {}) for doc in docs]
+    return records, (docs[-1] if len(docs) >= page_size else None)
+
+
+def _key_cursor(collection: str, key: str, settings: Settings) -> Any:
+    """The paging cursor positioned at `key`: the key itself on Realtime DB, its snapshot on Firestore."""
+    if settings.FIREBASE_STORE == "realtime":
+        return key
+    from firebase_admin import firestore
+
+    return firestore.client().collection(collection).document(key).get()
+
+
+async def iter_keyed(
+    collection: str, settings: Settings, start_after: str | None = None
+) -> AsyncIterator[list[tuple[str, dict[str, Any]]]]:
+    """Yield (key, record) pages of a Firebase collection, optionally resuming after a key."""
+    from .services import _ensure_firebase
+
+    _ensure_firebase(settings)
+    page_size = max(1, settings.EXPORT_PAGE_SIZE)
+    cursor: Any = None
+    if start_after is not None:
+        cursor = await asyncio.to_thread(_key_cursor, collection, start_after, settings)
+    pages = 0
+    while True:
+        records, cursor = await asyncio.to_thread(_read_page, collection, cursor, page_size, settings)
+        pages += 1
+        if records:
+            yield records
+        if cursor is None:
+            LOGGER.info("Read %s from %s pages.", collection, pages)
+            return
+
+
+async def iter_collection(collection: str, settings: Settings) -> AsyncIterator[list[dict[str, Any]]]:
+    """Yield a Firebase collection page by page; each blocking read runs in a worker thread."""
+    async for items in iter_keyed(collection, settings):
+        yield [record for _, record in items]
+
+
+# --------------------------- Encoders ---------------------------
+async def _csv(pages: AsyncIterator[list[dict[str, Any]]], columns: Iterable[str]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(columns), extrasaction="ignore")
+    writer.writeheader()
+    async for rows in pages:
+        writer.writerows(rows)
+        if buffer.tell() >= FLUSH_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+async def _ndjson(pages: AsyncIterator[list[dict[str, Any]]]) -> AsyncIterator[bytes]:
+    chunk: list[str] = []
+    size = 0
+    async for rows in pages:
+        for row in rows:
+            line = json.dumps(row, default=str, separators=(",", ":"))
+            chunk.append(line)
+            size += len(line) + 1
+        if size >= FLUSH_BYTES:
+            yield ("\n".join(chunk) + "\n").encode("utf-8")
+            chunk, size = [], 0
+    if chunk:
+        yield ("\n".join(chunk) + "\n").encode("utf-8")
+
+
+class _Drain:
+    """Write-only file object whose contents are handed out and released after each row group."""
+
+    closed = False
+
+    def __init__(self) -> None:
+        self.parts: list[bytes] = []
+        self.pos = 0
+
+    def write(self, data: bytes) -> int:
+        self.parts.append(bytes(data))
+        self.pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.pos
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+async def _parquet(pages: AsyncIterator[list[dict[str, Any]]], columns: dict[str, str]) -> AsyncIterator[bytes]:
+    schema = pa.schema([(name, getattr(pa, kind)()) for name, kind in columns.items()])
+    sink = _Drain()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        async for rows in pages:
+            # One row group per Firebase page keeps memory flat on both ends.
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            data = sink.take()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def parquet_available() -> bool:
+    return pa is not None
+
+
+def _encode(fmt: str, pages: AsyncIterator[list[dict[str, Any]]], columns: dict[str, str]) -> AsyncIterator[bytes]:
+    if fmt == "csv":
+        return _csv(pages, columns)
+    if fmt == "ndjson":
+        return _ndjson(pages)
+    return _parquet(pages, columns)
+
+
+def export_analyses(fmt: str, settings: Settings) -> AsyncIterator[bytes]:
+    """Every stored feedback analysis, normalized and flattened, one Firebase page in memory at a time."""
+    from .services import _stored_analysis
+
+    async def pages() -> AsyncIterator[list[dict[str, Any]]]:
+        async for records in iter_collection("feedback_analyses", settings):
+            yield [flatten_analysis(_stored_analysis(r)) for r in records]
+
+    return _encode(fmt, pages(), ANALYSIS_COLUMNS)
+
+
+def export_sentiments(fmt: str, settings: Settings) -> AsyncIterator[bytes]:
+    """Every recorded /analyze sentiment, flattened."""
+
+    async def pages() -> AsyncIterator[list[dict[str, Any]]]:
+        async for records in iter_collection("sentiments", settings):
+            yield [flatten_sentiment(r) for r in records]
+
+    return _encode(fmt, pages(), SENTIMENT_COLUMNS)
@@ -0,0 +1,438 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import fcntl
+import json
+import logging
+import math
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Iterable
+
+from .batch import CATEGORIES, NEGATIVE, POSITIVE, SENTIMENTS, PostBatch
+from .config import Settings
+
+LOGGER = logging.getLogger("sentiment-geo")
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+
+# Cell layout: one flat list of running totals per geohash.
+COUNT, RATING_SUM, POS_SCORE, NEG_SCORE, LAT_SUM, LNG_SUM = range(6)
+SENT0 = 6
+CAT0 = SENT0 + len(SENTIMENTS)
+CELL_WIDTH = CAT0 + len(CATEGORIES)
+
+
+def encode(lat: float, lng: float, precision: int) -> str:
+    """Standard geohash of (lat, lng) with `precision` characters."""
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    chars: list[str] = []
+    bits = code = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                code = code * 2 + 1
+                lng_lo = mid
+            else:
+                code *= 2
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                code = code * 2 + 1
+                lat_lo = mid
+            else:
+                code *= 2
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[code])
+            bits = code = 0
+    return "".join(chars)
+
+
+def bounds(geohash: str) -> tuple[float, float, float, float]:
+    """(south, west, north, east) of a geohash cell."""
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    even = True
+    for char in geohash:
+        code = _DECODE[char]
+        for shift in range(4, -1, -1):
+            bit = (code >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                lng_lo, lng_hi = (mid, lng_hi) if bit else (lng_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return lat_lo, lng_lo, lat_hi, lng_hi
+
+
+def _grid(precision: int) -> tuple[int, int]:
+    """Latitude and longitude bits of a geohash with `precision` characters (longitude takes the odd one)."""
+    bits = 5 * precision
+    return bits // 2, (bits + 1) // 2
+
+
+def _from_grid(lat_i: int, lng_i: int, precision: int) -> str:
+    """Geohash of the cell in row `lat_i`, column `lng_i` of the precision's grid."""
+    lat_bits, lng_bits = _grid(precision)
+    chars: list[str] = []
+    code = 0
+    for k in range(5 * precision):
+        if k % 2 == 0:
+            lng_bits -= 1
+            code = code * 2 + ((lng_i >> lng_bits) & 1)
+        else:
+            lat_bits -= 1
+            code = code * 2 + ((lat_i >> lat_bits) & 1)
+        if k % 5 == 4:
+            chars.append(_BASE32[code])
+            code = 0
+    return "".join(chars)
+
+
+def _covering(bbox: tuple[float, float, float, float], precision: int) -> tuple[range, range, float, float]:
+    """Grid rows and columns of the cells intersecting bbox (west, south, east, north), and the cell size."""
+    west, south, east, north = bbox
+    lat_bits, lng_bits = _grid(precision)
+    dlat, dlng = 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+    # A cell touching the box edge counts, as in bounds-based intersection.
+    rows = range(max(0, math.ceil((south + 90.0) / dlat) - 1), min((1 << lat_bits) - 1, math.floor((north + 90.0) / dlat)) + 1)
+    cols = range(max(0, math.ceil((west + 180.0) / dlng) - 1), min((1 << lng_bits) - 1, math.floor((east + 180.0) / dlng)) + 1)
+    return rows, cols, dlat, dlng
+
+
+def _csi(cell: list[float]) -> float:
+    # Same index as PostBatch.csi, from the running positive/negative scores.
+    count = cell[COUNT]
+    if not count:
+        return 50.0
+    raw_score = ((cell[POS_SCORE] - cell[NEG_SCORE]) / (count * 5)) * 100
+    return max(0.0, min(100.0, round(50 + raw_score / 2, 2)))
+
+
+class GeoStore:
+    """
+    Running sentiment totals per geohash cell, kept at every precision in
+    GEO_PRECISIONS so a map query at any zoom reads pre-aggregated cells
+    instead of raw posts. Each located post or feedback item is counted once
+    (ids are remembered in a capped LRU); a cell holds its count, rating sum,
+    CSI components, per-sentiment and per-category counts and a coordinate sum
+    for the centroid.
+
+    Workers share one snapshot file. `merge_save` folds the items this worker
+    counted since its last save into the file under a flock, so workers add to
+    the snapshot instead of overwriting each other's.
+    """
+
+    def __init__(self, precisions: Iterable[int], max_seen: int) -> None:
+        self.precisions = sorted({p for p in precisions if 1 <= p <= 12}) or [4]
+        self.max_seen = max(1, max_seen)
+        self.cells: dict[int, dict[str, list[float]]] = {p: {} for p in self.precisions}
+        self.seen: OrderedDict[str, None] = OrderedDict()
+        self.added = 0
+        # Items counted since the last merge_save, as add() arguments.
+        self._unsaved: list[tuple[str, float, float, int, int, int]] = []
+        self.lock = threading.Lock()
+
+    def add(self, event_id: str, lat: float, lng: float, rating: int, sentiment: int, category: int) -> bool:
+        """Count one located item; False if it was already counted or has no usable coordinates."""
+        with self.lock:
+            return self._add(event_id, lat, lng, rating, sentiment, category)
+
+    def _add(self, event_id: str, lat: float, lng: float, rating: int, sentiment: int, category: int) -> bool:
+        if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0) or event_id in self.seen:
+            return False
+        self._unsaved.append((event_id, lat, lng, rating, sentiment, category))
+        self.seen[event_id] = None
+        if len(self.seen) > self.max_seen:
+            self.seen.popitem(last=False)
+        geohash = encode(lat, lng, self.precisions[-1])
+        for precision in self.precisions:
+            key = geohash[:precision]
+            cell = self.cells[precision].get(key)
+            if cell is None:
+                cell = self.cells[precision][key] = [0.0] * CELL_WIDTH
+            cell[COUNT] += 1
+            cell[RATING_SUM] += rating
+            if sentiment == POSITIVE:
+                cell[POS_SCORE] += rating
+            elif sentiment == NEGATIVE:
+                cell[NEG_SCORE] += 6 - rating
+            cell[LAT_SUM] += lat
+            cell[LNG_SUM] += lng
+            cell[SENT0 + sentiment] += 1
+            cell[CAT0 + category] += 1
+        self.added += 1
+        return True
+
+    def add_batch(self, batch: PostBatch, locate: Callable[[str], tuple[float, float] | None]) -> int:
+        """
+        Count every scored row of `batch` not counted before. Coordinates come
+        from `locate(text)`, not the batch: a row's location may be the query's
+        location hint, which says nothing about where the post is from.
+        """
+        added = 0
+        for row, post_id in enumerate(batch.ids):
+            event_id = f"{batch.sources[row] or 'reddit'}:{post_id}"
+            if event_id in self.seen:
+                continue
+            point = locate(batch.text(row))
+            if point is not None:
+                added += self.add(event_id, point[0], point[1], batch.ratings[row], batch.sentiments[row], batch.categories[row])
+        return added
+
+    def precision_for_zoom(self, zoom: float) -> int:
+        """Roughly one geohash character per 2.5 web-map zoom levels, snapped to a stored precision."""
+        target = max(1, int(zoom / 2.5) + 1)
+        fitting = [p for p in self.precisions if p <= target]
+        return fitting[-1] if fitting else self.precisions[0]
+
+    def query(self, bbox: tuple[float, float, float, float], zoom: float, limit: int) -> dict[str, Any]:
+        """
+        Cells intersecting bbox (west, south, east, north) at the zoom's precision,
+        largest first. A viewport covering fewer grid cells than are stored looks
+        each one up directly; a wider one scans the stored cells. Safe to call
+        from a worker thread.
+        """
+        west, south, east, north = bbox
+        precision = self.precision_for_zoom(zoom)
+        rows, cols, dlat, dlng = _covering(bbox, precision)
+        hits: list[tuple[str, list[float], tuple[float, float, float, float]]] = []
+        with self.lock:
+            stored = self.cells[precision]
+            if len(rows) * len(cols) <= len(stored):
+                for lat_i in rows:
+                    for lng_i in cols:
+                        geohash = _from_grid(lat_i, lng_i, precision)
+                        cell = stored.get(geohash)
+                        if cell is not None:
+                            s, w = -90.0 + lat_i * dlat, -180.0 + lng_i * dlng
+                            hits.append((geohash, cell, (s, w, s + dlat, w + dlng)))
+                scan = []
+            else:
+                scan = list(stored.items())
+        for geohash, cell in scan:
+            s, w, n, e = bounds(geohash)
+            if n >= south and s <= north and e >= west and w <= east:
+                hits.append((geohash, cell, (s, w, n, e)))
+        hits.sort(key=lambda hit: -hit[1][COUNT])
+        cells = [self._cell(geohash, cell, box, precision) for geohash, cell, box in hits[:limit]]
+        return {
+            "precision": precision,
+            "total_cells": len(hits),
+            "total_count": int(sum(hit[1][COUNT] for hit in hits)),
+            "cells": cells,
+        }
+
+    @staticmethod
+    def _cell(geohash: str, cell: list[float], box: tuple[float, float, float, float], precision: int) -> dict[str, Any]:
+        count = cell[COUNT]
+        return {
+            "geohash": geohash,
+            "precision": precision,
+            "latitude": round(cell[LAT_SUM] / count, 5),
+            "longitude": round(cell[LNG_SUM] / count, 5),
+            "bounds": [round(v, 5) for v in box],
+            "count": int(count),
+            "csi": _csi(cell),
+            "avg_rating": round(cell[RATING_SUM] / count, 2),
+            "sentiments": {name: int(cell[SENT0 + i]) for i, name in enumerate(SENTIMENTS)},
+            "categories": {name: int(cell[CAT0 + i]) for i, name in enumerate(CATEGORIES) if cell[CAT0 + i]},
+        }
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "precisions": self.precisions,
+            "cells": {str(p): len(cells) for p, cells in self.cells.items()},
+            "seen_ids": len(self.seen),
+            "added": self.added,
+        }
+
+    # --------------------------- persistence ---------------------------
+    def save(self, path: str) -> None:
+        state = {
+            "precisions": self.precisions,
+            "cells": {str(p): cells for p, cells in self.cells.items()},
+            "seen": list(self.seen),
+        }
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(state, fh, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def load(self, path: str, quiet: bool = False) -> bool:
+        try:
+            with open(path, encoding="utf-8") as fh:
+                state = json.load(fh)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as exc:
+            LOGGER.warning("Ignoring unreadable geo snapshot %s: %s", path, exc)
+            return False
+        if state.get("precisions") != self.precisions:
+            LOGGER.warning("Geo snapshot %s has precisions %s, not %s; run `python -m app.geo rebuild`.", path, state.get("precisions"), self.precisions)
+            return False
+        self.cells = {p: state["cells"].get(str(p), {}) for p in self.precisions}
+        self.seen = OrderedDict((event_id, None) for event_id in state.get("seen", [])[-self.max_seen:])
+        if not quiet:
+            LOGGER.info("Loaded geo cells from %s: %s", path, self.snapshot()["cells"])
+        return True
+
+    def merge_save(self, path: str) -> int:
+        """
+        Add the items counted since the last call to the snapshot at `path`
+        (re-read under an exclusive flock, so other workers' saves are kept) and
+        adopt the merged cells. Returns the number of items written.
+        """
+        with self.lock:
+            events, self._unsaved = self._unsaved, []
+        try:
+            with open(f"{path}.lock", "a") as lock:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+                merged = GeoStore(self.precisions, self.max_seen)
+                merged.load(path, quiet=True)
+                for event in events:
+                    merged._add(*event)
+                merged.save(path)
+        except Exception:
+            with self.lock:
+                self._unsaved = events + self._unsaved
+            raise
+        with self.lock:
+            # Items counted while the file was written stay unsaved for the next call.
+            merged._unsaved = []
+            for event in self._unsaved:
+                merged._add(*event)
+            self.cells, self.seen, self._unsaved = merged.cells, merged.seen, merged._unsaved
+        return len(events)
+
+
+_STORE: GeoStore | None = None
+_STORE_LOCK = threading.Lock()
+
+
+def _precisions(raw: str) -> list[int]:
+    return [int(p) for p in raw.split(",") if p.strip().isdigit()]
+
+
+def get_store(settings: Settings) -> GeoStore | None:
+    global _STORE
+    if not settings.GEO_ENABLED:
+        return None
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = GeoStore(_precisions(settings.GEO_PRECISIONS), settings.GEO_MAX_SEEN)
+            if settings.GEO_SNAPSHOT_PATH:
+                _STORE.load(settings.GEO_SNAPSHOT_PATH)
+        return _STORE
+
+
+def observe_batch(batch: PostBatch, locate: Callable[[str], tuple[float, float] | None], settings: Settings) -> None:
+    store = get_store(settings)
+    if store is not None:
+        store.add_batch(batch, locate)
+
+
+def observe(event_id: str, lat: float | None, lng: float | None, rating: int, sentiment: str, category: str, settings: Settings) -> None:
+    store = get_store(settings)
+    if store is not None and lat is not None and lng is not None:
+        store.add(event_id, lat, lng, rating, SENTIMENTS.index(sentiment), CATEGORIES.index(category))
+
+
+_SAVER: asyncio.Task | None = None
+
+
+async def _save_periodically(store: GeoStore, path: str, interval_s: float) -> None:
+    while True:
+        await asyncio.sleep(interval_s)
+        try:
+            await asyncio.to_thread(store.merge_save, path)
+        except (OSError, ValueError) as exc:
+            LOGGER.warning("Geo snapshot save failed: %s", exc)
+
+
+def start(settings: Settings) -> None:
+    """Save the cells every GEO_SAVE_INTERVAL_S, so a crash loses at most one interval."""
+    global _SAVER
+    store = get_store(settings)
+    if store is None or not settings.GEO_SNAPSHOT_PATH or settings.GEO_SAVE_INTERVAL_S <= 0 or _SAVER is not None:
+        return
+    _SAVER = asyncio.get_running_loop().create_task(
+        _save_periodically(store, settings.GEO_SNAPSHOT_PATH, settings.GEO_SAVE_INTERVAL_S)
+    )
+
+
+async def stop(settings: Settings) -> None:
+    global _SAVER
+    if _SAVER is not None:
+        _SAVER.cancel()
+        _SAVER = None
+    if _STORE is not None and settings.GEO_SNAPSHOT_PATH:
+        await asyncio.to_thread(_STORE.merge_save, settings.GEO_SNAPSHOT_PATH)
+
+
+# --------------------------- CLI ---------------------------
+async def _rebuild(store: GeoStore, settings: Settings) -> None:
+    from .export import iter_collection
+    from .services import _heuristic_category, _heuristic_rating, _infer_location, _sentiment_from_rating
+
+    def add(event_id: str, text: str, hint: str | None, rating: int, sentiment: str, category: str) -> None:
+        # Only feedback hints are the author's own location; Reddit posts are located from their text.
+        location = _infer_location(text, {}, hint if event_id.startswith("feedback:") else None)
+        if location is not None and location.latitude is not None and location.longitude is not None:
+            store.add(event_id, location.latitude, location.longitude, rating, SENTIMENTS.index(sentiment), CATEGORIES.index(category))
+
+    # Scored /analyze sentiments first, so feedback they covered keeps its LLM rating.
+    async for records in iter_collection("sentiments", settings):
+        for rec in records:
+            post = rec.get("post") or {}
+            if rec.get("sentiment") not in SENTIMENTS or rec.get("category") not in CATEGORIES:
+                continue
+            source = post.get("source") or "reddit"
+            add(
+                f"{source}:{post.get('id')}", str(post.get("text") or ""), (post.get("location") or {}).get("raw"),
+                int(rec.get("rating") or 3), rec["sentiment"], rec["category"],
+            )
+    async for records in iter_collection("feedback", settings):
+        for rec in records:
+            text = str(rec.get("text") or "")
+            rating = _heuristic_rating(text)
+            add(f"feedback:{rec.get('id')}", text, rec.get("location_hint") or None, rating, _sentiment_from_rating(rating), _heuristic_category(text))
+
+
+def main(argv: list[str] | None = None) -> int:
+    from .config import get_settings
+
+    parser = argparse.ArgumentParser(description="Rebuild or inspect the geohash sentiment cells.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("rebuild", help="Recount every recorded sentiment and feedback item from Firebase.")
+    sub.add_parser("stats")
+    args = parser.parse_args(argv)
+
+    settings = get_settings()
+    if not settings.GEO_SNAPSHOT_PATH:
+        print("GEO_SNAPSHOT_PATH is not set", file=sys.stderr)
+        return 1
+    if args.cmd == "rebuild":
+        store = GeoStore(_precisions(settings.GEO_PRECISIONS), settings.GEO_MAX_SEEN)
+        asyncio.run(_rebuild(store, settings))
+        store.save(settings.GEO_SNAPSHOT_PATH)
+    else:
+        store = get_store(settings)
+        assert store is not None
+    print(json.dumps(store.snapshot()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import math
+import time
+from collections import Counter, deque
+from typing import Any
+
+from .config import Settings
+from .search import tokenize
+
+LOGGER = logging.getLogger("sentiment-incidents")
+
+# Terms kept per incident centroid; enough to describe an outage, small enough
+# that matching a new item against every open incident stays cheap.
+CENTROID_TERMS = 64
+# Every complaint names the carrier; left in, these terms alone would make an
+# outage report and a billing complaint look alike.
+BRAND_TERMS = frozenset({"t", "mobile", "tmobile", "tmo", "magenta"})
+
+
+def vectorize(text: str) -> dict[str, float]:
+    return _unit(Counter(t for t in tokenize(text) if t not in BRAND_TERMS))
+
+
+def _unit(counts: Counter[str]) -> dict[str, float]:
+    norm = math.sqrt(sum(v * v for v in counts.values()))
+    return {t: v / norm for t, v in counts.items()} if norm else {}
+
+
+class Incident:
+    """
+    A cluster of similar feedback from one place within a time window.
+
+    The first member to claim it runs the LLM analysis; everyone else waits for
+    that analysis and reuses it. If the claimant fails, the next waiter claims.
+    `claimant` is the token of the current claim, so only its holder releases it.
+    """
+
+    def __init__(self, incident_id: str, location: str, category: str, now: float) -> None:
+        self.id = incident_id
+        self.location = location
+        self.category = category
+        self.first_seen = now
+        self.last_seen = now
+        self.size = 0
+        self.centroid: dict[str, float] = {}
+        self.norm = 0.0
+        self.analysis: dict[str, Any] | None = None
+        self.claimant: object | None = None
+        self.ready = asyncio.Event()
+
+    def similarity(self, vector: dict[str, float]) -> float:
+        if not self.norm:
+            return 0.0
+        return sum(w * self.centroid.get(t, 0.0) for t, w in vector.items()) / self.norm
+
+    def absorb(self, vector: dict[str, float], now: float) -> None:
+        for term, weight in vector.items():
+            self.centroid[term] = self.centroid.get(term, 0.0) + weight
+        if len(self.centroid) > CENTROID_TERMS:
+            top = sorted(self.centroid.items(), key=lambda kv: kv[1], reverse=True)[:CENTROID_TERMS]
+            self.centroid = dict(top)
+        self.norm = math.sqrt(sum(w * w for w in self.centroid.values()))
+        self.size += 1
+        self.last_seen = now
+
+    def summary(self, status: str) -> dict[str, Any]:
+        analysis = self.analysis or {}
+        routing = analysis.get("routing") or {}
+        return {
+            "id": self.id,
+            "status": status,
+            "problem": analysis.get("problem") or "Analysis pending",
+            "location": self.location,
+            "category": self.category,
+            "team": routing.get("team"),
+            "priority": routing.get("priority"),
+            "size": self.size,
+            "first_seen": int(self.first_seen),
+            "last_seen": int(self.last_seen),
+        }
+
+
+class IncidentTracker:
+    """
+    Incremental clustering of incoming feedback into open incidents.
+
+    An item joins the most similar open incident (cosine over tokens against the
+    incident centroid) in the same location whose last member arrived within
+    INCIDENT_WINDOW_S; otherwise it opens a new one. Idle incidents are closed
+    lazily and kept in a short history for the dashboard.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self.threshold = settings.INCIDENT_SIMILARITY
+        self.window_s = settings.INCIDENT_WINDOW_S
+        self.max_open = max(1, settings.INCIDENT_MAX_OPEN)
+        self.open: dict[str, Incident] = {}
+        self.closed: deque[Incident] = deque(maxlen=max(1, settings.INCIDENT_HISTORY))
+        self._ids = itertools.count(1)
+        self.assigned = 0
+        self.opened = 0
+        self.reused = 0
+
+    def _expire(self, now: float) -> None:
+        for incident in [i for i in self.open.values() if now - i.last_seen > self.window_s]:
+            self._close(incident)
+
+    def _close(self, incident: Incident) -> None:
+        self.open.pop(incident.id, None)
+        self.closed.append(incident)
+
+    def assign(self, text: str, location: str | None, category: str, now: float | None = None) -> Incident | None:
+        """
+        Attach `text` to a matching open incident or open a new one. None when the
+        item cannot be clustered: no location (reports from anywhere are not one
+        incident) or no usable terms. Only items of the same category match.
+        """
+        if location is None:
+            return None
+        vector = vectorize(text)
+        if not vector:
+            return None
+        now = time.time() if now is None else now
+        self._expire(now)
+        best, best_sim = None, self.threshold
+        for incident in self.open.values():
+            if incident.location != location or incident.category != category:
+                continue
+            sim = incident.similarity(vector)
+            if sim >= best_sim:
+                best, best_sim = incident, sim
+        if best is None:
+            if len(self.open) >= self.max_open:
+                self._close(min(self.open.values(), key=lambda i: i.last_seen))
+            best = Incident(f"inc-{int(now)}-{next(self._ids)}", location, category, now)
+            self.open[best.id] = best
+            self.opened += 1
+        best.absorb(vector, now)
+        self.assigned += 1
+        return best
+
+    async def shared_analysis(self, incident: Incident, timeout: float) -> tuple[dict[str, Any] | None, object | None]:
+        """
+        `(analysis, None)` once the incident's analysis is available. Otherwise the
+        caller runs the analysis itself: `(None, claim)` when it now holds the
+        claim (it is first, or the previous claimant failed), `(None, None)` when
+        waiting took longer than `timeout`. Callers that get None must call
+        `settle` with the claim they got when done.
+        """
+        deadline = time.monotonic() + timeout
+        while incident.analysis is None:
+            if incident.claimant is None:
+                incident.claimant = claim = object()
+                return None, claim
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None, None
+            try:
+                await asyncio.wait_for(incident.ready.wait(), remaining)
+            except asyncio.TimeoutError:
+                return None, None
+        self.reused += 1
+        return incident.analysis, None
+
+    def settle(self, incident: Incident, analysis: dict[str, Any] | None, claim: object | None) -> None:
+        """
+        Publish an analysis to waiters. A failed claimant hands the claim to the
+        next waiter; a caller that gave up waiting never releases someone else's.
+        """
+        if incident.analysis is not None:
+            return
+        if analysis is None and (claim is None or claim is not incident.claimant):
+            return
+        if analysis is not None:
+            incident.analysis = analysis
+        incident.claimant = None
+        ready, incident.ready = incident.ready, asyncio.Event()
+        ready.set()
+
+    def summaries(self, limit: int, include_closed: bool = True) -> list[dict[str, Any]]:
+        self._expire(time.time())
+        items = [i.summary("open") for i in sorted(self.open.values(), key=lambda i: (-i.size, -i.last_seen))]
+        if include_closed:
+            items += [i.summary("closed") for i in sorted(self.closed, key=lambda i: -i.last_seen)]
+        return items[:limit]
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "open": len(self.open),
+            "closed": len(self.closed),
+            "assigned": self.assigned,
+            "opened": self.opened,
+            "reused": self.reused,
+        }
+
+
+_TRACKER: IncidentTracker | None = None
+
+
+def get_tracker(settings: Settings) -> IncidentTracker | None:
+    global _TRACKER
+    if not settings.INCIDENTS_ENABLED:
+        return None
+    if _TRACKER is None:
+        _TRACKER = IncidentTracker(settings)
+    return _TRACKER
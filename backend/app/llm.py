@@ -0,0 +1,456 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+from . import profiling, tracing
+from .config import Settings
+from .prompts import estimate_message_tokens, estimate_tokens
+
+LOGGER = logging.getLogger("sentiment-llm")
+
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "0.0.0.0")
+
+
+def is_local_endpoint(base_url: str | None) -> bool:
+    return bool(base_url and any(host in base_url for host in LOCAL_HOSTS))
+
+
+# --------------------------- Circuit breaker ---------------------------
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures; open -> half-open
+    after `reset_timeout_s`, where a single trial call decides whether to close again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout_s: float) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout_s = reset_timeout_s
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and self.opened_at is not None and time.monotonic() - self.opened_at >= self.reset_timeout_s:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    LOGGER.warning("Circuit opened after %s failures.", self.failures)
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+# --------------------------- Providers ---------------------------
+def _is_outage(exc: BaseException) -> bool:
+    """
+    Whether `exc` says the provider is unhealthy: a timeout, a connection error,
+    a 5xx or a 429. Anything else (a bad request, a rejected key, a response we
+    failed to parse) is the caller's problem and must not open the breaker.
+    """
+    import httpx
+    import openai
+
+    if isinstance(exc, (openai.APIConnectionError, httpx.TransportError, TimeoutError, ConnectionError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code >= 500 or exc.status_code == 429
+    return False
+
+
+class Provider:
+    """One OpenAI-compatible endpoint with its own breaker and latency window."""
+
+    def __init__(self, name: str, base_url: str, api_key: str, model: str, settings: Settings) -> None:
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.breaker = CircuitBreaker(settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_RESET_S)
+        self.latencies: deque[float] = deque(maxlen=200)
+        self.calls = 0
+        self.errors = 0
+        self._client: Any = None
+
+    def _get_client(self) -> Any:
+        if self._client is None:
+            from openai import OpenAI
+
+            # Retries are handled by failover across providers, not inside the SDK.
+            self._client = OpenAI(base_url=self.base_url, api_key=self.api_key, max_retries=0)
+        return self._client
+
+    def latency_quantile(self, q: float) -> float | None:
+        if len(self.latencies) < 10:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(q * (len(ordered) - 1))]
+
+    def complete(self, messages: list[dict[str, str]], timeout_s: float, params: dict[str, Any]) -> Any:
+        t0 = time.perf_counter()
+        self.calls += 1
+        try:
+            completion = self._get_client().with_options(timeout=timeout_s).chat.completions.create(
+                model=self.model, messages=messages, **params
+            )
+        except Exception as exc:
+            self.errors += 1
+            self._record_error(exc)
+            raise
+        self.latencies.append(time.perf_counter() - t0)
+        self.breaker.record_success()
+        return completion
+
+    def _record_error(self, exc: Exception) -> None:
+        if _is_outage(exc):
+            self.breaker.record_failure()
+        else:
+            # The endpoint answered; the request was at fault. This also ends a
+            # half-open trial, which would otherwise block every later call.
+            self.breaker.record_success()
+
+    def stream(
+        self,
+        messages: list[dict[str, str]],
+        deadline: float,
+        params: dict[str, Any],
+        on_text: Callable[[str], None],
+    ) -> tuple[str, bool]:
+        """
+        Stream a completion, passing each text delta to `on_text`. Returns the text
+        received and whether the stream finished; a stream that breaks or passes
+        `deadline` (time.monotonic) after producing text returns what it has.
+        """
+        t0 = time.perf_counter()
+        self.calls += 1
+        parts: list[str] = []
+        finished = False
+        try:
+            stream = self._get_client().with_options(timeout=max(0.5, deadline - time.monotonic())).chat.completions.create(
+                model=self.model, messages=messages, stream=True, **params
+            )
+            with stream:
+                for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        parts.append(delta)
+                        on_text(delta)
+                    if time.monotonic() > deadline:
+                        break
+                else:
+                    finished = True
+        except Exception as exc:
+            if not parts:
+                self.errors += 1
+                self._record_error(exc)
+                raise
+            LOGGER.warning("Stream from %s broke after %s chunks; keeping partial output.", self.name, len(parts))
+        self.latencies.append(time.perf_counter() - t0)
+        self.breaker.record_success()
+        return "".join(parts), finished
+
+    def snapshot(self) -> dict[str, Any]:
+        p50 = self.latency_quantile(0.5)
+        p90 = self.latency_quantile(0.9)
+        return {
+            "name": self.name,
+            "model": self.model,
+            "base_url": self.base_url,
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "calls": self.calls,
+            "errors": self.errors,
+            "p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "p90_ms": round(p90 * 1000) if p90 is not None else None,
+        }
+
+
+_PROVIDERS: dict[tuple[str, str, str, str], Provider] = {}
+_PROVIDERS_LOCK = threading.Lock()
+
+
+def _provider(name: str, base_url: str, api_key: str, model: str, settings: Settings) -> Provider:
+    # Keyed by endpoint config so breaker/latency state survives across requests.
+    key = (name, base_url, model, api_key)
+    with _PROVIDERS_LOCK:
+        if key not in _PROVIDERS:
+            _PROVIDERS[key] = Provider(name, base_url, api_key, model, settings)
+        return _PROVIDERS[key]
+
+
+def configured_providers(settings: Settings, prefer: str | None = None) -> list[Provider]:
+    available: dict[str, Provider] = {}
+    if settings.NEMOTRON_API_KEY or is_local_endpoint(settings.NEMOTRON_BASE_URL):
+        available["nemotron"] = _provider(
+            "nemotron", settings.NEMOTRON_BASE_URL, settings.NEMOTRON_API_KEY or "sk-local", settings.NEMOTRON_MODEL, settings
+        )
+    if settings.OPENROUTER_API_KEY:
+        available["openrouter"] = _provider(
+            "openrouter", settings.OPENROUTER_BASE_URL, settings.OPENROUTER_API_KEY, settings.OPENROUTER_MODEL, settings
+        )
+    if settings.LLM_LOCAL_BASE_URL and settings.LLM_LOCAL_MODEL:
+        available["local"] = _provider(
+            "local", settings.LLM_LOCAL_BASE_URL, settings.LLM_LOCAL_API_KEY or "sk-local", settings.LLM_LOCAL_MODEL, settings
+        )
+    order = [n.strip() for n in settings.LLM_PROVIDER_ORDER.split(",") if n.strip()]
+    if prefer:
+        order = [prefer, *[n for n in order if n != prefer]]
+    return [available[n] for n in order if n in available]
+
+
+def provider_status(settings: Settings) -> list[dict[str, Any]]:
+    configured_providers(settings)
+    with _PROVIDERS_LOCK:
+        return [p.snapshot() for p in _PROVIDERS.values()]
+
+
+# --------------------------- Token accounting ---------------------------
+class UsageMeter:
+    """
+    Token and latency counters per (operation, route), plus per-operation daily
+    token totals checked against LLM_DAILY_TOKEN_BUDGETS. Providers that report
+    no `usage` (e.g. streams) are counted from a characters/4 estimate.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.totals: dict[tuple[str, str], dict[str, Any]] = {}
+        self.daily: dict[str, int] = {}
+        self.day = ""
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    def _roll(self) -> None:
+        today = self._today()
+        if today != self.day:
+            self.day = today
+            self.daily = {}
+
+    def over_budget(self, operation: str, settings: Settings) -> bool:
+        budget = _daily_budgets(settings.LLM_DAILY_TOKEN_BUDGETS).get(operation)
+        if not budget:
+            return False
+        with self._lock:
+            self._roll()
+            return self.daily.get(operation, 0) >= budget
+
+    def record(self, operation: str, prompt_tokens: int, completion_tokens: int, latency_s: float, estimated: bool = False) -> None:
+        key = (operation, tracing.current_route() or "-")
+        with self._lock:
+            self._roll()
+            entry = self.totals.get(key)
+            if entry is None:
+                entry = self.totals[key] = {
+                    "calls": 0,
+                    "estimated_calls": 0,
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "latency_ms_total": 0,
+                    "latency_ms_max": 0,
+                }
+            entry["calls"] += 1
+            entry["estimated_calls"] += int(estimated)
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+            latency_ms = int(latency_s * 1000)
+            entry["latency_ms_total"] += latency_ms
+            entry["latency_ms_max"] = max(entry["latency_ms_max"], latency_ms)
+            self.daily[operation] = self.daily.get(operation, 0) + prompt_tokens + completion_tokens
+
+    def record_completion(self, operation: str, messages: list[dict[str, str]], completion: Any, latency_s: float) -> None:
+        usage = getattr(completion, "usage", None)
+        if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+            self.record(operation, usage.prompt_tokens or 0, usage.completion_tokens or 0, latency_s)
+            return
+        text = (completion.choices[0].message.content or "") if completion.choices else ""
+        self.record(operation, estimate_message_tokens(messages), estimate_tokens(text), latency_s, estimated=True)
+
+    def snapshot(self, settings: Settings) -> dict[str, Any]:
+        budgets = _daily_budgets(settings.LLM_DAILY_TOKEN_BUDGETS)
+        with self._lock:
+            self._roll()
+            routes = [
+                {
+                    "operation": operation,
+                    "route": route,
+                    **entry,
+                    "avg_latency_ms": round(entry["latency_ms_total"] / entry["calls"]) if entry["calls"] else 0,
+                }
+                for (operation, route), entry in sorted(self.totals.items())
+            ]
+            daily = {
+                op: {"tokens": used, "budget": budgets.get(op)}
+                for op, used in {**{op: 0 for op in budgets}, **self.daily}.items()
+            }
+        return {"day": self.day, "daily": daily, "routes": routes}
+
+
+def _daily_budgets(raw: str) -> dict[str, int]:
+    budgets: dict[str, int] = {}
+    for entry in raw.split(","):
+        op, _, limit = entry.partition("=")
+        if op.strip() and limit.strip().isdigit():
+            budgets[op.strip()] = int(limit)
+    return budgets
+
+
+USAGE = UsageMeter()
+
+
+# --------------------------- Routing ---------------------------
+async def chat_completion(
+    messages: list[dict[str, str]],
+    settings: Settings,
+    *,
+    operation: str,
+    budget_s: float,
+    prefer: str | None = None,
+    **params: Any,
+) -> Any | None:
+    """
+    Run a chat completion against the first healthy provider within `budget_s`.
+
+    Fails over to the next provider on error or open breaker. With
+    LLM_HEDGE_ENABLED, a second provider is started once the first runs past its
+    own p90 latency and whichever answers first wins. Returns None when every
+    provider failed or the budget ran out; callers fall back to heuristics.
+    """
+    candidates = configured_providers(settings, prefer)
+    if not candidates:
+        return None
+    if USAGE.over_budget(operation, settings):
+        LOGGER.warning("Daily token budget for %s is spent; degrading to heuristics.", operation)
+        return None
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + budget_s
+    queue = list(candidates)
+    started: dict[asyncio.Task, tuple[Provider, float]] = {}
+    pending: set[asyncio.Task] = set()
+
+    def record_usage(task: asyncio.Task) -> None:
+        # Every completion is billed, including losing hedges and calls still running
+        # when the budget ran out, so usage is recorded when each call finishes
+        # rather than only for the winner. Also observes errors of abandoned calls.
+        if task.cancelled() or task.exception() is not None:
+            return
+        USAGE.record_completion(operation, messages, task.result(), loop.time() - started[task][1])
+
+    def launch_next() -> bool:
+        while queue:
+            provider = queue.pop(0)
+            if not provider.breaker.allow():
+                LOGGER.debug("Skipping %s for %s: circuit %s.", provider.name, operation, provider.breaker.state)
+                continue
+            remaining = max(0.5, deadline - loop.time())
+            task = asyncio.ensure_future(profiling.to_thread(provider.complete, messages, remaining, params))
+            task.add_done_callback(record_usage)
+            started[task] = (provider, loop.time())
+            pending.add(task)
+            return True
+        return False
+
+    with tracing.span("llm.route", operation=operation, budget_s=budget_s) as sp:
+        if not launch_next():
+            LOGGER.warning("No healthy LLM provider for %s; degrading to heuristics.", operation)
+            sp.set(outcome="no_provider")
+            return None
+        hedged = False
+        while pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            wait_s = remaining
+            hedge_window = settings.LLM_HEDGE_ENABLED and not hedged and queue and len(pending) == 1
+            if hedge_window:
+                (only,) = pending
+                provider, t_start = started[only]
+                p90 = provider.latency_quantile(0.9)
+                if p90 is not None:
+                    wait_s = min(remaining, max(0.0, t_start + p90 - loop.time()))
+            done, _ = await asyncio.wait(pending, timeout=wait_s, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                pending.discard(task)
+                provider = started[task][0]
+                if task.exception() is None:
+                    completion = task.result()
+                    sp.set(provider=provider.name, hedged=hedged, outcome="ok")
+                    return completion
+                LOGGER.warning("LLM provider %s failed for %s: %s", provider.name, operation, task.exception())
+                if not pending:
+                    launch_next()
+            if not done and hedge_window and wait_s < remaining:
+                LOGGER.info("Hedging %s: primary past its p90; starting next provider.", operation)
+                hedged = launch_next()
+        sp.set(outcome="budget_exceeded" if pending else "all_failed")
+    LOGGER.warning("LLM %s gave no result within %.1fs budget; degrading to heuristics.", operation, budget_s)
+    return None
+
+
+async def stream_completion(
+    messages: list[dict[str, str]],
+    settings: Settings,
+    *,
+    operation: str,
+    budget_s: float,
+    on_text: Callable[[str], None],
+    prefer: str | None = None,
+    **params: Any,
+) -> str | None:
+    """
+    Streaming counterpart of `chat_completion`. `on_text` runs in the worker
+    thread for every delta. Providers are tried in order until one produces
+    output; there is no hedging because a stream cannot be taken back once its
+    text has been handed on. Returns the (possibly partial) text, or None.
+    """
+    if USAGE.over_budget(operation, settings):
+        LOGGER.warning("Daily token budget for %s is spent; degrading to heuristics.", operation)
+        return None
+    t0 = time.monotonic()
+    deadline = t0 + budget_s
+    with tracing.span("llm.route", operation=operation, budget_s=budget_s, stream=True) as sp:
+        for provider in configured_providers(settings, prefer):
+            if time.monotonic() >= deadline:
+                break
+            if not provider.breaker.allow():
+                continue
+            try:
+                text, finished = await profiling.to_thread(provider.stream, messages, deadline, params, on_text)
+            except Exception as exc:
+                LOGGER.warning("LLM provider %s failed for %s: %s", provider.name, operation, exc)
+                continue
+            USAGE.record(
+                operation, estimate_message_tokens(messages), estimate_tokens(text), time.monotonic() - t0, estimated=True
+            )
+            sp.set(provider=provider.name, outcome="ok" if finished else "partial")
+            return text
+        sp.set(outcome="all_failed")
+    LOGGER.warning("LLM %s stream gave no result within %.1fs budget; degrading to heuristics.", operation, budget_s)
+    return None
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import json
+import logging
+import re
+from typing import Any
+
+LOGGER = logging.getLogger("sentiment-llm-json")
+
+_ITEMS_KEY_RE = re.compile(r'^\s*"items"\s*:\s*$')
+
+
+class IncrementalJSONParser:
+    """
+    Tolerant, incremental parser for the first top-level JSON object in LLM output.
+
+    Anything before the first `{` (```json fences, "Here is the JSON:") and after
+    its matching `}` is ignored. Every top-level member is parsed as soon as it
+    completes, and each element of a top-level `items` array is returned from
+    `feed()` the moment its closing brace arrives, so a response cut off at
+    `max_tokens` still yields every complete item.
+    """
+
+    def __init__(self) -> None:
+        self.buf = ""
+        self.pos = 0
+        self.root_start = -1
+        self.done = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.member_start = -1
+        self.in_items = False
+        self.element_start = -1
+        self.members: dict[str, Any] = {}
+        self.items: list[dict[str, Any]] = []
+
+    def _close_member(self, end: int) -> None:
+        fragment = self.buf[self.member_start:end].strip()
+        if fragment:
+            try:
+                self.members.update(json.loads("{" + fragment + "}"))
+            except json.JSONDecodeError:
+                LOGGER.debug("Skipping malformed top-level member: %.60s", fragment)
+        self.in_items = False
+
+    def feed(self, chunk: str) -> list[dict[str, Any]]:
+        if self.done or not chunk:
+            return []
+        self.buf += chunk
+        emitted: list[dict[str, Any]] = []
+        buf = self.buf
+        i = self.pos
+        n = len(buf)
+        while i < n:
+            ch = buf[i]
+            if self.root_start < 0:
+                if ch == "{":
+                    self.root_start = i
+                    self.depth = 1
+                    self.member_start = i + 1
+                i += 1
+                continue
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                i += 1
+                continue
+            if ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                if self.depth == 1 and ch == "[" and _ITEMS_KEY_RE.match(buf[self.member_start:i]):
+                    self.in_items = True
+                elif self.depth == 2 and self.in_items and ch == "{":
+                    self.element_start = i
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 2 and self.in_items and ch == "}" and self.element_start >= 0:
+                    try:
+                        item = json.loads(buf[self.element_start : i + 1])
+                    except json.JSONDecodeError:
+                        item = None
+                    if isinstance(item, dict):
+                        self.items.append(item)
+                        emitted.append(item)
+                    self.element_start = -1
+                elif self.depth == 0:
+                    self._close_member(i)
+                    self.done = True
+                    i += 1
+                    break
+            elif ch == "," and self.depth == 1:
+                self._close_member(i)
+                self.member_start = i + 1
+            i += 1
+        self.pos = i
+        return emitted
+
+    def result(self) -> dict[str, Any]:
+        """Everything recovered so far; `items` holds each complete element even if the array never closed."""
+        out = dict(self.members)
+        if self.items and not isinstance(out.get("items"), list):
+            out["items"] = list(self.items)
+        return out
+
+
+def extract_json(text: str) -> dict[str, Any]:
+    """Parse the first JSON object in `text`, salvaging what is complete if it was truncated."""
+    parser = IncrementalJSONParser()
+    parser.feed(text or "")
+    if not parser.done and parser.root_start >= 0:
+        LOGGER.info("Salvaged truncated JSON: %s complete items, members=%s", len(parser.items), sorted(parser.members))
+    return parser.result()
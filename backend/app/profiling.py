@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+import weakref
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, Callable, TypeVar
+
+from .config import Settings
+
+LOGGER = logging.getLogger("sentiment-profiling")
+
+T = TypeVar("T")
+
+MAX_STACK_DEPTH = 128
+# Profile ids become file names under PROFILE_OUTPUT_DIR.
+PROFILE_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class Profile:
+    """
+    Wall-clock sampling profile for one request.
+
+    Samples the event loop thread plus any `to_thread` worker running on behalf
+    of the request. Samples are taken whether the thread is on-CPU or blocked,
+    so time spent waiting on Reddit/Firebase/LLM I/O shows up as well.
+
+    The loop is shared with every other request, so a loop sample only counts
+    while one of this request's tasks is running: the task that started the
+    profile and the tasks created under it (see `_task_factory`). Time the loop
+    spends idle or on other requests is left out.
+    """
+
+    def __init__(self, profile_id: str, name: str, interval_s: float) -> None:
+        self.profile_id = profile_id
+        self.name = name
+        self.interval_s = interval_s
+        self.started_at = time.perf_counter()
+        self.duration_ms = 0.0
+        self._threads: dict[int, str] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_tid: int | None = None
+        self._tasks: weakref.WeakSet[asyncio.Task] = weakref.WeakSet()
+        self._lock = threading.Lock()
+        # (thread label, frame, frame, ...) root-first -> accumulated wall ms
+        self.stacks: dict[tuple[str, ...], float] = defaultdict(float)
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._run, name=f"profiler-{profile_id}", daemon=True)
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_tid = threading.get_ident()
+        task = asyncio.current_task()
+        if task is not None:
+            self.adopt(task)
+        self.track(self._loop_tid, "event-loop")
+        self._sampler.start()
+
+    def adopt(self, task: asyncio.Task) -> None:
+        """Count loop samples taken while `task` runs toward this profile."""
+        with self._lock:
+            self._tasks.add(task)
+
+    def _owns_loop(self) -> bool:
+        task = asyncio.current_task(self._loop)
+        with self._lock:
+            return task is not None and task in self._tasks
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._sampler.join()
+        self.duration_ms = (time.perf_counter() - self.started_at) * 1000
+
+    def track(self, tid: int, label: str) -> None:
+        with self._lock:
+            self._threads[tid] = label
+
+    def untrack(self, tid: int) -> None:
+        with self._lock:
+            self._threads.pop(tid, None)
+
+    def run_tracked(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        tid = threading.get_ident()
+        self.track(tid, "worker")
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.untrack(tid)
+
+    @staticmethod
+    def _frame_name(frame: Any) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval_s):
+            now = time.perf_counter()
+            weight_ms = (now - last) * 1000
+            last = now
+            with self._lock:
+                tracked = list(self._threads.items())
+            frames = sys._current_frames()
+            for tid, label in tracked:
+                if tid == self._loop_tid and not self._owns_loop():
+                    continue
+                frame = frames.get(tid)
+                stack: list[str] = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(self._frame_name(frame))
+                    frame = frame.f_back
+                if stack:
+                    stack.append(label)
+                    self.stacks[tuple(reversed(stack))] += weight_ms
+
+    # --------------------------- Output formats ---------------------------
+    def to_collapsed(self) -> str:
+        """Brendan Gregg collapsed stacks; values are wall-clock microseconds."""
+        lines = [f"{';'.join(stack)} {int(ms * 1000)}" for stack, ms in self.stacks.items()]
+        return "\n".join(sorted(lines)) + "\n"
+
+    def to_speedscope(self) -> dict[str, Any]:
+        frame_index: dict[str, int] = {}
+        frames: list[dict[str, Any]] = []
+        per_thread: dict[str, tuple[list[list[int]], list[float]]] = {}
+        for stack, ms in self.stacks.items():
+            label, *names = stack
+            idxs: list[int] = []
+            for name in names:
+                if name not in frame_index:
+                    frame_index[name] = len(frames)
+                    frames.append({"name": name})
+                idxs.append(frame_index[name])
+            samples, weights = per_thread.setdefault(label, ([], []))
+            samples.append(idxs)
+            weights.append(round(ms, 3))
+        profiles = [
+            {
+                "type": "sampled",
+                "name": f"{self.name} [{label}]",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 3),
+                "samples": samples,
+                "weights": weights,
+            }
+            for label, (samples, weights) in per_thread.items()
+        ]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "t-sentiment-api",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+
+_ACTIVE: ContextVar[Profile | None] = ContextVar("active_profile", default=None)
+
+
+def _task_factory(loop: asyncio.AbstractEventLoop, coro: Any, **kwargs: Any) -> asyncio.Task:
+    # Tasks created while a profile is active (gathers, hedges, call_next) belong
+    # to its request; the factory runs in the creator's context, so _ACTIVE tells.
+    task = asyncio.Task(coro, loop=loop, **kwargs)
+    prof = _ACTIVE.get()
+    if prof is not None:
+        prof.adopt(task)
+    return task
+
+
+async def to_thread(func: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+    """`asyncio.to_thread` that attributes the worker's time to the active profile, if any."""
+    prof = _ACTIVE.get()
+    if prof is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return await asyncio.to_thread(prof.run_tracked, func, *args, **kwargs)
+
+
+def tracked(func: Callable[[], T]) -> Callable[[], T]:
+    """Wrap `func` for a custom executor so its worker thread is attributed to the active profile."""
+    prof = _ACTIVE.get()
+    if prof is None:
+        return func
+    return lambda: prof.run_tracked(func)
+
+
+def should_profile(path: str, admin_token: str | None, settings: Settings) -> bool:
+    routes = {r.strip() for r in settings.PROFILE_ROUTES.split(",") if r.strip()}
+    if path not in routes:
+        return False
+    if admin_token and settings.PROFILE_ADMIN_TOKEN and admin_token == settings.PROFILE_ADMIN_TOKEN:
+        return True
+    return settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE
+
+
+def new_profile_id() -> str:
+    # Always server-side: a client-chosen id (e.g. X-Request-ID) could name another
+    # request's profile file. The id goes back to the caller in X-Profile-Id.
+    return f"prof-{uuid.uuid4().hex}"
+
+
+def start(profile_id: str, name: str, settings: Settings) -> tuple[Profile, Any]:
+    prof = Profile(profile_id, name, max(0.001, settings.PROFILE_INTERVAL_MS / 1000))
+    loop = asyncio.get_running_loop()
+    if loop.get_task_factory() is None:
+        loop.set_task_factory(_task_factory)
+    elif loop.get_task_factory() is not _task_factory:
+        LOGGER.debug("Event loop has its own task factory; profiling only the request's own task on the loop.")
+    token = _ACTIVE.set(prof)
+    prof.start()
+    return prof, token
+
+
+def _profile_path(profile_id: str, settings: Settings) -> str:
+    if not PROFILE_ID_RE.match(profile_id):
+        raise ValueError(f"Invalid profile id {profile_id!r}")
+    ext = "collapsed.txt" if settings.PROFILE_FORMAT == "collapsed" else "speedscope.json"
+    return os.path.join(settings.PROFILE_OUTPUT_DIR, f"{profile_id}.{ext}")
+
+
+def _write(prof: Profile, settings: Settings) -> str:
+    os.makedirs(settings.PROFILE_OUTPUT_DIR, exist_ok=True)
+    path = _profile_path(prof.profile_id, settings)
+    with open(path, "w", encoding="utf-8") as fh:
+        if settings.PROFILE_FORMAT == "collapsed":
+            fh.write(prof.to_collapsed())
+        else:
+            json.dump(prof.to_speedscope(), fh)
+    return path
+
+
+async def finish(prof: Profile, token: Any, settings: Settings) -> str | None:
+    _ACTIVE.reset(token)
+    prof.stop()
+    try:
+        path = await asyncio.to_thread(_write, prof, settings)
+        LOGGER.info("Stored profile %s (%.0f ms) at %s", prof.profile_id, prof.duration_ms, path)
+        return path
+    except (OSError, ValueError) as exc:
+        LOGGER.warning("Failed to store profile %s: %s", prof.profile_id, exc)
+        return None
+
+
+def load(profile_id: str, settings: Settings) -> str | None:
+    # Refuse anything that could escape the directory.
+    if not PROFILE_ID_RE.match(profile_id or ""):
+        return None
+    path = _profile_path(profile_id, settings)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as fh:
+        return fh.read()
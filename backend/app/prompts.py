@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import html
+import logging
+import re
+from typing import Any
+
+from .config import Settings
+from .schemas import SocialPost
+
+LOGGER = logging.getLogger("sentiment-prompts")
+
+# Fixed instruction block sent as the system message on every enrichment call.
+# Keeping it byte-identical lets providers with prefix caching reuse it.
+ENRICH_INSTRUCTIONS = (
+    "You are an operations analyst for T-Mobile. Respond with valid JSON only. "
+    "For each post: rate customer experience 1 (very negative) to 5 (very positive); "
+    "pick the primary category from [Network Coverage, Customer Service, Billing, Pricing & Plans, "
+    "Device and Equipment, Store Experience, Mobile App, Other]; extract a short location hint if present; "
+    "give a short `insight` phrase and a 1-2 sentence actionable `solution` the user can try now. "
+    'Return {"items": [{id, rating, category, sentiment, location, insight, solution}], "summary": one brief sentence}.'
+)
+
+_QUOTE_RE = re.compile(r"^[ \t]*>.*$", re.MULTILINE)
+_MD_LINK_RE = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+_URL_RE = re.compile(r"(?:https?://|www\.)\S+")
+_MD_MARK_RE = re.compile(r"(\*\*|__|~~|`+|^#{1,6}\s*|^\s*[-*+]\s+|^\s*\d+\.\s+)", re.MULTILINE)
+_BOILERPLATE_RE = re.compile(r"\[(?:deleted|removed)\]|\u200b", re.IGNORECASE)
+_WS_RE = re.compile(r"\s+")
+
+
+def compact_text(text: str) -> str:
+    """Strip quoted replies, markdown, URLs and reddit boilerplate; collapse whitespace."""
+    text = html.unescape(text or "")
+    text = _QUOTE_RE.sub(" ", text)
+    text = _MD_LINK_RE.sub(r"\1", text)
+    text = _URL_RE.sub(" ", text)
+    text = _MD_MARK_RE.sub(" ", text)
+    text = _BOILERPLATE_RE.sub(" ", text)
+    return _WS_RE.sub(" ", text).strip()
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English BPE vocabularies; good enough for budgeting.
+    return (len(text) + 3) // 4
+
+
+def estimate_message_tokens(messages: list[dict[str, str]]) -> int:
+    return sum(estimate_tokens(m.get("content") or "") + 4 for m in messages)
+
+
+def clip_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0 or estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[: max_tokens * 4]
+    space = cut.rfind(" ")
+    if space > len(cut) // 2:
+        cut = cut[:space]
+    return cut + "…"
+
+
+def enrichment_payload(posts: list[SocialPost], settings: Settings) -> list[dict[str, Any]]:
+    """
+    Compact each post to PROMPT_POST_TOKENS and stop adding posts once the
+    request would exceed PROMPT_REQUEST_TOKENS. Posts left out fall back to the
+    heuristics like any other unenriched post.
+    """
+    budget = settings.PROMPT_REQUEST_TOKENS - estimate_tokens(ENRICH_INSTRUCTIONS)
+    payload: list[dict[str, Any]] = []
+    for post in posts:
+        item = {
+            "id": post.id,
+            "text": clip_tokens(compact_text(post.text), settings.PROMPT_POST_TOKENS),
+            "location": post.location.raw if post.location and post.location.raw else "",
+        }
+        # Field names, quoting and separators cost roughly a dozen tokens per item.
+        cost = estimate_tokens(item["text"]) + estimate_tokens(item["location"]) + 12
+        if settings.PROMPT_REQUEST_TOKENS > 0 and cost > budget and payload:
+            LOGGER.info("Prompt budget reached; enriching %s/%s posts.", len(payload), len(posts))
+            break
+        budget -= cost
+        payload.append(item)
+    return payload
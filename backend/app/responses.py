@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import functools
+import json
+from typing import Any, get_args, get_origin
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:  # optional: fall back to the stdlib encoder when orjson is not installed
+    import orjson
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None  # type: ignore[assignment]
+
+
+def _orjson_default(obj: Any) -> Any:
+    # orjson encodes datetimes natively, so python-mode dumps are enough.
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _nested_model(annotation: Any) -> tuple[type[BaseModel] | None, bool]:
+    """The model a field holds, if any, and whether it holds a list of them."""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation, False
+    if get_origin(annotation) is list:
+        args = get_args(annotation)
+        if args and isinstance(args[0], type) and issubclass(args[0], BaseModel):
+            return args[0], True
+    return None, False
+
+
+@functools.lru_cache(maxsize=None)
+def _fields(model: type[BaseModel]) -> tuple[tuple[str, Any, type[BaseModel] | None, bool], ...]:
+    return tuple((name, field, *_nested_model(field.annotation)) for name, field in model.model_fields.items())
+
+
+def project(model: type[BaseModel], data: Any) -> Any:
+    """
+    `data` cut down to `model`'s fields, missing optional ones filled with their
+    defaults, recursing into nested models and lists of them. This matches what
+    `response_model` would emit for data that already has the right types, but
+    does not validate: use it to shape records for FastJSONResponse.
+    """
+    if not isinstance(data, dict):
+        return data
+    out: dict[str, Any] = {}
+    for name, field, nested, many in _fields(model):
+        if name in data:
+            value = data[name]
+        elif field.is_required():
+            continue
+        else:
+            value = field.get_default(call_default_factory=True)
+            if isinstance(value, BaseModel):
+                value = value.model_dump()
+        if nested is not None and value is not None:
+            value = [project(nested, v) for v in value] if many and isinstance(value, list) else project(nested, value)
+        out[name] = value
+    return out
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response for payloads that are already in their final shape.
+
+    Returning it from a route bypasses FastAPI's `response_model` re-validation;
+    use it only for dicts produced by our own normalizers or for models that
+    were already validated when built. Model roots go straight through
+    pydantic-core's serializer; plain payloads through orjson.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.model_dump_json().encode("utf-8")
+        if orjson is not None:
+            return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -76,6 +76,14 @@ class SentimentResponse(BaseModel):
     timings: Optional[AnalysisTimings] = None
 
 
+class BatchSentimentQuery(BaseModel):
+    queries: list[SentimentQuery] = Field(..., min_length=1)
+
+
+class BatchSentimentResponse(BaseModel):
+    results: list[SentimentResponse]
+
+
 class HealthResponse(BaseModel):
     status: str
     timestamp: datetime
@@ -98,10 +106,28 @@ class FeedbackItem(BaseModel):
 
 class ChatRequest(BaseModel):
     message: str
+    # Returned by the previous /chat response; omit to start a new conversation.
+    session_id: Optional[str] = None
 
 
 class ChatResponse(BaseModel):
     reply: str
+    session_id: Optional[str] = None
+    # True when the reply came from the answer cache (app/answers.py), not the LLM.
+    cached: bool = False
+
+
+class PinnedAnswerRequest(BaseModel):
+    question: str = Field(min_length=1)
+    answer: str = Field(min_length=1)
+
+
+class PinnedAnswer(BaseModel):
+    id: str
+    question: str
+    answer: str
+    hits: int = 0
+    created_at: int
 
 
 class EmployeeUpdateRequest(BaseModel):
@@ -181,3 +207,64 @@ class FeedbackAnalysis(BaseModel):
     insights: WorkflowInsights = Field(default_factory=WorkflowInsights)
     analyzed_at: int
     resolved: bool = False
+    incident_id: str | None = None
+    prompt_version: str | None = None
+
+
+class IncidentSummary(BaseModel):
+    id: str
+    status: Literal["open", "closed"]
+    problem: str
+    location: str | None = None
+    category: str | None = None
+    team: str | None = None
+    priority: str | None = None
+    size: int
+    first_seen: int
+    last_seen: int
+
+
+class SpikeAlert(BaseModel):
+    id: int
+    city: str
+    category: str
+    count: int
+    expected: float
+    zscore: float
+    window_s: int
+    window_start: int
+    raised_at: int
+    updated_at: int
+
+
+class SearchHit(BaseModel):
+    id: str
+    score: float
+    preview: str = ""
+
+
+class SearchResponse(BaseModel):
+    query: str
+    total_docs: int
+    took_ms: float
+    results: list[SearchHit] = Field(default_factory=list)
+
+
+class GeoCell(BaseModel):
+    geohash: str
+    precision: int
+    latitude: float
+    longitude: float
+    bounds: list[float]  # south, west, north, east
+    count: int
+    csi: float
+    avg_rating: float
+    sentiments: dict[str, int]
+    categories: dict[str, int]
+
+
+class GeoInsights(BaseModel):
+    precision: int
+    total_cells: int
+    total_count: int
+    cells: list[GeoCell]
@@ -0,0 +1,549 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import fcntl
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator
+
+from .config import Settings
+
+LOGGER = logging.getLogger("sentiment-search")
+
+MAGIC = b"TSI1"
+FIELD_FEEDBACK = 1
+FIELD_ANALYSIS = 2
+K1 = 1.2
+B = 0.75
+# Terms whose postings exceed this get an impact-ordered top list so that
+# queries made only of very common words do not scan every posting.
+IMPACT_MIN_POSTINGS = 20_000
+IMPACT_TOP = 2_000
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i im in is it its me my no not of on or our so "
+    "that the their them they this to was we were what when with you your".split()
+)
+
+
+def _counts(tokens: list[str]) -> dict[str, int]:
+    counts: dict[str, int] = {}
+    for tok in tokens:
+        counts[tok] = counts.get(tok, 0) + 1
+    return counts
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased alphanumeric tokens, stopwords dropped, plural `s` folded ("outages" -> "outage")."""
+    out: list[str] = []
+    for tok in _TOKEN_RE.findall(text.lower()):
+        if tok in STOPWORDS:
+            continue
+        if len(tok) > 3 and tok[-1] == "s" and tok[-2] != "s":
+            tok = tok[:-1]
+        out.append(tok)
+    return out
+
+
+class _Postings:
+    """Doc ids in ascending order with parallel term frequencies."""
+
+    __slots__ = ("docs", "tfs")
+
+    def __init__(self) -> None:
+        self.docs = array("I")
+        self.tfs = array("H")
+
+    def add(self, doc: int, tf: int) -> None:
+        docs = self.docs
+        if not docs or docs[-1] < doc:
+            docs.append(doc)
+            self.tfs.append(min(tf, 65535))
+            return
+        # An analysis arriving for an older feedback doc lands mid-list.
+        i = bisect_left(docs, doc)
+        if i < len(docs) and docs[i] == doc:
+            self.tfs[i] = min(65535, self.tfs[i] + tf)
+        else:
+            docs.insert(i, doc)
+            self.tfs.insert(i, min(tf, 65535))
+
+    def remove(self, doc: int, tf: int) -> None:
+        i = bisect_left(self.docs, doc)
+        if i < len(self.docs) and self.docs[i] == doc:
+            if self.tfs[i] > tf:
+                self.tfs[i] -= tf
+            else:
+                del self.docs[i]
+                del self.tfs[i]
+
+    def tf(self, doc: int, lo: int) -> tuple[int, int]:
+        """(tf or 0, position) for `doc`, searching from `lo`; callers probe in ascending doc order."""
+        i = bisect_left(self.docs, doc, lo)
+        if i < len(self.docs) and self.docs[i] == doc:
+            return self.tfs[i], i
+        return 0, i
+
+
+class SearchIndex:
+    """
+    In-process BM25 index keyed by feedback id. Each document accumulates the
+    feedback text and, once analyzed, the analysis fields (problem, tags, team).
+    Feedback text is indexed once; the analysis text is kept per document so a
+    re-analysis with different text replaces the old terms.
+    """
+
+    def __init__(self) -> None:
+        self.postings: dict[str, _Postings] = {}
+        self.ext_ids: list[str] = []
+        self.doc_ids: dict[str, int] = {}
+        self.doc_len = array("I")
+        self.fields = bytearray()
+        self.previews: list[str] = []
+        self.total_len = 0
+        # doc -> analysis text as indexed, to take its terms out on re-analysis.
+        self.analysis_texts: dict[int, str] = {}
+        self._impact: dict[str, tuple[int, float, list[int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.ext_ids)
+
+    def add(self, ext_id: str, text: str, field: int, preview: str | None = None) -> bool:
+        doc = self.doc_ids.get(ext_id)
+        if doc is None:
+            doc = len(self.ext_ids)
+            self.doc_ids[ext_id] = doc
+            self.ext_ids.append(ext_id)
+            self.doc_len.append(0)
+            self.fields.append(0)
+            self.previews.append("")
+        elif self.fields[doc] & field:
+            old = self.analysis_texts.get(doc) if field == FIELD_ANALYSIS else None
+            if old is None or old == text:
+                return False
+            self._unindex(doc, old)
+        tokens = tokenize(text)
+        for term, tf in _counts(tokens).items():
+            plist = self.postings.get(term)
+            if plist is None:
+                plist = self.postings[term] = _Postings()
+            plist.add(doc, tf)
+            self._impact.pop(term, None)
+        self.doc_len[doc] += len(tokens)
+        self.total_len += len(tokens)
+        self.fields[doc] |= field
+        if field == FIELD_ANALYSIS:
+            self.analysis_texts[doc] = text
+        if preview and not self.previews[doc]:
+            self.previews[doc] = preview
+        return True
+
+    def _unindex(self, doc: int, text: str) -> None:
+        tokens = tokenize(text)
+        for term, tf in _counts(tokens).items():
+            plist = self.postings.get(term)
+            if plist is None:
+                continue
+            plist.remove(doc, tf)
+            self._impact.pop(term, None)
+            if not plist.docs:
+                del self.postings[term]
+        self.doc_len[doc] -= min(self.doc_len[doc], len(tokens))
+        self.total_len -= len(tokens)
+
+    # --------------------------- Querying ---------------------------
+    def _idf(self, df: int) -> float:
+        n = len(self.ext_ids)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _impact_candidates(self, term: str, plist: _Postings, avgdl: float) -> list[int]:
+        """Top docs by this term's BM25 contribution, rebuilt after 5% postings growth or avgdl drift."""
+        cached = self._impact.get(term)
+        n = len(plist.docs)
+        if cached and n - cached[0] < n * 0.05 and abs(cached[1] - avgdl) < avgdl * 0.05:
+            return cached[2]
+        doc_len = self.doc_len
+        norm = K1 * (1 - B)
+        scale = K1 * B / avgdl
+        best = heapq.nlargest(
+            IMPACT_TOP,
+            zip(plist.docs, plist.tfs),
+            key=lambda dt: dt[1] / (dt[1] + norm + scale * doc_len[dt[0]]),
+        )
+        docs = sorted(d for d, _ in best)
+        self._impact[term] = (n, avgdl, docs)
+        return docs
+
+    @staticmethod
+    def _impact_pairs(plist: _Postings, docs: list[int]) -> Iterable[tuple[int, int]]:
+        pos = 0
+        for doc in docs:
+            tf, pos = plist.tf(doc, pos)
+            yield doc, tf
+
+    def search(self, query: str, limit: int = 20, mode: str = "and") -> list[dict[str, Any]]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.ext_ids:
+            return []
+        lists = [(t, self.postings.get(t)) for t in terms]
+        if mode == "and" and any(p is None for _, p in lists):
+            return []
+        lists = [(t, p) for t, p in lists if p is not None]
+        if not lists:
+            return []
+        avgdl = max(1.0, self.total_len / len(self.ext_ids))
+        idfs = {t: self._idf(len(p.docs)) for t, p in lists}
+        doc_len = self.doc_len
+        norm = K1 * (1 - B)
+        scale = K1 * B / avgdl
+
+        def contribution(term: str, tf: int, doc: int) -> float:
+            return idfs[term] * tf * (K1 + 1) / (tf + norm + scale * doc_len[doc])
+
+        scores: dict[int, float] = {}
+        if mode == "and":
+            lists.sort(key=lambda tp: len(tp[1].docs))
+            driver_term, driver = lists[0]
+            others = lists[1:]
+            pairs: Iterable[tuple[int, int]]
+            if len(driver.docs) > IMPACT_MIN_POSTINGS:
+                pairs = self._impact_pairs(driver, self._impact_candidates(driver_term, driver, avgdl))
+            else:
+                pairs = zip(driver.docs, driver.tfs)
+            cursors = [0] * len(others)
+            for doc, tf in pairs:
+                score = contribution(driver_term, tf, doc)
+                for j, (term, plist) in enumerate(others):
+                    tf, cursors[j] = plist.tf(doc, cursors[j])
+                    if not tf:
+                        break
+                    score += contribution(term, tf, doc)
+                else:
+                    scores[doc] = score
+        else:
+            for term, plist in lists:
+                if len(plist.docs) > IMPACT_MIN_POSTINGS:
+                    for doc, tf in self._impact_pairs(plist, self._impact_candidates(term, plist, avgdl)):
+                        scores[doc] = scores.get(doc, 0.0) + contribution(term, tf, doc)
+                else:
+                    for doc, tf in zip(plist.docs, plist.tfs):
+                        scores[doc] = scores.get(doc, 0.0) + contribution(term, tf, doc)
+        top = heapq.nlargest(limit, scores.items(), key=lambda kv: kv[1])
+        return [{"id": self.ext_ids[d], "score": round(s, 4), "preview": self.previews[d]} for d, s in top]
+
+    # --------------------------- On-disk format ---------------------------
+    # MAGIC | u32 header length | JSON header | zlib(u32 meta length | JSON meta |
+    #   doc_len u32[n] | fields u8[n] | per term: u32 count | u32 docs | u16 tfs)
+    # JSON meta holds ids, previews, analysis texts by doc and the vocabulary in posting order.
+    def save(self, path: str) -> None:
+        vocab = list(self.postings)
+        meta = json.dumps(
+            {"ids": self.ext_ids, "previews": self.previews, "analysis": self.analysis_texts, "vocab": vocab}
+        ).encode("utf-8")
+        parts = [struct.pack("<I", len(meta)), meta, self.doc_len.tobytes(), bytes(self.fields)]
+        for term in vocab:
+            plist = self.postings[term]
+            parts += [struct.pack("<I", len(plist.docs)), plist.docs.tobytes(), plist.tfs.tobytes()]
+        header = json.dumps({"docs": len(self.ext_ids), "terms": len(vocab), "total_len": self.total_len}).encode("utf-8")
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(MAGIC + struct.pack("<I", len(header)) + header + zlib.compress(b"".join(parts), 1))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SearchIndex":
+        with open(path, "rb") as fh:
+            data = fh.read()
+        if data[:4] != MAGIC:
+            raise ValueError(f"{path} is not a search index")
+        (hlen,) = struct.unpack_from("<I", data, 4)
+        header = json.loads(data[8 : 8 + hlen])
+        body = memoryview(zlib.decompress(data[8 + hlen :]))
+        (mlen,) = struct.unpack_from("<I", body, 0)
+        meta = json.loads(bytes(body[4 : 4 + mlen]))
+        off = 4 + mlen
+        n = header["docs"]
+        index = cls()
+        index.ext_ids = meta["ids"]
+        index.previews = meta["previews"]
+        # Snapshots written before re-analysis support have none; their analyses stay as indexed.
+        index.analysis_texts = {int(doc): text for doc, text in (meta.get("analysis") or {}).items()}
+        index.doc_ids = {ext: i for i, ext in enumerate(index.ext_ids)}
+        index.doc_len.frombytes(body[off : off + 4 * n])
+        off += 4 * n
+        index.fields = bytearray(body[off : off + n])
+        off += n
+        for term in meta["vocab"]:
+            (count,) = struct.unpack_from("<I", body, off)
+            off += 4
+            plist = _Postings()
+            plist.docs.frombytes(body[off : off + 4 * count])
+            off += 4 * count
+            plist.tfs.frombytes(body[off : off + 2 * count])
+            off += 2 * count
+            index.postings[term] = plist
+        index.total_len = header["total_len"]
+        return index
+
+
+def analysis_text(record: dict[str, Any]) -> str:
+    intake = record.get("intake") or {}
+    routing = record.get("routing") or {}
+    tags = intake.get("tags") or []
+    return " ".join([str(record.get("problem") or ""), " ".join(str(t) for t in tags), str(routing.get("team") or "")])
+
+
+class IndexStore:
+    """
+    The live index plus its persistence: a snapshot (`index.bin`) and an append
+    log of every add since (`index.log`). Startup loads the snapshot and replays
+    the log; `compact()` folds the log into a new snapshot.
+
+    Workers on one host share the directory. Appends hold a shared flock on
+    `index.lock` and compaction an exclusive one, and the compacting worker
+    rebuilds from the files rather than from its own partial view, so no
+    worker's adds are lost when the log is truncated. `refresh()` applies the
+    log tail other workers appended (or reloads after another worker
+    compacted), so every worker answers from the same documents.
+    """
+
+    def __init__(self, directory: str, preview_chars: int) -> None:
+        self.directory = directory
+        self.preview_chars = preview_chars
+        self.snapshot_path = os.path.join(directory, "index.bin")
+        self.log_path = os.path.join(directory, "index.log")
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._flock = open(os.path.join(directory, "index.lock"), "a")
+        t0 = time.perf_counter()
+        with self._shared():
+            self.index, self._stamp, self._offset, replayed = self._load()
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        LOGGER.info(
+            "Search index ready: %s docs (%s replayed) in %.0f ms", len(self.index), replayed, (time.perf_counter() - t0) * 1000
+        )
+
+    @contextmanager
+    def _shared(self) -> Iterator[None]:
+        fcntl.flock(self._flock.fileno(), fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._flock.fileno(), fcntl.LOCK_UN)
+
+    def _snapshot_stamp(self) -> tuple[int, int] | None:
+        try:
+            st = os.stat(self.snapshot_path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def _load(self) -> tuple[SearchIndex, tuple[int, int] | None, int, int]:
+        """Snapshot plus the whole log: (index, snapshot stamp, log offset, replayed adds)."""
+        stamp = self._snapshot_stamp()
+        try:
+            index = SearchIndex.load(self.snapshot_path)
+        except FileNotFoundError:
+            index = SearchIndex()
+        except (OSError, ValueError, zlib.error, KeyError) as exc:
+            LOGGER.warning("Search snapshot unreadable (%s); starting from the log only.", exc)
+            index = SearchIndex()
+        replayed, offset = self._replay(index)
+        return index, stamp, offset, replayed
+
+    def _replay(self, index: SearchIndex, offset: int = 0) -> tuple[int, int]:
+        """Apply complete log lines from byte `offset`; returns (adds applied, offset after them)."""
+        count = 0
+        try:
+            with open(self.log_path, "rb") as fh:
+                fh.seek(offset)
+                for line in fh:
+                    if not line.endswith(b"\n"):
+                        break  # being written by another worker, or torn by a crash
+                    offset += len(line)
+                    try:
+                        op = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    count += index.add(op["id"], op["text"], op["field"], op.get("preview"))
+        except FileNotFoundError:
+            pass
+        return count, offset
+
+    def add(self, ext_id: str, text: str, field: int, preview: str | None = None) -> None:
+        """Index and log one field; blocking (file write and flock), so callers run it in a thread."""
+        if not ext_id or not text.strip():
+            return
+        preview = (preview or "")[: self.preview_chars] or None
+        with self.lock:
+            if self.index.add(ext_id, text, field, preview):
+                with self._shared():
+                    self._log.write(json.dumps({"id": ext_id, "field": field, "text": text, "preview": preview}) + "\n")
+                    self._log.flush()
+
+    def search(self, query: str, limit: int, mode: str) -> list[dict[str, Any]]:
+        with self.lock:
+            return self.index.search(query, limit, mode)
+
+    def refresh(self) -> int:
+        """Pick up other workers' adds: the new log tail, or everything after a compaction."""
+        # Same lock order as add() and compact(): the flock is per open file, so
+        # only self.lock keeps this process's threads apart.
+        with self.lock, self._shared():
+            if self._snapshot_stamp() == self._stamp:
+                applied, self._offset = self._replay(self.index, self._offset)
+                return applied
+            # Another worker compacted; its snapshot holds what the truncated log had.
+            self.index, self._stamp, self._offset, _ = self._load()
+            return len(self.index)
+
+    def compact(self) -> None:
+        with self.lock:
+            fcntl.flock(self._flock.fileno(), fcntl.LOCK_EX)
+            try:
+                # Other workers append to the same log, so fold in the files, not this view.
+                try:
+                    index = SearchIndex.load(self.snapshot_path)
+                except FileNotFoundError:
+                    index = SearchIndex()
+                except (OSError, ValueError, zlib.error, KeyError) as exc:
+                    LOGGER.warning("Search snapshot unreadable (%s); not compacting.", exc)
+                    return
+                self._replay(index)
+                index.save(self.snapshot_path)
+                # O_APPEND: the other workers' handles keep writing at the new end.
+                os.truncate(self.log_path, 0)
+                self.index, self._stamp, self._offset = index, self._snapshot_stamp(), 0
+            finally:
+                fcntl.flock(self._flock.fileno(), fcntl.LOCK_UN)
+        LOGGER.info("Compacted search index: %s docs.", len(self.index))
+
+
+_STORE: IndexStore | None = None
+_STORE_LOCK = threading.Lock()
+_REFRESHER: asyncio.Task | None = None
+
+
+def get_store(settings: Settings) -> IndexStore | None:
+    global _STORE
+    if not settings.SEARCH_INDEX_DIR:
+        return None
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = IndexStore(settings.SEARCH_INDEX_DIR, settings.SEARCH_PREVIEW_CHARS)
+        return _STORE
+
+
+def index_feedback(feedback_id: str, text: str, settings: Settings) -> None:
+    store = get_store(settings)
+    if store is not None:
+        store.add(feedback_id, text, FIELD_FEEDBACK, preview=text)
+
+
+def index_analysis(record: dict[str, Any], settings: Settings) -> None:
+    store = get_store(settings)
+    if store is not None:
+        store.add(str(record.get("feedback_id") or ""), analysis_text(record), FIELD_ANALYSIS, preview=record.get("problem"))
+
+
+async def _refresh_periodically(store: IndexStore, interval_s: float) -> None:
+    while True:
+        await asyncio.sleep(interval_s)
+        try:
+            await asyncio.to_thread(store.refresh)
+        except OSError as exc:
+            LOGGER.warning("Search index refresh failed: %s", exc)
+
+
+def start(settings: Settings) -> None:
+    """Apply other workers' adds every SEARCH_REFRESH_S."""
+    global _REFRESHER
+    store = get_store(settings)
+    if store is None or settings.SEARCH_REFRESH_S <= 0 or _REFRESHER is not None:
+        return
+    _REFRESHER = asyncio.get_running_loop().create_task(_refresh_periodically(store, settings.SEARCH_REFRESH_S))
+
+
+async def stop() -> None:
+    global _REFRESHER
+    if _REFRESHER is not None:
+        _REFRESHER.cancel()
+        _REFRESHER = None
+    if _STORE is not None:
+        await asyncio.to_thread(_STORE.compact)
+
+
+# --------------------------- CLI ---------------------------
+def _read_collection(name: str, settings: Settings) -> list[tuple[str, dict[str, Any]]]:
+    from .services import _ensure_firebase
+
+    _ensure_firebase(settings)
+    if settings.FIREBASE_STORE == "realtime":
+        from firebase_admin import db
+
+        snapshot = db.reference(name).get() or {}
+        return [(k, v) for k, v in snapshot.items() if isinstance(v, dict)] if isinstance(snapshot, dict) else []
+    from firebase_admin import firestore
+
+    return [(doc.id, doc.to_dict() or {}) for doc in firestore.client().collection(name).stream()]
+
+
+def main(argv: list[str] | None = None) -> int:
+    from .config import get_settings
+
+    parser = argparse.ArgumentParser(description="Build, compact or query the feedback search index.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("rebuild", help="Re-index every feedback item and analysis from Firebase.")
+    sub.add_parser("compact", help="Fold the append log into a fresh snapshot.")
+    query = sub.add_parser("query")
+    query.add_argument("q")
+    query.add_argument("--limit", type=int, default=10)
+    query.add_argument("--mode", choices=["and", "or"], default="and")
+    args = parser.parse_args(argv)
+
+    settings = get_settings()
+    if not settings.SEARCH_INDEX_DIR:
+        print("SEARCH_INDEX_DIR is not set", file=sys.stderr)
+        return 1
+    if args.cmd == "rebuild":
+        for name in ("index.bin", "index.log"):
+            try:
+                os.remove(os.path.join(settings.SEARCH_INDEX_DIR, name))
+            except FileNotFoundError:
+                pass
+        store = get_store(settings)
+        assert store is not None
+        for key, rec in _read_collection("feedback", settings):
+            store.add(str(rec.get("id") or key), str(rec.get("text") or ""), FIELD_FEEDBACK, preview=rec.get("text"))
+        for key, rec in _read_collection("feedback_analyses", settings):
+            store.add(str(rec.get("feedback_id") or key), analysis_text(rec), FIELD_ANALYSIS, preview=rec.get("problem"))
+        store.compact()
+        print(json.dumps({"docs": len(store.index), "terms": len(store.index.postings)}))
+        return 0
+    store = get_store(settings)
+    assert store is not None
+    if args.cmd == "compact":
+        store.compact()
+        return 0
+    t0 = time.perf_counter()
+    hits = store.search(args.q, args.limit, args.mode)
+    print(json.dumps({"took_ms": round((time.perf_counter() - t0) * 1000, 2), "results": hits}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
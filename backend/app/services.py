@@ -1,19 +1,21 @@
 from __future__ import annotations
 
 import asyncio
+import copy
 import json
 import logging
+import re
 from datetime import datetime, timezone
 import time
-from typing import Any
+from typing import Any, Callable
 
 import httpx
-from openai import OpenAI
-import google.generativeai as genai
-import os
-import concurrent.futures
 
+from . import alerts, answers, chat, classifier, comments, conditional, events, geo, incidents, llm, profiling, prompts, search, tracing, writebehind
+from .batch import PostBatch
+from .cache import cache_key, get_cache
 from .config import Settings
+from .llm_json import IncrementalJSONParser, extract_json
 from .schemas import (
     ConfigStatus,
     Location,
@@ -24,9 +26,6 @@ from .schemas import (
     FeedbackItem,
     ChatRequest,
     ChatResponse,
-    EmployeeUpdateRequest,
-    EmployeeRecord,
-    EmployeeSignupRequest,
     AnalysisTimings,
 )
 
@@ -34,6 +33,8 @@ LOGGER = logging.getLogger("sentiment-services")
 
 REDDIT_SEARCH_PATH = "/search"
 USER_AGENT = "T-Sentiment-Agent/0.1 (by /u/hackutd)"
+# Shorter comments ("this", "same", "+1") carry nothing to classify.
+COMMENT_MIN_CHARS = 25
 REDDIT_TOKEN_URL = "https://www.reddit.com/api/v1/access_token"
 DEFAULT_SUBREDDITS: list[str] = [
     "tmobile",
@@ -136,17 +137,27 @@ async def _resolve_reddit_token(settings: Settings) -> str | None:
       2) If REDDIT_CLIENT_ID + REDDIT_CLIENT_SECRET exist, exchange for a short-lived token
     """
     if settings.REDDIT_CLIENT_ID and settings.REDDIT_CLIENT_SECRET:
+        # Shared across workers so each process doesn't repeat the exchange.
+        cache = get_cache(settings)
+        token_key = cache_key("reddit-token", settings.REDDIT_CLIENT_ID)
+        cached_token = await cache.aget(token_key)
+        if cached_token:
+            return cached_token
         LOGGER.info("Acquiring Reddit access token via client credentials grant.")
         headers = {"User-Agent": settings.REDDIT_USER_AGENT or USER_AGENT}
         auth = (settings.REDDIT_CLIENT_ID, settings.REDDIT_CLIENT_SECRET)
         data = {"grant_type": "client_credentials"}
         try:
-            async with httpx.AsyncClient(timeout=15.0) as client:
-                resp = await client.post(REDDIT_TOKEN_URL, data=data, auth=auth, headers=headers)
-                resp.raise_for_status()
-                token = resp.json().get("access_token")
+            with tracing.span("reddit.token_exchange") as sp:
+                async with httpx.AsyncClient(timeout=15.0) as client:
+                    resp = await client.post(REDDIT_TOKEN_URL, data=data, auth=auth, headers=headers)
+                    sp.set(status_code=resp.status_code)
+                    resp.raise_for_status()
+                body = resp.json()
+                token = body.get("access_token")
                 if token:
                     LOGGER.debug("Successfully obtained Reddit access token.")
+                    await cache.aset(token_key, token, max(60, int(body.get("expires_in") or 3600) - 60))
                     return token
                 LOGGER.warning("Reddit token response missing access_token.")
         except httpx.HTTPError as exc:
@@ -156,7 +167,98 @@ async def _resolve_reddit_token(settings: Settings) -> str | None:
     return None
 
 
+def posts_cache_key(payload: SentimentQuery) -> str:
+    return cache_key("posts", payload.model_dump(mode="json"))
+
+
+def analyze_cache_key(payload: SentimentQuery) -> str:
+    return cache_key("analyze", payload.model_dump(mode="json"))
+
+
 async def fetch_social_posts(payload: SentimentQuery, settings: Settings) -> list[SocialPost]:
+    ttl = settings.RESPONSE_CACHE_TTL_S
+    if ttl <= 0:
+        posts = await _search_reddit(payload, settings)
+        _observe_spikes(posts, settings)
+        return posts
+    cache = get_cache(settings)
+    key = posts_cache_key(payload)
+    cached = await cache.aget(key)
+    if cached is not None:
+        return [SocialPost.model_validate(p) for p in cached]
+    posts = await _search_reddit(payload, settings)
+    _observe_spikes(posts, settings)
+    if posts:
+        await cache.aset(key, [p.model_dump(mode="json") for p in posts], ttl)
+        await conditional.stamp_cached(settings, key, ttl)
+    return posts
+
+
+async def fetch_social_posts_many(payloads: list[SentimentQuery], settings: Settings) -> list[list[SocialPost]]:
+    """
+    Posts for several queries with one token and one HTTP client. Identical
+    searches (same subreddit and terms) are sent once at the largest limit any
+    query asked for; each query then filters and trims the shared listings.
+    """
+    ttl = settings.RESPONSE_CACHE_TTL_S
+    cache = get_cache(settings) if ttl > 0 else None
+    results: list[list[SocialPost] | None] = [None] * len(payloads)
+    if cache is not None:
+        keys = [posts_cache_key(payload) for payload in payloads]
+        found = await cache.aget_many(keys)
+        for i, key in enumerate(keys):
+            if key in found:
+                results[i] = [SocialPost.model_validate(p) for p in found[key]]
+    pending = [i for i, posts in enumerate(results) if posts is None]
+    token = await _resolve_reddit_token(settings) if pending else None
+    if pending and not token:
+        # No bearer token: the single-query path knows the PRAW fallback and logs why.
+        fetched = await asyncio.gather(*(_search_reddit(payloads[i], settings) for i in pending))
+        for i, posts in zip(pending, fetched):
+            results[i] = posts
+    elif pending:
+        limits: dict[tuple[str, str, bool], int] = {}
+        for i in pending:
+            for path, query, limit, restrict in _reddit_requests(payloads[i]):
+                limits[(path, query, restrict)] = max(limit, limits.get((path, query, restrict), 0))
+        plans = {
+            i: [(path, query, limits[(path, query, restrict)], restrict) for path, query, _, restrict in _reddit_requests(payloads[i])]
+            for i in pending
+        }
+        unique = [(path, query, limit, restrict) for (path, query, restrict), limit in limits.items()]
+        LOGGER.info("Fetching %s Reddit searches for %s queries.", len(unique), len(pending))
+        headers = _reddit_headers(token, settings)
+        try:
+            async with httpx.AsyncClient(base_url=settings.REDDIT_BASE_URL, timeout=15.0) as client:
+                listings = await _fetch_listings(client, unique, headers)
+                # Threads that top several queries are fetched once.
+                expanded = await _expand_comments(
+                    client, headers, [(payloads[i], _collect_listings(plans[i], listings, payloads[i])) for i in pending], settings
+                )
+        except httpx.HTTPError as exc:
+            LOGGER.warning("Reddit network error: %s. Returning empty lists.", exc)
+            expanded = [[] for _ in pending]
+        for i, posts in zip(pending, expanded):
+            results[i] = posts
+    for i in pending:
+        posts = results[i] or []
+        _observe_spikes(posts, settings)
+        if cache is not None and posts:
+            key = posts_cache_key(payloads[i])
+            await cache.aset(key, [p.model_dump(mode="json") for p in posts], ttl)
+            await conditional.stamp_cached(settings, key, ttl)
+    return [posts or [] for posts in results]
+
+
+def _observe_spikes(posts: list[SocialPost], settings: Settings) -> None:
+    # Locate from the text alone: the query's location_hint says nothing about where a post is from.
+    for post in posts:
+        location = _infer_location(post.text, {}, None)
+        city = location.city if location else None
+        alerts.observe(f"{post.source}:{post.id}", city, _heuristic_category(post.text), post.posted_at.timestamp(), settings)
+
+
+async def _search_reddit(payload: SentimentQuery, settings: Settings) -> list[SocialPost]:
     LOGGER.info("Fetching social posts for query='%s', limit=%s", payload.query, payload.limit)
 
     token = await _resolve_reddit_token(settings)
@@ -201,7 +303,8 @@ async def fetch_social_posts(payload: SentimentQuery, settings: Settings) -> lis
                         )
                 deduped = _dedupe_posts(collected)
                 return deduped[: payload.limit]
-            return await asyncio.to_thread(_praw_fetch)
+            with tracing.span("reddit.praw_fetch"):
+                return await profiling.to_thread(_praw_fetch)
         except Exception as exc:
             LOGGER.warning("PRAW fetch failed: %s", exc)
             # continue to httpx path if token later becomes available
@@ -211,11 +314,32 @@ async def fetch_social_posts(payload: SentimentQuery, settings: Settings) -> lis
         LOGGER.error("No Reddit credentials available (REDDIT_CLIENT_ID/SECRET missing or token exchange failed).")
         return []
 
-    headers = {
+    headers = _reddit_headers(token, settings)
+    try:
+        async with httpx.AsyncClient(base_url=settings.REDDIT_BASE_URL, timeout=15.0) as client:
+            requests = _reddit_requests(payload)
+            listings = await _fetch_listings(client, requests, headers)
+            (posts,) = await _expand_comments(client, headers, [(payload, _collect_listings(requests, listings, payload))], settings)
+    except httpx.HTTPError as exc:
+        LOGGER.warning("Reddit network error: %s. Returning empty list.", exc)
+        return []
+    return posts
+
+
+def _reddit_headers(token: str, settings: Settings) -> dict[str, str]:
+    return {
         "User-Agent": settings.REDDIT_USER_AGENT or USER_AGENT,
         "Authorization": f"Bearer {token}",
         "Accept": "application/json",
     }
+
+
+# A Reddit search: (path, q, per-request limit, restrict_sr).
+RedditRequest = tuple[str, str, int, bool]
+
+
+def _reddit_requests(payload: SentimentQuery) -> list[RedditRequest]:
+    """The searches one query needs: one per subreddit, or a single sitewide search."""
     terms: list[str] = []
     if payload.query:
         terms.append(payload.query)
@@ -224,52 +348,45 @@ async def fetch_social_posts(payload: SentimentQuery, settings: Settings) -> lis
     human_terms = " ".join(t for t in terms if t).strip()
     tmo_clause = '("T-Mobile" OR "tmobile" OR "t mobile" OR TMO)'
     query = f"{tmo_clause} {human_terms}".strip()
-
-    try:
-        async with httpx.AsyncClient(base_url=settings.REDDIT_BASE_URL, timeout=15.0) as client:
-            subs = [s.lstrip('r/').strip() for s in (payload.subreddits or []) if s and s.strip()]
-            responses: list[Any] = []
-            if subs:
-                per_sub_limit = max(3, payload.limit // max(1, len(subs)) + 2)
-                async def fetch_sr(sr: str):
-                    params = {
-                        "q": query,
-                        "limit": per_sub_limit,
-                        "sort": "relevance",
-                        "include_facets": "false",
-                        "restrict_sr": "true",
-                    }
-                    path = f"/r/{sr}/search"
-                    resp = await client.get(path, params=params, headers=headers)
-                    resp.raise_for_status()
-                    return resp.json()
-                tasks = [fetch_sr(sr) for sr in subs]
-                responses = await asyncio.gather(*tasks, return_exceptions=True)
-            else:
-                params = {
-                    "q": query,
-                    "limit": payload.limit,
-                    "sort": "relevance",
-                    "include_facets": "false",
-                }
-                resp = await client.get(REDDIT_SEARCH_PATH, params=params, headers=headers)
-                resp.raise_for_status()
-                responses = [resp.json()]
-            # Parse and merge
-            collected: list[SocialPost] = []
-            for resp in responses:
-                if isinstance(resp, Exception):
-                    LOGGER.warning("Reddit search for one subreddit failed: %s", resp)
-                    continue
-                collected.extend(_parse_listing(resp, payload))
-    except httpx.HTTPStatusError as exc:
-        # If Reddit blocks or rejects (e.g., 401/403/429), don't crash the API; return empty
-        LOGGER.warning("Reddit API returned %s. Returning empty list. Detail: %s", exc.response.status_code, exc)
-        return []
-    except httpx.HTTPError as exc:
-        LOGGER.warning("Reddit network error: %s. Returning empty list.", exc)
-        return []
-
+    subs = [s.lstrip('r/').strip() for s in (payload.subreddits or []) if s and s.strip()]
+    if not subs:
+        return [(REDDIT_SEARCH_PATH, query, payload.limit, False)]
+    per_sub_limit = max(3, payload.limit // max(1, len(subs)) + 2)
+    return [(f"/r/{sr}/search", query, per_sub_limit, True) for sr in subs]
+
+
+async def _fetch_listings(
+    client: httpx.AsyncClient, requests: list[RedditRequest], headers: dict[str, str]
+) -> dict[RedditRequest, Any]:
+    """Run the searches concurrently; a failed search maps to its exception."""
+
+    async def fetch(request: RedditRequest) -> Any:
+        path, query, limit, restrict = request
+        params: dict[str, Any] = {"q": query, "limit": limit, "sort": "relevance", "include_facets": "false"}
+        if restrict:
+            params["restrict_sr"] = "true"
+        with tracing.span("reddit.search", subreddit=path.split("/")[2] if restrict else "all") as sp:
+            resp = await client.get(path, params=params, headers=headers)
+            sp.set(status_code=resp.status_code)
+            resp.raise_for_status()
+            return resp.json()
+
+    responses = await asyncio.gather(*(fetch(r) for r in requests), return_exceptions=True)
+    return dict(zip(requests, responses))
+
+
+def _collect_listings(requests: list[RedditRequest], listings: dict[RedditRequest, Any], payload: SentimentQuery) -> list[SocialPost]:
+    collected: list[SocialPost] = []
+    for request in requests:
+        resp = listings.get(request)
+        if isinstance(resp, httpx.HTTPStatusError):
+            # If Reddit blocks or rejects (e.g., 401/403/429), don't crash the API
+            LOGGER.warning("Reddit API returned %s for %s. Detail: %s", resp.response.status_code, request[0], resp)
+            continue
+        if isinstance(resp, Exception):
+            LOGGER.warning("Reddit search %s failed: %s", request[0], resp)
+            continue
+        collected.extend(_parse_listing(resp, payload))
     deduped = _dedupe_posts(collected)
     return deduped[: payload.limit]
 
@@ -299,6 +416,68 @@ def _parse_listing(data: Any, payload: SentimentQuery) -> list[SocialPost]:
     return posts
 
 
+async def _expand_comments(
+    client: httpx.AsyncClient,
+    headers: dict[str, str],
+    batches: list[tuple[SentimentQuery, list[SocialPost]]],
+    settings: Settings,
+) -> list[list[SocialPost]]:
+    """
+    Each query's posts plus up to REDDIT_COMMENTS_MAX relevant comments from its
+    top REDDIT_COMMENTS_TOP_N submissions (see app/comments.py). A no-op unless
+    REDDIT_COMMENTS_ENABLED.
+    """
+    if not settings.REDDIT_COMMENTS_ENABLED or settings.REDDIT_COMMENTS_TOP_N <= 0:
+        return [posts for _, posts in batches]
+    tops = [posts[: settings.REDDIT_COMMENTS_TOP_N] for _, posts in batches]
+    threads = await comments.fetch_threads(client, headers, [p.id for top in tops for p in top], settings)
+    expanded: list[list[SocialPost]] = []
+    for (payload, posts), top in zip(batches, tops):
+        extra: list[SocialPost] = []
+        for parent in top:
+            extra.extend(_comment_posts(parent, threads.get(parent.id) or [], payload))
+        expanded.append(_dedupe_posts(posts + extra[: settings.REDDIT_COMMENTS_MAX]))
+    LOGGER.info("Expanded %s threads into %s comment posts.", len(threads), sum(map(len, expanded)) - sum(len(p) for _, p in batches))
+    return expanded
+
+
+def _comment_posts(parent: SocialPost, nodes: list[dict[str, Any]], payload: SentimentQuery) -> list[SocialPost]:
+    posts: list[SocialPost] = []
+    for node in nodes:
+        body = node["body"].strip()
+        if not _is_comment_relevant(body, payload):
+            continue
+        posts.append(
+            SocialPost(
+                id=node.get("id") or node.get("name") or f"{parent.id}-c{len(posts)}",
+                text=body,
+                author=node.get("author") or "anonymous",
+                posted_at=datetime.fromtimestamp(node.get("created_utc", parent.posted_at.timestamp()), tz=timezone.utc),
+                # "Same here" replies inherit the thread's location.
+                location=_infer_location(body, node, None) or parent.location,
+                permalink=f"https://reddit.com{node['permalink']}" if node.get("permalink") else parent.permalink,
+            )
+        )
+    return posts
+
+
+def _is_comment_relevant(text: str, payload: SentimentQuery) -> bool:
+    """
+    Comments in a T-Mobile thread rarely name the carrier again. Keep those that
+    do, or that mention the query, a known place or a service category.
+    """
+    if len(text) < COMMENT_MIN_CHARS:
+        return False
+    lowered = text.lower()
+    terms = [t for t in " ".join([payload.query or "", *(payload.keywords or [])]).lower().split() if len(t) > 2]
+    return (
+        _is_tmobile_relevant(text, payload)
+        or any(t in lowered for t in terms)
+        or _heuristic_category(text) != "Other"
+        or _infer_location(text, {}, None) is not None
+    )
+
+
 def _is_tmobile_relevant(text: str, payload: SentimentQuery) -> bool:
     lowered = text.lower()
     tmo_synonyms = ["t-mobile", "tmobile", "t mobile", "t‑mobile", "t–mobile", "tmo"]
@@ -317,11 +496,22 @@ def _is_tmobile_relevant(text: str, payload: SentimentQuery) -> bool:
     return True
 
 
+def _post_key(p: SocialPost) -> str:
+    return p.id or p.permalink or f"{p.author}-{int(p.posted_at.timestamp())}-{hash(p.text[:50])}"
+
+
+def _located_key(p: SocialPost) -> tuple[str, tuple[str | None, str | None, str | None] | None]:
+    # Reddit posts take the query's location_hint when their text names no place,
+    # so two queries can locate the same post differently.
+    loc = p.location
+    return _post_key(p), (loc.city, loc.state, loc.raw) if loc is not None else None
+
+
 def _dedupe_posts(posts: list[SocialPost]) -> list[SocialPost]:
     seen: set[str] = set()
     unique: list[SocialPost] = []
     for p in posts:
-        key = p.id or p.permalink or f"{p.author}-{int(p.posted_at.timestamp())}-{hash(p.text[:50])}"
+        key = _post_key(p)
         if key in seen:
             continue
         seen.add(key)
@@ -353,7 +543,8 @@ def _ensure_firebase(settings: Settings) -> None:
             app_kwargs = {}
             if settings.FIREBASE_DATABASE_URL:
                 app_kwargs["options"] = {"databaseURL": settings.FIREBASE_DATABASE_URL}
-            firebase_admin.initialize_app(cred, **app_kwargs)
+            with tracing.span("firebase.init"):
+                firebase_admin.initialize_app(cred, **app_kwargs)
         _FIREBASE_INIT_DONE = True
         LOGGER.info("Firebase Admin initialized.")
     except Exception as exc:
@@ -364,19 +555,21 @@ def _ensure_firebase(settings: Settings) -> None:
 async def _fetch_feedback_posts(limit: int, settings: Settings) -> list[SocialPost]:
     _ensure_firebase(settings)
     try:
-        if settings.FIREBASE_STORE == "realtime":
-            from firebase_admin import db
-            if not settings.FIREBASE_DATABASE_URL:
-                LOGGER.debug("FIREBASE_DATABASE_URL not set; skipping feedback fetch.")
-                return []
-            ref = db.reference("feedback")
-            snapshot = ref.order_by_child("posted_at").limit_to_last(limit).get() or {}
-            records = list(snapshot.values()) if isinstance(snapshot, dict) else snapshot or []
-        else:
-            from firebase_admin import firestore
-            client = firestore.client()
-            docs = client.collection("feedback").order_by("posted_at", direction=firestore.Query.DESCENDING).limit(limit).stream()
-            records = [doc.to_dict() for doc in docs]
+        with tracing.span("firebase.read_feedback", store=settings.FIREBASE_STORE, limit=limit) as sp:
+            if settings.FIREBASE_STORE == "realtime":
+                from firebase_admin import db
+                if not settings.FIREBASE_DATABASE_URL:
+                    LOGGER.debug("FIREBASE_DATABASE_URL not set; skipping feedback fetch.")
+                    return []
+                ref = db.reference("feedback")
+                snapshot = ref.order_by_child("posted_at").limit_to_last(limit).get() or {}
+                records = list(snapshot.values()) if isinstance(snapshot, dict) else snapshot or []
+            else:
+                from firebase_admin import firestore
+                client = firestore.client()
+                docs = client.collection("feedback").order_by("posted_at", direction=firestore.Query.DESCENDING).limit(limit).stream()
+                records = [doc.to_dict() for doc in docs]
+            sp.set(records=len(records))
     except Exception as exc:
         LOGGER.warning("Failed to read feedback from Firebase: %s", exc)
         return []
@@ -406,6 +599,13 @@ async def _fetch_feedback_posts(limit: int, settings: Settings) -> list[SocialPo
     return posts
 
 
+def _text_coordinates(text: str) -> tuple[float, float] | None:
+    location = _infer_location(text, {}, None)
+    if location is None or location.latitude is None or location.longitude is None:
+        return None
+    return location.latitude, location.longitude
+
+
 def _infer_location(text: str, node: dict[str, Any], location_hint: str | None) -> Location | None:
     hints = [node.get("link_flair_text"), node.get("author_flair_text"), location_hint or ""]
     hints = [h for h in hints if h]
@@ -461,61 +661,120 @@ def _default_solution(category: str, sentiment: str, text: str) -> str:
     return "Try the basic steps: reboot device, update software, and check for outages. If the issue persists, contact T‑Mobile support with details for targeted help."
 
 
-async def _request_nemotron(posts: list[SocialPost], settings: Settings) -> dict[str, Any]:
-    local_ok = bool(
-        settings.NEMOTRON_BASE_URL
-        and (
-            "localhost" in settings.NEMOTRON_BASE_URL
-            or "127.0.0.1" in settings.NEMOTRON_BASE_URL
-            or "0.0.0.0" in settings.NEMOTRON_BASE_URL
-        )
-    )
-    if (not settings.NEMOTRON_API_KEY and not local_ok) or not posts:
-        if not settings.NEMOTRON_API_KEY and not local_ok:
-            LOGGER.debug("Nemotron API key missing and not using local endpoint; skipping LLM enrichment.")
+async def _request_nemotron(
+    posts: list[SocialPost],
+    settings: Settings,
+    on_item: Callable[[dict[str, Any]], None] | None = None,
+) -> dict[str, Any]:
+    """
+    Enrich `posts` via the LLM. With LLM_STREAMING, each complete item is passed
+    to `on_item` (from a worker thread) as soon as it has been generated.
+    """
+    if not llm.configured_providers(settings) or not posts:
         if not posts:
             LOGGER.debug("No posts to enrich; skipping LLM enrichment.")
+        else:
+            LOGGER.debug("No LLM provider configured; skipping LLM enrichment.")
         return {}
 
-    def _call_llm() -> dict[str, Any]:
-        client = OpenAI(base_url=settings.NEMOTRON_BASE_URL, api_key=settings.NEMOTRON_API_KEY or "sk-local")
-        payload = [
-            {"id": post.id, "text": post.text[:600], "author": post.author, "location": post.location.raw if post.location else ""}
-            for post in posts
-        ]
-        user_prompt = (
-            "You are an operations analyst for T-Mobile. "
-            "Rate each Reddit post from 1 (very negative) to 5 (very positive) about customer experience, "
-            "infer the primary problem category from this list: "
-            "[Network Coverage, Customer Service, Billing, Pricing & Plans, Device and Equipment, Store Experience, Mobile App, Other]. "
-            "Extract a short location hint if present. "
-            "For each item, provide a concise, actionable solution (1–2 sentences) that a user can try now. "
-            "Keep outputs concise: include an `insight` short phrase and a `solution` sentence per item, and a single brief `summary`. "
-            "Return JSON with fields `items` (array of {id, rating, category, sentiment, location, insight, solution}) and `summary` (string). "
-            "Only output JSON."
-        )
+    payload = prompts.enrichment_payload(posts, settings)
+    messages = [
+        {"role": "system", "content": prompts.ENRICH_INSTRUCTIONS},
+        {"role": "user", "content": "Posts: " + json.dumps(payload, ensure_ascii=False, separators=(",", ":"))},
+    ]
+    params = {"temperature": 0.4, "top_p": 0.8, "max_tokens": 450}
+    with tracing.span("llm.enrich", posts=len(payload), stream=settings.LLM_STREAMING) as sp:
+        if settings.LLM_STREAMING:
+            parser = IncrementalJSONParser()
+
+            def on_text(delta: str) -> None:
+                for item in parser.feed(delta):
+                    if on_item is not None:
+                        on_item(item)
+
+            content = await llm.stream_completion(
+                messages, settings, operation="enrich", budget_s=settings.LLM_ENRICH_BUDGET_S, on_text=on_text, **params
+            )
+            raw = parser.result()
+        else:
+            completion = await llm.chat_completion(
+                messages, settings, operation="enrich", budget_s=settings.LLM_ENRICH_BUDGET_S, **params
+            )
+            if completion is None or not completion.choices:
+                content = None
+            else:
+                content = completion.choices[0].message.content or ""
+            raw = extract_json(content or "")
+        sp.set(items=len(raw.get("items") or []))
+    if content is None:
+        return {}
+    if not raw:
+        LOGGER.warning("Nemotron returned non-JSON payload; ignoring LLM response (no enrichment applied).")
+    LOGGER.debug("Nemotron returned content length=%s", len(content))
+    return raw
+
+
+def _classify_locally(posts: list[SocialPost], settings: Settings) -> tuple[dict[str, dict[str, Any]], list[SocialPost]]:
+    """Confidence-gated local predictions; only uncertain posts are left for the LLM."""
+    model = classifier.get_model(settings.CLASSIFIER_MODEL_PATH)
+    if model is None:
+        return {}, posts
+    local: dict[str, dict[str, Any]] = {}
+    remaining: list[SocialPost] = []
+    with tracing.span("classifier.predict", posts=len(posts)) as sp:
+        for post in posts:
+            pred = model.predict(post.text)
+            if pred["confidence"] >= settings.CLASSIFIER_MIN_CONFIDENCE:
+                local[post.id] = {"rating": pred["rating"], "category": pred["category"]}
+            else:
+                remaining.append(post)
+        sp.set(local=len(local))
+    LOGGER.info("Local classifier handled %s/%s posts.", len(local), len(posts))
+    return local, remaining
 
-        completion = client.chat.completions.create(
-            model=settings.NEMOTRON_MODEL,
-            messages=[
-                {"role": "system", "content": "Respond with valid JSON only."},
-                {"role": "user", "content": f"{user_prompt}\nPosts: {json.dumps(payload)}"},
-            ],
-            temperature=0.4,
-            top_p=0.8,
-            max_tokens=450,
-        )
 
-        content = completion.choices[0].message.content or "{}"
-        cleaned = content.strip().strip("`")
+def _record_training_examples(posts: list[SocialPost], nemo_map: dict[str, Any], settings: Settings) -> None:
+    if not settings.CLASSIFIER_TRAINING_LOG or not nemo_map:
+        return
+    examples = []
+    for post in posts:
+        item = nemo_map.get(post.id)
+        if not item or item.get("category") not in classifier.CATEGORIES:
+            continue
         try:
-            LOGGER.debug("Nemotron returned content length=%s", len(cleaned))
-            return json.loads(cleaned)
-        except json.JSONDecodeError:
-            LOGGER.warning("Nemotron returned non-JSON payload; ignoring LLM response (no enrichment applied).")
-            return {}
+            rating = int(item.get("rating"))
+        except (TypeError, ValueError):
+            continue
+        if 1 <= rating <= 5:
+            examples.append({"text": post.text, "category": item["category"], "rating": rating})
+    try:
+        classifier.log_training_examples(settings.CLASSIFIER_TRAINING_LOG, examples)
+    except OSError as exc:
+        LOGGER.warning("Failed to log classifier training examples: %s", exc)
+
+
+async def _cached_enrichments(posts: list[SocialPost], settings: Settings) -> tuple[dict[str, dict[str, Any]], list[SocialPost]]:
+    """Split posts into those another request (or worker) already enriched and the rest, in one lookup."""
+    if settings.ENRICH_CACHE_TTL_S <= 0 or not posts:
+        return {}, posts
+    keys = [cache_key("enrich", post.id, post.text) for post in posts]
+    found = await get_cache(settings).aget_many(keys)
+    hits: dict[str, dict[str, Any]] = {}
+    misses: list[SocialPost] = []
+    for post, key in zip(posts, keys):
+        item = found.get(key)
+        if item:
+            hits[post.id] = item
+        else:
+            misses.append(post)
+    return hits, misses
 
-    return await asyncio.to_thread(_call_llm)
+
+async def _store_enrichments(posts: list[SocialPost], nemo_map: dict[str, Any], settings: Settings) -> None:
+    if settings.ENRICH_CACHE_TTL_S <= 0 or not nemo_map:
+        return
+    values = {cache_key("enrich", post.id, post.text): nemo_map[post.id] for post in posts if nemo_map.get(post.id)}
+    await get_cache(settings).aset_many(values, settings.ENRICH_CACHE_TTL_S)
 
 
 def _apply_nemotron_data(raw: dict[str, Any]) -> tuple[dict[str, Any], str | None]:
@@ -666,96 +925,89 @@ def _normalize_workflow_analysis(record: dict[str, Any], fallback_problem: str |
     return rec
 
 
-def _build_sentiment_entry(post: SocialPost, enrichment: dict[str, Any]) -> SentimentResult:
-    rating = int(enrichment.get("rating", _heuristic_rating(post.text)))
-    sentiment = enrichment.get("sentiment") or _sentiment_from_rating(rating)
-    category = enrichment.get("category") or _heuristic_category(post.text)
-    location_text = enrichment.get("location")
-    solution_text = enrichment.get("solution") or _default_solution(category, sentiment, post.text)
-
-    if location_text and (not post.location or not post.location.city):
-        post.location = Location(raw=location_text)
-
-    confidence = min(0.95, 0.5 + abs(rating - 3) * 0.15)
-
-    issues: list[str] = []
-    delights: list[str] = []
-    if sentiment == "negative":
-        issues.append(enrichment.get("insight") or f"Negative feedback on {category.lower()}")
-    elif sentiment == "positive":
-        delights.append(enrichment.get("insight") or f"Positive note on {category.lower()}")
-
-    return SentimentResult(
-        post=post,
-        sentiment=sentiment,  # type: ignore[arg-type]
-        confidence=confidence,
-        rating=rating,
-        solution=solution_text,
-        category=category,  # type: ignore[arg-type]
-        issues=issues,
-        delights=delights,
-    )
-
-
-def _tally_categories(sentiments: list[SentimentResult]) -> dict[str, int]:
-    tally: dict[str, int] = {
-        "Network Coverage": 0,
-        "Customer Service": 0,
-        "Billing": 0,
-        "Pricing & Plans": 0,
-        "Device and Equipment": 0,
-        "Store Experience": 0,
-        "Mobile App": 0,
-        "Other": 0,
-    }
-    for item in sentiments:
-        tally[item.category] = tally.get(item.category, 0) + 1
-    return tally
-
-
-def _compute_csi(sentiments: list[SentimentResult]) -> float:
-    if not sentiments:
-        return 50.0
-    total = len(sentiments)
-    positive_weight = sum(s.rating for s in sentiments if s.sentiment == "positive")
-    negative_weight = sum(6 - s.rating for s in sentiments if s.sentiment == "negative")
-    raw_score = ((positive_weight - negative_weight) / (total * 5)) * 100
-    return max(0.0, min(100.0, round(50 + raw_score / 2, 2)))
-
-
-def _fallback_summary(sentiments: list[SentimentResult], csi_score: float) -> str:
-    if not sentiments:
+def _fallback_summary(batch: PostBatch, csi_score: float, rows: list[int] | None = None) -> str:
+    leading_category = batch.leading_category(rows)
+    if leading_category is None:
         return "No Reddit discussions detected for the current filter."
-    leading_category = max(sentiments, key=lambda s: len(s.issues) + len(s.delights)).category
     return f"CSI {csi_score}: dominant signal around {leading_category.lower()}."
 
 
-async def build_sentiment_response(payload: SentimentQuery, settings: Settings) -> SentimentResponse:
+async def _enrich_posts(
+    posts: list[SocialPost], settings: Settings, heuristic_only: bool, chunk_posts: int = 0
+) -> tuple[dict[str, dict[str, Any]], str | None, float]:
+    """
+    Enrichment by post id from the local classifier, the shared cache and the
+    LLM (skipped when `heuristic_only`), plus the LLM summary and seconds spent
+    on the LLM. With `chunk_posts`, LLM posts are sent as concurrent requests of
+    that many posts; the summary is then dropped since it covers one chunk only.
+    """
+    local_map, llm_posts = _classify_locally(posts, settings)
+    cached_map, llm_posts = await _cached_enrichments(llm_posts, settings)
+    LOGGER.info("Fetched %s posts; proceeding to LLM enrichment for %s.", len(posts), len(llm_posts))
+    l0 = time.perf_counter()
+    # With LLM_STREAMING, items parsed before the completion ends are kept even if
+    # the final document turns out truncated.
+    streamed: dict[str, dict[str, Any]] = {}
+
+    def on_item(item: dict[str, Any]) -> None:
+        if item.get("id"):
+            streamed.setdefault(item["id"], item)
+
+    if heuristic_only:
+        raws: list[dict[str, Any]] = []
+    elif chunk_posts > 0 and len(llm_posts) > chunk_posts:
+        chunks = [llm_posts[i:i + chunk_posts] for i in range(0, len(llm_posts), chunk_posts)]
+        raws = list(await asyncio.gather(*(_request_nemotron(chunk, settings, on_item) for chunk in chunks)))
+    else:
+        raws = [await _request_nemotron(llm_posts, settings, on_item)]
+    l1 = time.perf_counter()
+    nemo_map: dict[str, dict[str, Any]] = dict(streamed)
+    nemo_summary = None
+    for raw in raws:
+        mapping, nemo_summary = _apply_nemotron_data(raw)
+        nemo_map.update(mapping)
+    if len(raws) > 1:
+        nemo_summary = None
+    _record_training_examples(llm_posts, nemo_map, settings)
+    await _store_enrichments(llm_posts, nemo_map, settings)
+    return {**local_map, **cached_map, **nemo_map}, nemo_summary, l1 - l0
+
+
+async def build_sentiment_response(payload: SentimentQuery, settings: Settings, heuristic_only: bool = False) -> SentimentResponse:
+    """Fetch, enrich and score posts. `heuristic_only` skips the LLM (used when shedding load)."""
     LOGGER.info("Starting sentiment analysis pipeline. query='%s' limit=%s", payload.query, payload.limit)
+    response_key = analyze_cache_key(payload)
+    if settings.RESPONSE_CACHE_TTL_S > 0:
+        cached = await get_cache(settings).aget(response_key)
+        if cached is not None:
+            LOGGER.info("Serving cached sentiment response.")
+            return SentimentResponse.model_validate(cached)
     t0 = time.perf_counter()
     r0 = time.perf_counter()
-    reddit_posts = await fetch_social_posts(payload, settings)
+    with tracing.span("pipeline.reddit", query=payload.query, limit=payload.limit) as sp:
+        reddit_posts = await fetch_social_posts(payload, settings)
+        sp.set(posts=len(reddit_posts))
     r1 = time.perf_counter()
     f0 = time.perf_counter()
     feedback_posts = await _fetch_feedback_posts(payload.limit, settings)
     f1 = time.perf_counter()
     posts = _dedupe_posts(reddit_posts + feedback_posts)
-    LOGGER.info("Fetched %s posts; proceeding to LLM enrichment.", len(posts))
-    l0 = time.perf_counter()
-    nemotron_raw = await _request_nemotron(posts, settings)
-    l1 = time.perf_counter()
-    nemo_map, nemo_summary = _apply_nemotron_data(nemotron_raw)
+    nemo_map, nemo_summary, llm_s = await _enrich_posts(posts, settings, heuristic_only)
 
-    sentiments = [_build_sentiment_entry(post, nemo_map.get(post.id, {})) for post in posts]
-    csi_score = _compute_csi(sentiments)
-    summary = nemo_summary or _fallback_summary(sentiments, csi_score)
-    issue_counts = _tally_categories(sentiments)
+    with tracing.span("pipeline.build_entries", posts=len(posts), enriched=len(nemo_map)):
+        batch = PostBatch.from_posts(posts)
+        batch.score(nemo_map)
+        geo.observe_batch(batch, _text_coordinates, settings)
+        csi_score = batch.csi()
+        summary = nemo_summary or _fallback_summary(batch, csi_score)
+        issue_counts = batch.tally()
+        sentiments = batch.results()
 
     total_ms = int((time.perf_counter() - t0) * 1000)
     timings = AnalysisTimings(
         reddit_ms=int((r1 - r0) * 1000),
         feedback_ms=int((f1 - f0) * 1000),
-        llm_ms=int((l1 - l0) * 1000),
+        llm_ms=int(llm_s * 1000),
         total_ms=total_ms,
     )
     response = SentimentResponse(
@@ -765,13 +1017,119 @@ async def build_sentiment_response(payload: SentimentQuery, settings: Settings)
         issue_counts=issue_counts,
         timings=timings,
     )
+    _record_sentiments(sentiments, payload, settings)
+    if settings.RESPONSE_CACHE_TTL_S > 0 and sentiments and not heuristic_only:
+        await get_cache(settings).aset(response_key, response.model_dump(mode="json"), settings.RESPONSE_CACHE_TTL_S)
+        await conditional.stamp_cached(settings, response_key, settings.RESPONSE_CACHE_TTL_S)
     LOGGER.info("Completed sentiment response with %s sentiments; CSI=%s", len(sentiments), csi_score)
     return response
 
 
+async def build_sentiment_responses(
+    payloads: list[SentimentQuery], settings: Settings, heuristic_only: bool = False
+) -> list[SentimentResponse]:
+    """
+    One SentimentResponse per query, in order, from shared work: Reddit searches
+    go out together (fetch_social_posts_many), feedback is read once, and posts
+    that several queries returned are enriched once. A post is scored once per
+    distinct location the queries gave it, so each query's results keep the
+    location its own hint produced. CSI, summary and issue counts are then
+    computed per query over its own rows. Timings are those of the shared stages.
+    """
+    LOGGER.info("Starting batched sentiment analysis for %s queries.", len(payloads))
+    responses: list[SentimentResponse | None] = [None] * len(payloads)
+    if settings.RESPONSE_CACHE_TTL_S > 0:
+        keys = [analyze_cache_key(payload) for payload in payloads]
+        found = await get_cache(settings).aget_many(keys)
+        for i, key in enumerate(keys):
+            if key in found:
+                responses[i] = SentimentResponse.model_validate(found[key])
+    pending = [i for i, response in enumerate(responses) if response is None]
+    if not pending:
+        return responses  # type: ignore[return-value]
+
+    t0 = time.perf_counter()
+    with tracing.span("pipeline.reddit", queries=len(pending)) as sp:
+        reddit_lists = await fetch_social_posts_many([payloads[i] for i in pending], settings)
+        sp.set(posts=sum(len(posts) for posts in reddit_lists))
+    r1 = time.perf_counter()
+    feedback_posts = await _fetch_feedback_posts(max(payloads[i].limit for i in pending), settings)
+    feedback_posts.sort(key=lambda p: p.posted_at, reverse=True)
+    f1 = time.perf_counter()
+
+    # Each query keeps its own post list; rows index the union by post and location.
+    per_query = [_dedupe_posts(reddit + feedback_posts[: payloads[i].limit]) for i, reddit in zip(pending, reddit_lists)]
+    row_of: dict[Any, int] = {}
+    union: list[SocialPost] = []
+    for post in (post for posts in per_query for post in posts):
+        if row_of.setdefault(_located_key(post), len(union)) == len(union):
+            union.append(post)
+    nemo_map, nemo_summary, llm_s = await _enrich_posts(
+        _dedupe_posts(union), settings, heuristic_only, settings.ANALYZE_BATCH_ENRICH_POSTS
+    )
+
+    with tracing.span("pipeline.build_entries", posts=len(union), enriched=len(nemo_map)):
+        batch = PostBatch.from_posts(union)
+        batch.score(nemo_map)
+        geo.observe_batch(batch, _text_coordinates, settings)
+        built = []
+        for posts in per_query:
+            rows = [row_of[_located_key(post)] for post in posts]
+            csi_score = batch.csi(rows)
+            summary = (nemo_summary if len(pending) == 1 else None) or _fallback_summary(batch, csi_score, rows)
+            built.append((batch.results(rows), csi_score, summary, batch.tally(rows)))
+
+    timings = AnalysisTimings(
+        reddit_ms=int((r1 - t0) * 1000),
+        feedback_ms=int((f1 - r1) * 1000),
+        llm_ms=int(llm_s * 1000),
+        total_ms=int((time.perf_counter() - t0) * 1000),
+    )
+    for i, (sentiments, csi_score, summary, issue_counts) in zip(pending, built):
+        responses[i] = response = SentimentResponse(
+            sentiments=sentiments,
+            csi_score=csi_score,
+            summary=summary,
+            issue_counts=issue_counts,
+            timings=timings,
+        )
+        _record_sentiments(sentiments, payloads[i], settings)
+        if settings.RESPONSE_CACHE_TTL_S > 0 and sentiments and not heuristic_only:
+            key = analyze_cache_key(payloads[i])
+            await get_cache(settings).aset(key, response.model_dump(mode="json"), settings.RESPONSE_CACHE_TTL_S)
+            await conditional.stamp_cached(settings, key, settings.RESPONSE_CACHE_TTL_S)
+    LOGGER.info("Completed %s sentiment responses from %s shared posts.", len(pending), len(union))
+    return responses  # type: ignore[return-value]
+
+
+_BACKGROUND: set[asyncio.Task] = set()
+_FIREBASE_KEY_RE = re.compile(r"[.#$\[\]/]")
+
+
+def _record_sentiments(sentiments: list[SentimentResult], payload: SentimentQuery, settings: Settings) -> None:
+    """Keep each freshly built sentiment (keyed by post id) for /export; written off the request path."""
+    if not settings.EXPORT_RECORD_SENTIMENTS or not sentiments:
+        return
+    analyzed_at = int(datetime.now(timezone.utc).timestamp())
+    records = {
+        _FIREBASE_KEY_RE.sub("_", s.post.id): {**s.model_dump(mode="json"), "analyzed_at": analyzed_at, "query": payload.query}
+        for s in sentiments
+    }
+    task = asyncio.get_running_loop().create_task(profiling.to_thread(_write_sentiments, records, settings))
+    _BACKGROUND.add(task)
+    task.add_done_callback(_BACKGROUND.discard)
+
+
+def _write_sentiments(records: dict[str, dict[str, Any]], settings: Settings) -> None:
+    try:
+        with tracing.span("firebase.write_sentiments", store=settings.FIREBASE_STORE, records=len(records)):
+            writebehind.write_records([("sentiments", key, record) for key, record in records.items()], settings)
+    except Exception as exc:
+        LOGGER.warning("Failed to record sentiments: %s", exc)
+
+
 # --------------------------- Feedback Writer ---------------------------
 async def write_feedback(item: FeedbackItem, settings: Settings) -> bool:
-    _ensure_firebase(settings)
     try:
         item_id = item.id or f"fb-{int(datetime.now().timestamp()*1000)}"
         when = item.posted_at or datetime.now(timezone.utc)
@@ -782,15 +1140,27 @@ async def write_feedback(item: FeedbackItem, settings: Settings) -> bool:
             "posted_at": int(when.timestamp()),
             "location_hint": item.location_hint or "",
         }
-        if settings.FIREBASE_STORE == "realtime":
-            from firebase_admin import db
-            ref = db.reference("feedback")
-            ref.child(item_id).set(record)
+        if await writebehind.enqueue("feedback", item_id, record, settings):
+            LOGGER.info("Buffered feedback item id=%s", item_id)
         else:
-            from firebase_admin import firestore
-            client = firestore.client()
-            client.collection("feedback").document(item_id).set(record)
-        LOGGER.info("Stored feedback item id=%s", item_id)
+            _ensure_firebase(settings)
+            with tracing.span("firebase.write_feedback", store=settings.FIREBASE_STORE):
+                if settings.FIREBASE_STORE == "realtime":
+                    from firebase_admin import db
+                    ref = db.reference("feedback")
+                    ref.child(item_id).set(record)
+                else:
+                    from firebase_admin import firestore
+                    client = firestore.client()
+                    client.collection("feedback").document(item_id).set(record)
+            LOGGER.info("Stored feedback item id=%s", item_id)
+        await profiling.to_thread(search.index_feedback, item_id, item.text, settings)
+        location = _infer_location(item.text, {}, item.location_hint)
+        category = _heuristic_category(item.text)
+        alerts.observe(f"feedback:{item_id}", location.city if location else None, category, when.timestamp(), settings)
+        if location is not None:
+            rating = _heuristic_rating(item.text)
+            geo.observe(f"feedback:{item_id}", location.latitude, location.longitude, rating, _sentiment_from_rating(rating), category, settings)
         return True
     except Exception as exc:
         LOGGER.warning("Failed to store feedback: %s", exc)
@@ -798,66 +1168,122 @@ async def write_feedback(item: FeedbackItem, settings: Settings) -> bool:
 
 
 # --------------------------- Feedback Analysis (Nemotron) ---------------------------
-async def analyze_feedback_item(item: FeedbackItem, settings: Settings) -> bool:
+async def analyze_feedback_item(item: FeedbackItem, settings: Settings, interactive: bool = False) -> bool:
     """
     Run Nemotron to convert freshly submitted feedback into an internal workflow
     covering intake, sentiment, routing, and action-oriented insights.
+
+    Feedback that joins an open incident (app/incidents.py) reuses the analysis
+    of that incident's first member instead of calling the LLM again. Background
+    analysis waits up to INCIDENT_WAIT_S for it; an `interactive` caller holds an
+    admission slot, so it waits no longer than its own LLM call would take.
     """
-    local_ok = bool(
-        settings.NEMOTRON_BASE_URL
-        and (
-            "localhost" in settings.NEMOTRON_BASE_URL
-            or "127.0.0.1" in settings.NEMOTRON_BASE_URL
-            or "0.0.0.0" in settings.NEMOTRON_BASE_URL
-        )
-    )
-    if not settings.NEMOTRON_API_KEY and not local_ok:
-        LOGGER.debug("Nemotron API key missing and not using local endpoint; skipping feedback analysis.")
+    if not llm.configured_providers(settings):
+        LOGGER.debug("No LLM provider configured; skipping feedback analysis.")
         return False
 
-    def _call_llm() -> dict[str, Any]:
-        client = OpenAI(base_url=settings.NEMOTRON_BASE_URL, api_key=settings.NEMOTRON_API_KEY or "sk-local")
-        system = (
-            "You are an enterprise IT operations workflow architect for T-Mobile. "
-            "Respond with valid JSON only. No markdown or commentary."
-        )
-        user = (
-            "Analyze the following customer feedback and build an internal operations workflow for employees.\n"
-            "Requirements:\n"
-            "1. Provide `name` (customer name if available, else 'Unknown').\n"
-            "2. Provide `problem` as a single sentence describing the core issue.\n"
-            "3. Always include `resolved: false` unless the customer explicitly states the issue is fixed.\n"
-            "4. Build `intake` with keys: classification (short label), summary (1–2 sentences), tags (array of 2–4 keywords).\n"
-            "5. Build `sentiment` with keys: tone ('positive'|'neutral'|'negative'), score (0–100), urgency ('Low'|'Medium'|'High'), notes (1 concise sentence).\n"
-            "6. Build `routing` with keys: priority (e.g., 'P1 - Critical'), team (owning T-Mobile team), actions (array of 3 steps with keys step, owner, detail).\n"
-            "7. Build `insights` choosing exactly one format:\n"
-            "   - If the issue needs sequential troubleshooting, set type='flowchart' and provide 3–5 ordered steps with keys title, description, color (hex such as #E20074, #FFB800, #1E3A8A, #10B981).\n"
-            "   - Otherwise set type='cards' and provide 2–4 cards with keys title, body, color (hex) representing colored briefing paragraphs.\n"
-            "Return strictly JSON with keys: name, problem, resolved, intake, sentiment, routing, insights.\n\n"
-            f"Feedback author: {item.author}\n"
-            f"Location hint: {item.location_hint or ''}\n"
-            f"Feedback text:\n{item.text}"
-        )
-        completion = client.chat.completions.create(
-            model=settings.NEMOTRON_MODEL,
-            messages=[
+    tracker = incidents.get_tracker(settings)
+    incident = tracker.assign(item.text, _incident_location(item), _heuristic_category(item.text)) if tracker is not None else None
+    if incident is not None:
+        wait_s = min(settings.INCIDENT_WAIT_S, settings.LLM_FEEDBACK_BUDGET_S) if interactive else settings.INCIDENT_WAIT_S
+        shared, claim = await tracker.shared_analysis(incident, wait_s)
+        if shared is not None:
+            LOGGER.info("Feedback id=%s joined incident %s (%s reports); reusing its analysis.", item.id, incident.id, incident.size)
+            return await _store_feedback_analysis(item, _personalize_analysis(shared, item, incident.id), settings)
+
+    record = None
+    try:
+        record = await _llm_feedback_analysis(item, settings)
+        if record is None:
+            return False
+        if incident is not None:
+            record["incident_id"] = incident.id
+        return await _store_feedback_analysis(item, record, settings)
+    finally:
+        if incident is not None:
+            tracker.settle(incident, record, claim)
+
+
+def _incident_location(item: FeedbackItem) -> str | None:
+    location = _infer_location(item.text, {}, item.location_hint)
+    if location is None:
+        return None
+    if location.city:
+        return f"{location.city}, {location.state}" if location.state else location.city
+    return (location.raw or "").strip().lower() or None
+
+
+def _personalize_analysis(shared: dict[str, Any], item: FeedbackItem, incident_id: str) -> dict[str, Any]:
+    """Copy an incident's analysis for another member: its own id, name, summary and tone."""
+    record = copy.deepcopy(shared)
+    record["feedback_id"] = item.id or ""
+    record["name"] = item.author if item.author and item.author != "customer" else "Unknown"
+    record["resolved"] = False
+    record["analyzed_at"] = int(datetime.now(timezone.utc).timestamp())
+    record["incident_id"] = incident_id
+    record["intake"] = {**record["intake"], "summary": prompts.clip_tokens(prompts.compact_text(item.text), 60)}
+    tone = _sentiment_from_rating(_heuristic_rating(item.text))
+    record["sentiment"] = {
+        **record["sentiment"],
+        "tone": tone if tone != "neutral" else record["sentiment"].get("tone", "neutral"),
+        "notes": f"Grouped into incident {incident_id}; workflow shared with the incident's first report.",
+    }
+    return record
+
+
+# Bump whenever the analysis prompt below changes shape or meaning; stored records
+# carry `prompt_version` so `python -m app.backfill` knows what to re-analyze.
+FEEDBACK_PROMPT_VERSION = 2
+
+
+def analysis_version(settings: Settings) -> str:
+    """The version stamped on new analyses: prompt revision plus the model that answered it."""
+    return f"{FEEDBACK_PROMPT_VERSION}:{settings.NEMOTRON_MODEL}"
+
+
+async def _llm_feedback_analysis(item: FeedbackItem, settings: Settings) -> dict[str, Any] | None:
+    system = (
+        "You are an enterprise IT operations workflow architect for T-Mobile. "
+        "Respond with valid JSON only. No markdown or commentary."
+    )
+    user = (
+        "Analyze the following customer feedback and build an internal operations workflow for employees.\n"
+        "Requirements:\n"
+        "1. Provide `name` (customer name if available, else 'Unknown').\n"
+        "2. Provide `problem` as a single sentence describing the core issue.\n"
+        "3. Always include `resolved: false` unless the customer explicitly states the issue is fixed.\n"
+        "4. Build `intake` with keys: classification (short label), summary (1–2 sentences), tags (array of 2–4 keywords).\n"
+        "5. Build `sentiment` with keys: tone ('positive'|'neutral'|'negative'), score (0–100), urgency ('Low'|'Medium'|'High'), notes (1 concise sentence).\n"
+        "6. Build `routing` with keys: priority (e.g., 'P1 - Critical'), team (owning T-Mobile team), actions (array of 3 steps with keys step, owner, detail).\n"
+        "7. Build `insights` choosing exactly one format:\n"
+        "   - If the issue needs sequential troubleshooting, set type='flowchart' and provide 3–5 ordered steps with keys title, description, color (hex such as #E20074, #FFB800, #1E3A8A, #10B981).\n"
+        "   - Otherwise set type='cards' and provide 2–4 cards with keys title, body, color (hex) representing colored briefing paragraphs.\n"
+        "Return strictly JSON with keys: name, problem, resolved, intake, sentiment, routing, insights.\n\n"
+        f"Feedback author: {item.author}\n"
+        f"Location hint: {item.location_hint or ''}\n"
+        f"Feedback text:\n{prompts.clip_tokens(prompts.compact_text(item.text), settings.PROMPT_REQUEST_TOKENS)}"
+    )
+    with tracing.span("llm.feedback_analysis", feedback_id=item.id or ""):
+        completion = await llm.chat_completion(
+            [
                 {"role": "system", "content": system},
                 {"role": "user", "content": user},
             ],
+            settings,
+            operation="feedback_analysis",
+            budget_s=settings.LLM_FEEDBACK_BUDGET_S,
             temperature=0.3,
             top_p=0.8,
             max_tokens=700,
         )
-        content = (completion.choices[0].message.content or "").strip().strip("`")
-        try:
-            return json.loads(content)
-        except json.JSONDecodeError:
-            LOGGER.warning("Nemotron returned non-JSON for feedback analysis; content length=%s", len(content))
-            return {}
-
-    raw = await asyncio.to_thread(_call_llm)
+    if completion is None or not completion.choices:
+        LOGGER.warning("Feedback analysis for id=%s got no LLM result; not stored.", item.id)
+        return None
+    content = completion.choices[0].message.content or ""
+    raw = extract_json(content)
     if not raw:
-        return False
+        LOGGER.warning("Nemotron returned non-JSON for feedback analysis; content length=%s", len(content))
+        return None
 
     analyzed_at = int(datetime.now(timezone.utc).timestamp())
     base_record = {
@@ -871,20 +1297,32 @@ async def analyze_feedback_item(item: FeedbackItem, settings: Settings) -> bool:
         "insights": raw.get("insights"),
         "analyzed_at": analyzed_at,
     }
+    # Normalized once here; readers only fill what Firebase drops (see _stored_analysis).
     record = _normalize_workflow_analysis(base_record, fallback_problem=item.text)
+    record["prompt_version"] = analysis_version(settings)
+    return record
+
+
+async def _store_feedback_analysis(item: FeedbackItem, record: dict[str, Any], settings: Settings) -> bool:
     try:
-        _ensure_firebase(settings)
-        if settings.FIREBASE_STORE == "realtime":
-            from firebase_admin import db
-            ref = db.reference("feedback_analyses")
-            key = (item.id or f"fb-{int(datetime.now().timestamp()*1000)}")
-            ref.child(key).set(record)
+        key = item.id or f"fb-{int(datetime.now().timestamp()*1000)}"
+        # Buffered analyses bump the "analyses" version when flushed (app/writebehind.py).
+        if await writebehind.enqueue("feedback_analyses", key, record, settings):
+            LOGGER.info("Buffered feedback analysis for id=%s", item.id)
         else:
-            from firebase_admin import firestore
-            client = firestore.client()
-            doc_id = item.id or f"fb-{int(datetime.now().timestamp()*1000)}"
-            client.collection("feedback_analyses").document(doc_id).set(record)
-        LOGGER.info("Stored feedback analysis for id=%s", item.id)
+            _ensure_firebase(settings)
+            with tracing.span("firebase.write_analysis", store=settings.FIREBASE_STORE):
+                if settings.FIREBASE_STORE == "realtime":
+                    from firebase_admin import db
+                    db.reference("feedback_analyses").child(key).set(record)
+                else:
+                    from firebase_admin import firestore
+                    client = firestore.client()
+                    client.collection("feedback_analyses").document(key).set(record)
+            LOGGER.info("Stored feedback analysis for id=%s", item.id)
+            await conditional.bump(settings, "analyses")
+        await profiling.to_thread(search.index_analysis, record, settings)
+        events.publish_analysis(record, settings)
         return True
     except Exception as exc:
         LOGGER.warning("Failed to store feedback analysis: %s", exc)
@@ -892,133 +1330,127 @@ async def analyze_feedback_item(item: FeedbackItem, settings: Settings) -> bool:
 
 
 async def list_feedback_analyses(limit: int, settings: Settings) -> list[dict[str, Any]]:
-    """Fetch latest feedback analyses."""
+    """Fetch latest feedback analyses; the Firebase SDK blocks, so the read runs in a thread."""
+    return await profiling.to_thread(_read_feedback_analyses, limit, settings)
+
+
+def _read_feedback_analyses(limit: int, settings: Settings) -> list[dict[str, Any]]:
     _ensure_firebase(settings)
     try:
-        if settings.FIREBASE_STORE == "realtime":
-            from firebase_admin import db
-            if not settings.FIREBASE_DATABASE_URL:
-                LOGGER.debug("FIREBASE_DATABASE_URL not set; skipping analysis fetch.")
-                return []
-            ref = db.reference("feedback_analyses")
-            snapshot = ref.order_by_child("analyzed_at").limit_to_last(limit).get() or {}
-            records = list(snapshot.values()) if isinstance(snapshot, dict) else snapshot or []
-            # sort descending
-            records.sort(key=lambda r: r.get("analyzed_at", 0), reverse=True)
-        else:
-            from firebase_admin import firestore
-            client = firestore.client()
-            docs = client.collection("feedback_analyses").order_by("analyzed_at", direction=firestore.Query.DESCENDING).limit(limit).stream()
-            records = [doc.to_dict() for doc in docs]
+        with tracing.span("firebase.read_analyses", store=settings.FIREBASE_STORE, limit=limit):
+            if settings.FIREBASE_STORE == "realtime":
+                from firebase_admin import db
+                if not settings.FIREBASE_DATABASE_URL:
+                    LOGGER.debug("FIREBASE_DATABASE_URL not set; skipping analysis fetch.")
+                    return []
+                ref = db.reference("feedback_analyses")
+                snapshot = ref.order_by_child("analyzed_at").limit_to_last(limit).get() or {}
+                records = list(snapshot.values()) if isinstance(snapshot, dict) else snapshot or []
+                # sort descending
+                records.sort(key=lambda r: r.get("analyzed_at", 0), reverse=True)
+            else:
+                from firebase_admin import firestore
+                client = firestore.client()
+                docs = client.collection("feedback_analyses").order_by("analyzed_at", direction=firestore.Query.DESCENDING).limit(limit).stream()
+                records = [doc.to_dict() for doc in docs]
     except Exception as exc:
         LOGGER.warning("Failed to read feedback analyses: %s", exc)
         return []
 
-    sanitized: list[dict[str, Any]] = []
-    for rec in records:
-        if isinstance(rec, dict):
-            sanitized.append(_normalize_workflow_analysis(rec))
-    return sanitized
+    return [_stored_analysis(rec) for rec in records if isinstance(rec, dict)]
+
+
+# Realtime Database drops empty lists and nulls on write; these are restored on read.
+_ANALYSIS_DEFAULTS: dict[str, dict[str, Any]] = {
+    "intake": {"classification": "General Inquiry", "summary": "", "tags": []},
+    "sentiment": {"tone": "neutral", "score": None, "urgency": None, "notes": None},
+    "routing": {"priority": "Normal", "team": "Customer Care", "actions": []},
+    "insights": {"type": "cards", "flowchart": [], "cards": []},
+}
+
+
+def _stored_analysis(rec: dict[str, Any]) -> dict[str, Any]:
+    """
+    A stored analysis in FeedbackAnalysis shape. Records carrying a
+    prompt_version were normalized when written and only get their dropped
+    empty fields back; legacy records (what_can_be_done, roadmap, ...) still go
+    through _normalize_workflow_analysis until the backfill rewrites them.
+    """
+    if not rec.get("prompt_version"):
+        return _normalize_workflow_analysis(rec)
+    out = dict(rec)
+    out.setdefault("resolved", False)
+    out.setdefault("incident_id", None)
+    for section, defaults in _ANALYSIS_DEFAULTS.items():
+        out[section] = {**defaults, **(rec.get(section) or {})}
+    return out
 
 # --------------------------- OpenRouter Chat (JOY) ---------------------------
+JOY_UNAVAILABLE = "JOY is temporarily unavailable. Please try again shortly."
+JOY_EMPTY = "I'm JOY. How can I help you onboard to T‑Mobile or resolve a technical issue today?"
+JOY_OUT_OF_SCOPE = "Sorry, that is beyond my expertise."
+
+
 async def chat_with_openrouter(request: ChatRequest, settings: Settings) -> ChatResponse:
     """
     Use OpenRouter (OpenAI-compatible) to power JOY, the T‑Mobile IT expert.
     """
-    if not settings.OPENROUTER_API_KEY:
+    if not llm.configured_providers(settings, prefer="openrouter"):
         return ChatResponse(reply="Chat is not configured. Please set OPENROUTER_API_KEY.")
-    try:
-        client = OpenAI(base_url=settings.OPENROUTER_BASE_URL, api_key=settings.OPENROUTER_API_KEY)
-        system = (
-            "You are JOY, T‑Mobile's friendly mascot and an expert T‑Mobile IT advisor.\n"
-            "SCOPE: Only answer questions directly related to T‑Mobile—onboarding, plans, billing, device setup, coverage/network, app login/support, migrations, and troubleshooting.\n"
-            "OUT‑OF‑SCOPE BEHAVIOR: If the user's request is not about T‑Mobile, reply with exactly: \"Sorry, that is beyond my expertise.\" Do not add any other text.\n"
-            "STYLE: Professional, empathetic, concise but complete. Prefer numbered steps, brief explanations, and clear next actions. "
-            "Do not invent URLs; if needed, say “Visit the T‑Mobile Support portal”."
-        )
-        completion = await asyncio.to_thread(
-            client.chat.completions.create,
-            model=settings.OPENROUTER_MODEL,
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": request.message},
-            ],
-            temperature=0.3,
-            top_p=0.9,
-            max_tokens=800,
-        )
-        reply = (completion.choices[0].message.content or "").strip()
-        if not reply:
-            reply = "I'm JOY. How can I help you onboard to T‑Mobile or resolve a technical issue today?"
-        return ChatResponse(reply=reply)
-    except Exception as exc:
-        LOGGER.warning("OpenRouter chat failure: %s", exc)
-        return ChatResponse(reply="JOY is temporarily unavailable. Please try again shortly.")
+    system = (
+        "You are JOY, T‑Mobile's friendly mascot and an expert T‑Mobile IT advisor.\n"
+        "SCOPE: Only answer questions directly related to T‑Mobile—onboarding, plans, billing, device setup, coverage/network, app login/support, migrations, and troubleshooting.\n"
+        "OUT‑OF‑SCOPE BEHAVIOR: If the user's request is not about T‑Mobile, reply with exactly: \"Sorry, that is beyond my expertise.\" Do not add any other text.\n"
+        "STYLE: Professional, empathetic, concise but complete. Prefer numbered steps, brief explanations, and clear next actions. "
+        "Do not invent URLs; if needed, say “Visit the T‑Mobile Support portal”."
+    )
+    store = chat.get_store(settings)
+    if store is None:
+        return await _joy_answer(request.message, [{"role": "system", "content": system}, {"role": "user", "content": request.message}], settings)
+    session = await store.open(request.session_id)
+    async with session.lock:
+        messages = chat.build_messages(system, session, request.message, settings)
+        # Only an opening question means the same thing in every conversation.
+        if session.is_new:
+            response = await _joy_answer(request.message, messages, settings)
+        else:
+            response = await _joy_reply(messages, settings)
+        response.session_id = session.id
+        if response.reply not in (JOY_UNAVAILABLE, JOY_EMPTY):
+            await chat.record_turn(store, session, request.message, response.reply, settings)
+    return response
 
 
-# --------------------------- Employees ---------------------------
-async def upsert_employee(req: EmployeeUpdateRequest, settings: Settings) -> EmployeeRecord:
-    _ensure_firebase(settings)
-    try:
-        from firebase_admin import auth, firestore
-        # Update auth user if needed
-        kwargs: dict[str, Any] = {}
-        if req.email:
-            kwargs["email"] = req.email
-        if req.new_password:
-            kwargs["password"] = req.new_password
-        if kwargs:
-            auth.update_user(req.emp_id, **kwargs)
-        # Store profile in Firestore 'employees' (always use Firestore for employees)
-        client = firestore.client()
-        record = {
-            "Emp_ID": req.emp_id,
-            "Name": req.name or "",
-            "FName": req.first_name or "",
-            "LName": req.last_name or "",
-            "Email": req.email or "",
-            "updated_at": datetime.now(timezone.utc).isoformat(),
-        }
-        client.collection("employees").document(req.emp_id).set(record, merge=True)
-        return EmployeeRecord(emp_id=req.emp_id, name=req.name, email=req.email)
-    except Exception as exc:
-        LOGGER.warning("Failed to upsert employee: %s", exc)
-        return EmployeeRecord(emp_id=req.emp_id, name=req.name, email=req.email)
+async def _joy_answer(question: str, messages: list[dict[str, str]], settings: Settings) -> ChatResponse:
+    """_joy_reply behind the near-duplicate answer cache."""
+    cache = answers.get_cache(settings)
+    if cache is None:
+        return await _joy_reply(messages, settings)
+    hit = cache.lookup(question)
+    if hit is not None:
+        entry, score = hit
+        LOGGER.info("JOY answer cache hit (%s, similarity %.2f, pinned=%s).", entry.id, score, entry.pinned)
+        return ChatResponse(reply=entry.answer, cached=True)
+    response = await _joy_reply(messages, settings)
+    if response.reply not in (JOY_UNAVAILABLE, JOY_EMPTY, JOY_OUT_OF_SCOPE):
+        cost = prompts.estimate_message_tokens(messages) + prompts.estimate_tokens(response.reply)
+        cache.remember(question, response.reply, cost)
+    return response
 
 
-async def signup_employee(req: EmployeeSignupRequest, settings: Settings) -> EmployeeRecord:
-    _ensure_firebase(settings)
-    try:
-        from firebase_admin import auth, firestore
-        import bcrypt  # type: ignore
-        # Create or update auth user
-        user = None
-        if req.emp_id:
-            try:
-                user = auth.get_user(req.emp_id)
-            except Exception:
-                user = None
-        if user:
-            auth.update_user(user.uid, email=req.email, password=req.password, display_name=f"{req.first_name} {req.last_name}")
-            emp_id = user.uid
-        else:
-            user = auth.create_user(email=req.email, password=req.password, display_name=f"{req.first_name} {req.last_name}")
-            emp_id = user.uid
-        # Hash password for Firestore storage (never plaintext)
-        pw_hash = bcrypt.hashpw(req.password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
-        # Write to Firestore employees
-        client = firestore.client()
-        doc = {
-            "Emp_ID": emp_id,
-            "FName": req.first_name,
-            "LName": req.last_name,
-            "Email": req.email,
-            "PasswordHash": pw_hash,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "updated_at": datetime.now(timezone.utc).isoformat(),
-        }
-        client.collection("employees").document(emp_id).set(doc, merge=True)
-        return EmployeeRecord(emp_id=emp_id, name=f"{req.first_name} {req.last_name}", email=req.email)
-    except Exception as exc:
-        LOGGER.warning("Employee signup failed: %s", exc)
-        return EmployeeRecord(emp_id=req.emp_id or "", name=f"{req.first_name} {req.last_name}", email=req.email)
+async def _joy_reply(messages: list[dict[str, str]], settings: Settings) -> ChatResponse:
+    with tracing.span("llm.chat", messages=len(messages), prompt_tokens=prompts.estimate_message_tokens(messages)):
+        completion = await llm.chat_completion(
+            messages,
+            settings,
+            operation="chat",
+            budget_s=settings.LLM_CHAT_BUDGET_S,
+            prefer="openrouter",
+            temperature=0.3,
+            top_p=0.9,
+            max_tokens=800,
+        )
+    if completion is None or not completion.choices:
+        return ChatResponse(reply=JOY_UNAVAILABLE)
+    reply = (completion.choices[0].message.content or "").strip()
+    return ChatResponse(reply=reply or JOY_EMPTY)
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import argparse
+import importlib
+import logging
+import subprocess
+import sys
+import time
+from typing import Any
+
+from .config import Settings
+
+LOGGER = logging.getLogger("sentiment-startup")
+
+# Wall-clock ms per module imported or initialized during warm-up, in order.
+WARMUP_TIMINGS: dict[str, float] = {}
+
+
+def _timed(name: str, fn: Any, *args: Any) -> None:
+    t0 = time.perf_counter()
+    try:
+        fn(*args)
+    except Exception as exc:
+        LOGGER.warning("Warm-up step %s failed: %s", name, exc)
+    WARMUP_TIMINGS[name] = round((time.perf_counter() - t0) * 1000, 2)
+
+
+def _modules_to_warm(settings: Settings) -> list[str]:
+    from . import llm
+
+    modules: list[str] = []
+    # NEMOTRON_BASE_URL always has a default; only a provider that will be called needs the SDK.
+    if llm.configured_providers(settings):
+        modules.append("openai")
+    if settings.FIREBASE_SERVICE_ACCOUNT_JSON or settings.FIREBASE_CREDENTIALS_PATH:
+        modules.append("firebase_admin")
+        modules.append("firebase_admin.db" if settings.FIREBASE_STORE == "realtime" else "firebase_admin.firestore")
+        # Employee endpoints always use Auth + Firestore.
+        modules.extend(["firebase_admin.auth", "firebase_admin.firestore", "bcrypt"])
+    if settings.REDDIT_CLIENT_ID and settings.REDDIT_CLIENT_SECRET:
+        modules.append("praw")
+    return list(dict.fromkeys(modules))
+
+
+def warm_up(settings: Settings) -> dict[str, float]:
+    """
+    Import the heavy modules this deployment will actually use and initialize
+    Firebase, so the first /analyze or /feedback after scale-up does not pay for it.
+    """
+    from . import services
+
+    t0 = time.perf_counter()
+    for module in _modules_to_warm(settings):
+        _timed(module, importlib.import_module, module)
+    if "firebase_admin" in WARMUP_TIMINGS:
+        _timed("firebase.init", services._ensure_firebase, settings)
+        if settings.FIREBASE_STORE != "realtime":
+            from firebase_admin import firestore
+
+            _timed("firestore.client", firestore.client)
+    total_ms = round((time.perf_counter() - t0) * 1000, 2)
+    WARMUP_TIMINGS["total"] = total_ms
+    if settings.STARTUP_BUDGET_MS and total_ms > settings.STARTUP_BUDGET_MS:
+        LOGGER.warning("Warm-up took %.0f ms, over the %s ms budget: %s", total_ms, settings.STARTUP_BUDGET_MS, WARMUP_TIMINGS)
+    else:
+        LOGGER.info("Warm-up finished in %.0f ms: %s", total_ms, WARMUP_TIMINGS)
+    return dict(WARMUP_TIMINGS)
+
+
+# --------------------------- Cold import report ---------------------------
+def import_time_report(target: str = "main", top: int = 25) -> dict[str, Any]:
+    """
+    Import `target` in a fresh interpreter under `-X importtime` and return the
+    per-module cumulative timings (ms), slowest first.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    modules: list[dict[str, Any]] = []
+    total_ms = 0.0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # One leading space, then two per nesting level; top-level imports sum to the total.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entry = {"module": name.strip(), "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000}
+        modules.append(entry)
+        if depth == 0:
+            total_ms += entry["cumulative_ms"]
+    modules.sort(key=lambda m: m["cumulative_ms"], reverse=True)
+    return {"target": target, "ok": proc.returncode == 0, "total_ms": round(total_ms, 2), "modules": modules[:top]}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure cold import time of the backend.")
+    parser.add_argument("--target", default="main")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--budget-ms", type=float, default=None, help="Exit non-zero when total import time exceeds this.")
+    args = parser.parse_args(argv)
+
+    report = import_time_report(args.target, args.top)
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for m in report["modules"]:
+        print(f"{m['cumulative_ms']:>14.1f} {m['self_ms']:>9.1f}  {m['module']}")
+    print(f"total import time for '{args.target}': {report['total_ms']:.1f} ms")
+    if not report["ok"]:
+        print(f"import of '{args.target}' failed", file=sys.stderr)
+        return 2
+    if args.budget_ms is not None and report["total_ms"] > args.budget_ms:
+        print(f"over budget ({args.budget_ms} ms)", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+
+import httpx
+
+from .config import Settings
+
+LOGGER = logging.getLogger("sentiment-tracing")
+
+SERVICE_NAME = "t-sentiment-api"
+
+
+class _TraceBuffer:
+    """Finished spans of one trace, flushed when the root span closes."""
+
+    __slots__ = ("spans", "flushed")
+
+    def __init__(self) -> None:
+        self.spans: list[dict[str, Any]] = []
+        self.flushed = False
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "t0", "attrs", "status", "buffer")
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, buffer: _TraceBuffer, attrs: dict[str, Any]) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.t0 = time.perf_counter_ns()
+        self.attrs = attrs
+        self.status = "ok"
+        self.buffer = buffer
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def to_dict(self, duration_ns: int) -> dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.start_ns + duration_ns,
+            "duration_ms": round(duration_ns / 1e6, 3),
+            "status": self.status,
+            "attrs": self.attrs,
+        }
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        return None
+
+
+_NOOP_SPAN = _NoopSpan()
+
+_REQUEST_ID: ContextVar[str | None] = ContextVar("request_id", default=None)
+_CURRENT_SPAN: ContextVar[Span | None] = ContextVar("current_span", default=None)
+_ROUTE: ContextVar[str | None] = ContextVar("route", default=None)
+
+
+# --------------------------- Exporters ---------------------------
+class JsonLinesExporter:
+    """Append one JSON object per span to a local file."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[dict[str, Any]]) -> None:
+        lines = "".join(json.dumps(s, default=str) + "\n" for s in spans)
+        with self._lock, open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(lines)
+
+
+class OTLPHttpExporter:
+    """POST spans as OTLP/JSON to a collector (or any stand-in accepting /v1/traces)."""
+
+    def __init__(self, endpoint: str) -> None:
+        self.endpoint = endpoint
+
+    @staticmethod
+    def _attr(key: str, value: Any) -> dict[str, Any]:
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    def export(self, spans: list[dict[str, Any]]) -> None:
+        otlp_spans = [
+            {
+                "traceId": s["trace_id"],
+                "spanId": s["span_id"],
+                "parentSpanId": s["parent_id"] or "",
+                "name": s["name"],
+                "kind": 1,
+                "startTimeUnixNano": str(s["start_ns"]),
+                "endTimeUnixNano": str(s["end_ns"]),
+                "attributes": [self._attr(k, v) for k, v in s["attrs"].items()],
+                "status": {"code": 2 if s["status"] == "error" else 1},
+            }
+            for s in spans
+        ]
+        body = {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [self._attr("service.name", SERVICE_NAME)]},
+                    "scopeSpans": [{"scope": {"name": "app.tracing"}, "spans": otlp_spans}],
+                }
+            ]
+        }
+        httpx.post(self.endpoint, json=body, timeout=5.0)
+
+
+class _ExportWorker:
+    """Ships span batches off the request path on a daemon thread."""
+
+    def __init__(self, exporter: JsonLinesExporter | OTLPHttpExporter) -> None:
+        self.exporter = exporter
+        self._queue: queue.Queue[list[dict[str, Any]] | None] = queue.Queue(maxsize=1024)
+        self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+        self._thread.start()
+
+    def submit(self, spans: list[dict[str, Any]]) -> None:
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            LOGGER.debug("Trace export queue full; dropping %s spans.", len(spans))
+
+    def _run(self) -> None:
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            try:
+                self.exporter.export(batch)
+            except Exception as exc:
+                LOGGER.warning("Trace export failed: %s", exc)
+
+    def close(self, timeout: float = 2.0) -> None:
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+_SAMPLE_RATE = 0.0
+_WORKER: _ExportWorker | None = None
+
+
+def configure(settings: Settings) -> None:
+    """Install the exporter and sample rate from settings (idempotent)."""
+    global _SAMPLE_RATE, _WORKER
+    _SAMPLE_RATE = max(0.0, min(1.0, settings.TRACE_SAMPLE_RATE))
+    if _SAMPLE_RATE <= 0 or _WORKER is not None:
+        return
+    if settings.TRACE_OTLP_ENDPOINT:
+        exporter: JsonLinesExporter | OTLPHttpExporter = OTLPHttpExporter(settings.TRACE_OTLP_ENDPOINT)
+    else:
+        exporter = JsonLinesExporter(settings.TRACE_EXPORT_PATH)
+    _WORKER = _ExportWorker(exporter)
+    atexit.register(_WORKER.close)
+    LOGGER.info("Tracing enabled: sample_rate=%s exporter=%s", _SAMPLE_RATE, type(exporter).__name__)
+
+
+def current_request_id() -> str | None:
+    return _REQUEST_ID.get()
+
+
+def current_route() -> str | None:
+    return _ROUTE.get()
+
+
+def _finish(span: Span) -> None:
+    record = span.to_dict(time.perf_counter_ns() - span.t0)
+    buf = span.buffer
+    if buf.flushed:
+        # Late span (e.g. a background task outliving the request): ship on its own.
+        if _WORKER is not None:
+            _WORKER.submit([record])
+        return
+    buf.spans.append(record)
+    if span.parent_id is None:
+        buf.flushed = True
+        if _WORKER is not None:
+            _WORKER.submit(buf.spans)
+
+
+@contextmanager
+def request_trace(name: str, request_id: str | None = None, route: str | None = None, **attrs: Any) -> Iterator[Span | _NoopSpan]:
+    """Open the root span for a request; the sampling decision is made here once."""
+    rid = request_id or uuid.uuid4().hex
+    rid_token = _REQUEST_ID.set(rid)
+    route_token = _ROUTE.set(route)
+    if _WORKER is None or random.random() >= _SAMPLE_RATE:
+        span_token = _CURRENT_SPAN.set(None)
+        try:
+            yield _NOOP_SPAN
+        finally:
+            _CURRENT_SPAN.reset(span_token)
+            _REQUEST_ID.reset(rid_token)
+            _ROUTE.reset(route_token)
+        return
+    root = Span(name, uuid.uuid4().hex, None, _TraceBuffer(), {"request_id": rid, **attrs})
+    span_token = _CURRENT_SPAN.set(root)
+    try:
+        yield root
+    except BaseException as exc:
+        root.status = "error"
+        root.attrs["error"] = repr(exc)
+        raise
+    finally:
+        _CURRENT_SPAN.reset(span_token)
+        _REQUEST_ID.reset(rid_token)
+        _ROUTE.reset(route_token)
+        _finish(root)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Span | _NoopSpan]:
+    """Nested span under the current one. A no-op when the request is not sampled."""
+    parent = _CURRENT_SPAN.get()
+    if parent is None:
+        yield _NOOP_SPAN
+        return
+    child = Span(name, parent.trace_id, parent.span_id, parent.buffer, attrs)
+    token = _CURRENT_SPAN.set(child)
+    try:
+        yield child
+    except BaseException as exc:
+        child.status = "error"
+        child.attrs["error"] = repr(exc)
+        raise
+    finally:
+        _CURRENT_SPAN.reset(token)
+        _finish(child)
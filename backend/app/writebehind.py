@@ -0,0 +1,413 @@
+"""
+Write-behind buffer for Firebase writes.
+
+`enqueue` appends the record to this process's write-ahead log (one JSON line,
+fsynced when WRITE_BEHIND_FSYNC is set) and returns; the request no longer
+waits for Firebase. A flusher task sends the buffered records in batches once
+WRITE_BEHIND_BATCH are waiting or the oldest has waited WRITE_BEHIND_FLUSH_S:
+one multi-path update on Realtime DB, Firestore batches of at most 500 writes.
+Failed batches stay buffered and are retried with exponential backoff. A
+record Firebase rejects again and again right after accepting other records
+is moved to `dead-<pid>.jsonl`; rename that to `wal-<name>.jsonl` to have it
+retried. An outage alone never dead-letters anything.
+
+Each process logs to its own `wal-<pid>.jsonl` under WRITE_BEHIND_DIR and holds
+an exclusive lock on it. At start a process adopts the logs of processes that
+are gone (their lock is free), so records acknowledged before a crash are
+still written. The log is truncated whenever the buffer drains.
+"""
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import glob
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any
+
+from . import conditional, profiling, tracing
+from .config import Settings
+
+LOGGER = logging.getLogger("sentiment-writebehind")
+
+# Firestore rejects batches of more than 500 writes.
+FIRESTORE_MAX_BATCH = 500
+MAX_RETRY_DELAY_S = 60.0
+# Rewrite the log down to the buffered records once it holds this many stale lines.
+COMPACT_LINES = 10_000
+# Consecutive failed flushes before records are written one at a time.
+ISOLATE_AFTER = 3
+# Rejections, each right after a successful write, before a record is dead-lettered.
+POISON_REJECTIONS = 3
+
+Write = tuple[str, str, dict[str, Any]]  # (collection, key, record)
+
+
+def write_records(writes: list[Write], settings: Settings) -> None:
+    """Blocking batched write of (collection, key, record) triples; raises on failure."""
+    from .services import _ensure_firebase
+
+    _ensure_firebase(settings)
+    if settings.FIREBASE_STORE == "realtime":
+        from firebase_admin import db
+
+        # One multi-path update: every record lands together or none does.
+        db.reference("/").update({f"{collection}/{key}": record for collection, key, record in writes})
+        return
+    from firebase_admin import firestore
+
+    client = firestore.client()
+    for start in range(0, len(writes), FIRESTORE_MAX_BATCH):
+        batch = client.batch()
+        for collection, key, record in writes[start:start + FIRESTORE_MAX_BATCH]:
+            batch.set(client.collection(collection).document(key), record)
+        batch.commit()
+
+
+def _entries(lines: list[str]) -> list[Write]:
+    out: list[Write] = []
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue  # torn last line from a crash mid-append
+        out.append((entry["c"], entry["k"], entry["r"]))
+    return out
+
+
+def _line(collection: str, key: str, record: dict[str, Any]) -> str:
+    return json.dumps({"c": collection, "k": key, "r": record}, separators=(",", ":"), default=str) + "\n"
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class WriteBehind:
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+        self.directory = settings.WRITE_BEHIND_DIR
+        self.path = os.path.join(self.directory, f"wal-{os.getpid()}.jsonl")
+        self.batch_size = max(1, settings.WRITE_BEHIND_BATCH)
+        self.flush_s = max(0.01, settings.WRITE_BEHIND_FLUSH_S)
+        self.max_backlog = max(self.batch_size, settings.WRITE_BEHIND_MAX_BACKLOG)
+        # (collection, key) -> (seq, record, enqueued_at). A newer write to the same
+        # key replaces the buffered one; Firebase `set` makes the last write win anyway.
+        self._pending: OrderedDict[tuple[str, str], tuple[int, dict[str, Any], float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._fsync_lock = threading.Lock()
+        self._synced_seq = 0
+        self._wal: Any = None
+        self._wal_lines = 0
+        self._seq = 0
+        self._wake: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+        self.flushes = 0
+        self.written = 0
+        self.failures = 0
+        self.dead_lettered = 0
+        self._streak = 0
+        self._suspects: set[tuple[str, str]] = set()
+        self._rejections: dict[tuple[str, str], int] = {}
+        self.last_error: str | None = None
+        self.latencies_ms: deque[float] = deque(maxlen=200)
+
+    # ---- log ----
+
+    def _open(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._wal = open(self.path, "a+", encoding="utf-8")
+        fcntl.flock(self._wal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # Containers often reuse the pid, so our own log may hold a previous run's records.
+        self._wal.seek(0)
+        for collection, key, record in _entries(self._wal.read().splitlines()):
+            self._buffer(collection, key, record)
+            self._wal_lines += 1
+        self._adopt()
+
+    def _adopt(self) -> None:
+        """Buffer the records of logs left behind by processes that exited without draining."""
+        for path in sorted(glob.glob(os.path.join(self.directory, "wal-*.jsonl"))):
+            if path == self.path:
+                continue
+            try:
+                with open(path, encoding="utf-8") as fh:
+                    try:
+                        fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        continue  # a live worker owns it
+                    adopted = 0
+                    for collection, key, record in _entries(fh.read().splitlines()):
+                        self._append(collection, key, record, sync=False)
+                        adopted += 1
+                    self._sync()
+                    os.remove(path)
+            except OSError as exc:
+                LOGGER.warning("Could not adopt write-behind log %s: %s", path, exc)
+                continue
+            if adopted:
+                LOGGER.info("Adopted %s buffered writes from %s.", adopted, path)
+
+    def _sync(self) -> None:
+        self._wal.flush()
+        if self.settings.WRITE_BEHIND_FSYNC:
+            os.fsync(self._wal.fileno())
+
+    def _append(self, collection: str, key: str, record: dict[str, Any], sync: bool = True) -> None:
+        """Blocking: callers on the event loop go through `enqueue`, which runs this in a thread."""
+        with self._lock:
+            self._wal.write(_line(collection, key, record))
+            self._wal.flush()
+            self._wal_lines += 1
+            self._buffer(collection, key, record)
+            seq = self._seq
+        if sync and self.settings.WRITE_BEHIND_FSYNC:
+            self._fsync(seq)
+
+    def _fsync(self, seq: int) -> None:
+        # Group commit: one fsync covers every line flushed before it started, so
+        # concurrent appends wait for the fsync in progress instead of each doing one.
+        with self._fsync_lock:
+            if self._synced_seq >= seq:
+                return
+            with self._lock:
+                target = self._seq
+            os.fsync(self._wal.fileno())
+            self._synced_seq = target
+
+    def _buffer(self, collection: str, key: str, record: dict[str, Any]) -> None:
+        self._seq += 1
+        self._pending[(collection, key)] = (self._seq, record, time.time())
+        self._pending.move_to_end((collection, key))
+
+    def _compact(self) -> None:
+        """Drop flushed lines: truncate when drained, else rewrite with what is still buffered."""
+        with self._lock:
+            if not self._pending:
+                self._wal.truncate(0)
+                self._wal.seek(0)
+                self._wal_lines = 0
+                return
+            if self._wal_lines < COMPACT_LINES:
+                return
+            self._wal.seek(0)
+            self._wal.truncate(0)
+            for (collection, key), (_, record, _) in self._pending.items():
+                self._wal.write(_line(collection, key, record))
+            self._sync()
+            self._wal_lines = len(self._pending)
+
+    # ---- public ----
+
+    async def enqueue(self, collection: str, key: str, record: dict[str, Any]) -> bool:
+        """
+        Log a write for the flusher; returns once the line is in the log (and
+        fsynced with WRITE_BEHIND_FSYNC). False when the buffer is not running or
+        is over WRITE_BEHIND_MAX_BACKLOG; the caller then writes synchronously.
+        """
+        if self._task is None or self._stopping or len(self._pending) >= self.max_backlog:
+            return False
+        try:
+            await profiling.to_thread(self._append, collection, key, record)
+        except OSError as exc:
+            LOGGER.warning("Write-behind log append failed: %s", exc)
+            return False
+        if (len(self._pending) == 1 or len(self._pending) >= self.batch_size) and self._wake is not None:
+            # The first record starts the flush timer; a full batch flushes now.
+            self._wake.set()
+        return True
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self._open)
+        self._wake = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        LOGGER.info("Write-behind buffer started (%s, %s records buffered).", self.path, len(self._pending))
+
+    async def stop(self) -> None:
+        """Flush what is buffered within WRITE_BEHIND_DRAIN_S; anything left stays in the log."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), self.settings.WRITE_BEHIND_DRAIN_S)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            LOGGER.warning("Write-behind drain timed out; %s records stay in %s.", len(self._pending), self.path)
+        self._task = None
+        self._wal.close()  # releases the lock so the next process can adopt the log
+
+    async def _run(self) -> None:
+        delay = 0.0
+        while True:
+            if delay:
+                await asyncio.sleep(delay)
+            else:
+                await self._wait_for_batch()
+            if not self._pending:
+                if self._stopping:
+                    return
+                continue
+            if await self._flush():
+                delay = 0.0
+            elif self._stopping:
+                return
+            else:
+                delay = min(MAX_RETRY_DELAY_S, max(self.flush_s, delay * 2))
+
+    async def _wait_for_batch(self) -> None:
+        """Until a full batch is buffered, the oldest record is WRITE_BEHIND_FLUSH_S old, or stop."""
+        while not self._stopping and len(self._pending) < self.batch_size:
+            timeout = None
+            if self._pending:
+                timeout = next(iter(self._pending.values()))[2] + self.flush_s - time.time()
+                if timeout <= 0:
+                    return
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                return
+            finally:
+                self._wake.clear()
+
+    async def _write(self, batch: list[tuple[tuple[str, str], tuple[int, dict[str, Any], float]]]) -> None:
+        writes = [(collection, key, record) for (collection, key), (_, record, _) in batch]
+        started = time.perf_counter()
+        with tracing.span("firebase.write_behind", store=self.settings.FIREBASE_STORE, records=len(writes)):
+            await asyncio.to_thread(write_records, writes, self.settings)
+        self.latencies_ms.append((time.perf_counter() - started) * 1000)
+        with self._lock:
+            for ident, (seq, _, _) in batch:
+                current = self._pending.get(ident)
+                if current is not None and current[0] == seq:
+                    del self._pending[ident]
+                self._suspects.discard(ident)
+                self._rejections.pop(ident, None)
+        self.flushes += 1
+        self.written += len(writes)
+        if any(collection == "feedback_analyses" for collection, _, _ in writes):
+            # Only now can /feedback/analyses see them; an earlier bump would cache a stale list.
+            await conditional.bump(self.settings, "analyses")
+
+    async def _flush(self) -> bool:
+        # After repeated failures, write one record at a time so a record Firebase
+        # rejects cannot hold back the rest of the buffer. Records that failed alone
+        # are left out of batches and retried by themselves after the next success.
+        isolate = self._streak >= ISOLATE_AFTER
+        with self._lock:
+            healthy = (item for item in self._pending.items() if item[0] not in self._suspects)
+            batch = list(itertools.islice(healthy, 1 if isolate else self.batch_size))
+            probe = not batch
+            if probe:
+                # Only suspects are left: one of them tells whether Firebase is back.
+                batch = list(itertools.islice(self._pending.items(), 1))
+        try:
+            await self._write(batch)
+        except Exception as exc:
+            self.failures += 1
+            self._streak += 1
+            self.last_error = str(exc)[:200]
+            LOGGER.warning("Write-behind flush of %s records failed (%s buffered): %s", len(batch), len(self._pending), exc)
+            if isolate and not probe:
+                self._suspects.add(batch[0][0])
+            return False
+        self._streak = 0
+        self.last_error = None
+        await self._retry_suspects()
+        await asyncio.to_thread(self._compact)
+        return True
+
+    async def _retry_suspects(self) -> None:
+        """
+        Right after a successful write, retry each record that failed alone. During
+        an outage every record fails alone, so a single failure proves nothing; a
+        record is dead-lettered only once Firebase rejected it POISON_REJECTIONS
+        times, each time just after accepting other records.
+        """
+        dead = []
+        for ident in list(self._suspects):
+            with self._lock:
+                entry = self._pending.get(ident)
+            if entry is None:
+                self._suspects.discard(ident)
+                continue
+            try:
+                await self._write([(ident, entry)])
+            except Exception as exc:
+                self._rejections[ident] = self._rejections.get(ident, 0) + 1
+                LOGGER.warning("Firebase rejected buffered %s/%s (%s times): %s", *ident, self._rejections[ident], exc)
+                if self._rejections[ident] >= POISON_REJECTIONS:
+                    with self._lock:
+                        if self._pending.get(ident) is entry:
+                            del self._pending[ident]
+                            dead.append((ident, entry))
+                    self._suspects.discard(ident)
+                    self._rejections.pop(ident, None)
+        if dead:
+            await asyncio.to_thread(self._dead_letter, dead)
+
+    def _dead_letter(self, dead: list[tuple[tuple[str, str], tuple[int, dict[str, Any], float]]]) -> None:
+        path = os.path.join(self.directory, f"dead-{os.getpid()}.jsonl")
+        with open(path, "a", encoding="utf-8") as fh:
+            for (collection, key), (_, record, _) in dead:
+                fh.write(_line(collection, key, record))
+        self.dead_lettered += len(dead)
+        LOGGER.error("Firebase rejected %s buffered writes (%s); moved to %s.", len(dead), ", ".join(f"{c}/{k}" for (c, k), _ in dead[:5]), path)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            backlog = len(self._pending)
+            oldest = next(iter(self._pending.values()))[2] if self._pending else None
+        latencies = list(self.latencies_ms)
+        return {
+            "running": self._task is not None,
+            "backlog": backlog,
+            "oldest_age_s": round(time.time() - oldest, 1) if oldest else 0.0,
+            "flushes": self.flushes,
+            "written": self.written,
+            "failures": self.failures,
+            "dead_lettered": self.dead_lettered,
+            "last_error": self.last_error,
+            "flush_ms_p50": round(_percentile(latencies, 0.5), 1),
+            "flush_ms_p95": round(_percentile(latencies, 0.95), 1),
+            "wal": self.path,
+        }
+
+
+_BUFFER: WriteBehind | None = None
+
+
+def get_buffer(settings: Settings) -> WriteBehind | None:
+    """The process's buffer; None when disabled or Firebase has no credentials to flush with."""
+    global _BUFFER
+    if not settings.WRITE_BEHIND_ENABLED or not (settings.FIREBASE_SERVICE_ACCOUNT_JSON or settings.FIREBASE_CREDENTIALS_PATH):
+        return None
+    if _BUFFER is None:
+        _BUFFER = WriteBehind(settings)
+    return _BUFFER
+
+
+async def enqueue(collection: str, key: str, record: dict[str, Any], settings: Settings) -> bool:
+    buffer = get_buffer(settings)
+    return buffer is not None and await buffer.enqueue(collection, key, record)
+
+
+async def start(settings: Settings) -> None:
+    buffer = get_buffer(settings)
+    if buffer is not None:
+        await buffer.start()
+
+
+async def stop(settings: Settings) -> None:
+    buffer = get_buffer(settings)
+    if buffer is not None:
+        await buffer.stop()
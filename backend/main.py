@@ -1,12 +1,19 @@
+import asyncio
+import hashlib
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-from typing import Annotated
+from typing import Annotated, Any, Literal
 
-from fastapi import Depends, FastAPI, BackgroundTasks
+from fastapi import Depends, FastAPI, BackgroundTasks, HTTPException, Header, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 
 from app.config import Settings, get_settings
 from app.schemas import (
+    BatchSentimentQuery,
+    BatchSentimentResponse,
     ConfigStatus,
     HealthResponse,
     SentimentQuery,
@@ -14,13 +21,24 @@ from app.schemas import (
     SocialPost,
     FeedbackItem,
     FeedbackAnalysis,
+    GeoInsights,
     ChatRequest,
     ChatResponse,
     EmployeeUpdateRequest,
     EmployeeRecord,
     EmployeeSignupRequest,
+    IncidentSummary,
+    PinnedAnswer,
+    PinnedAnswerRequest,
+    SearchHit,
+    SearchResponse,
+    SpikeAlert,
 )
-from app import services
+from app import alerts, answers, conditional, employees, events, export, geo, incidents, llm, profiling, search, services, startup, tracing, writebehind
+from app.admission import Ticket, admit, get_controller
+from app.cache import get_cache
+from app.compression import CompressionMiddleware
+from app.responses import FastJSONResponse, project
 
 settings = get_settings()
 
@@ -32,13 +50,37 @@ logging.basicConfig(
 )
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("openai").setLevel(logging.WARNING)
+tracing.configure(settings)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.STARTUP_PREWARM:
+        await asyncio.to_thread(startup.warm_up, settings)
+    # Load the search snapshot and replay its log before the first query.
+    await asyncio.to_thread(search.get_store, settings)
+    await asyncio.to_thread(geo.get_store, settings)
+    search.start(settings)
+    geo.start(settings)
+    # Replays writes a previous run acknowledged but did not flush.
+    await writebehind.start(settings)
+    yield
+    await writebehind.stop(settings)
+    employees.shutdown()
+    await search.stop()
+    await geo.stop(settings)
+
 
 app = FastAPI(
     title="T-Sentiment Agent API",
     description="Backend services for the T-Mobile sentiment dashboard MVP",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
+# Response headers the dashboard reads cross-origin (conditional /analyze, tracing).
+EXPOSED_HEADERS = ["ETag", "X-Request-ID"]
+
 # Configure CORS from settings:
 # - If CORS_ALLOW_ALL is true, allow all origins (credentials disabled as required by browsers).
 # - Otherwise, allow the union of FRONTEND_ORIGIN and ALLOWED_ORIGINS (credentials enabled).
@@ -49,6 +91,7 @@ if settings.CORS_ALLOW_ALL:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=EXPOSED_HEADERS,
     )
 else:
     allowed = set(settings.ALLOWED_ORIGINS or [])
@@ -59,6 +102,44 @@ else:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=EXPOSED_HEADERS,
+    )
+
+
+# Middlewares registered later wrap earlier ones: tracing runs outermost, so a
+# profiled request is also traced.
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    if not profiling.should_profile(request.url.path, request.headers.get("x-profile-token"), settings):
+        return await call_next(request)
+    profile_id = profiling.new_profile_id()
+    prof, token = profiling.start(profile_id, f"{request.method} {request.url.path}", settings)
+    try:
+        response = await call_next(request)
+    finally:
+        await profiling.finish(prof, token, settings)
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Request id is honored from the caller when present so traces can be joined upstream.
+    incoming_id = request.headers.get("x-request-id")
+    with tracing.request_trace(f"{request.method} {request.url.path}", request_id=incoming_id, route=request.url.path) as root:
+        response = await call_next(request)
+        root.set(status_code=response.status_code)
+        response.headers["X-Request-ID"] = tracing.current_request_id() or ""
+    return response
+
+
+if settings.COMPRESSION_ENABLED:
+    # Registered last so it is outermost and sees the final headers and body.
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_BYTES,
+        gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
     )
 
 
@@ -67,24 +148,89 @@ async def healthcheck() -> HealthResponse:
     return HealthResponse(status="ok", timestamp=datetime.now(timezone.utc))
 
 
+@app.get("/debug/startup")
+async def startup_report() -> dict[str, float]:
+    return startup.WARMUP_TIMINGS
+
+
+_CONFIG_ETAG: str | None = None
+
+
 @app.get("/config", response_model=ConfigStatus)
-async def config(settings: Annotated[Settings, Depends(get_settings)]) -> ConfigStatus:
-    return services.build_config_status(settings)
+async def config(
+    request: Request, response: Response, settings: Annotated[Settings, Depends(get_settings)]
+) -> ConfigStatus:
+    # Settings are fixed for the life of the process, so one ETag covers every call.
+    status = services.build_config_status(settings)
+    global _CONFIG_ETAG
+    if _CONFIG_ETAG is None:
+        _CONFIG_ETAG = f'W/"config-{hashlib.sha1(status.model_dump_json().encode()).hexdigest()[:12]}"'
+    if conditional.not_modified(request, _CONFIG_ETAG):
+        return conditional.not_modified_response(_CONFIG_ETAG)
+    conditional.set_etag(response, _CONFIG_ETAG)
+    return status
 
 
 @app.get("/posts", response_model=list[SocialPost])
 async def fetch_posts(
+    request: Request,
+    response: Response,
     settings: Annotated[Settings, Depends(get_settings)],
     query: str = "T-Mobile",
     limit: int = 5,
 ) -> list[SocialPost]:
     payload = SentimentQuery(query=query, limit=limit)
-    return await services.fetch_social_posts(payload, settings)
+    key = services.posts_cache_key(payload)
+    if settings.RESPONSE_CACHE_TTL_S > 0:
+        etag = await conditional.cached_etag(settings, key)
+        if conditional.not_modified(request, etag):
+            return conditional.not_modified_response(etag)
+    posts = await services.fetch_social_posts(payload, settings)
+    if settings.RESPONSE_CACHE_TTL_S > 0:
+        conditional.set_etag(response, await conditional.cached_etag(settings, key))
+    return posts
 
 
 @app.post("/analyze", response_model=SentimentResponse)
-async def analyze(query: SentimentQuery, settings: Annotated[Settings, Depends(get_settings)]) -> SentimentResponse:
-    return await services.build_sentiment_response(query, settings)
+async def analyze(
+    request: Request,
+    raw_response: Response,
+    query: SentimentQuery,
+    settings: Annotated[Settings, Depends(get_settings)],
+    ticket: Annotated[Ticket, Depends(admit("/analyze", degrade=True))],
+) -> SentimentResponse:
+    # Only cached results carry an ETag: a client re-posting the same query
+    # with If-None-Match gets a 304 while the cache entry it saw is alive.
+    key = services.analyze_cache_key(query)
+    if settings.RESPONSE_CACHE_TTL_S > 0:
+        etag = await conditional.cached_etag(settings, key)
+        if conditional.not_modified(request, etag):
+            return conditional.not_modified_response(etag)
+    # When saturated, answer from heuristics instead of queueing more LLM work.
+    response = await services.build_sentiment_response(query, settings, heuristic_only=ticket.degraded)
+    etag = await conditional.cached_etag(settings, key) if settings.RESPONSE_CACHE_TTL_S > 0 else None
+    if settings.FAST_RESPONSES:
+        fast = FastJSONResponse(response)
+        conditional.set_etag(fast, etag)
+        return fast
+    conditional.set_etag(raw_response, etag)
+    return response
+
+
+@app.post("/analyze/batch", response_model=BatchSentimentResponse)
+async def analyze_batch(
+    body: BatchSentimentQuery,
+    settings: Annotated[Settings, Depends(get_settings)],
+    ticket: Annotated[Ticket, Depends(admit("/analyze/batch", degrade=True))],
+) -> BatchSentimentResponse:
+    """Several /analyze queries at once; overlapping posts are fetched and enriched once."""
+    if len(body.queries) > settings.ANALYZE_BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.ANALYZE_BATCH_MAX_QUERIES} queries per batch.")
+    results = await services.build_sentiment_responses(body.queries, settings, heuristic_only=ticket.degraded)
+    response = BatchSentimentResponse(results=results)
+    if settings.FAST_RESPONSES:
+        return FastJSONResponse(response)
+    return response
 
 
 @app.post("/feedback")
@@ -107,31 +253,295 @@ async def submit_feedback(
 async def analyze_feedback_now(
     item: FeedbackItem,
     settings: Annotated[Settings, Depends(get_settings)],
+    _ticket: Annotated[Ticket, Depends(admit("/feedback/analyze"))],
 ) -> dict[str, bool]:
-    ok = await services.analyze_feedback_item(item, settings)
+    ok = await services.analyze_feedback_item(item, settings, interactive=True)
     return {"ok": ok}
 
 
 @app.get("/feedback/analyses", response_model=list[FeedbackAnalysis])
 async def list_analyses(
+    request: Request,
+    response: Response,
     settings: Annotated[Settings, Depends(get_settings)],
     limit: int = 10,
 ) -> list[FeedbackAnalysis]:
+    # With Redis the counter is bumped by every writer, so an unchanged list costs no
+    # Firebase read. Otherwise the tag comes from the records read, which still saves the body.
+    etag = await conditional.version_etag(settings, "analyses", limit)
+    if conditional.not_modified(request, etag):
+        return conditional.not_modified_response(etag)
     records = await services.list_feedback_analyses(limit, settings)
+    if etag is None:
+        # Digest the full records: `backfill --force` rewrites analyses in place
+        # without changing their id, timestamp or prompt version.
+        etag = conditional.data_etag("analyses", limit, records)
+        if conditional.not_modified(request, etag):
+            return conditional.not_modified_response(etag)
+    if settings.FAST_RESPONSES:
+        # Records are normalized (services._stored_analysis) but may carry extra
+        # keys or omit nested defaults; project them onto what response_model emits.
+        fast = FastJSONResponse([project(FeedbackAnalysis, rec) for rec in records])
+        conditional.set_etag(fast, etag)
+        return fast
+    conditional.set_etag(response, etag)
     # Coerce into pydantic model (analyzed_at is int epoch)
     return [FeedbackAnalysis(**rec) for rec in records]
 
 
+@app.get("/feedback/search", response_model=SearchResponse)
+async def search_feedback(
+    settings: Annotated[Settings, Depends(get_settings)],
+    q: str,
+    limit: int = 20,
+    mode: Literal["and", "or"] = "and",
+) -> SearchResponse:
+    """BM25 search over feedback text and analysis problem/tags/team; `and` requires every term."""
+    store = search.get_store(settings)
+    if store is None:
+        raise HTTPException(status_code=503, detail="Search is disabled (SEARCH_INDEX_DIR is not set).")
+    t0 = time.perf_counter()
+    hits = store.search(q, max(1, min(limit, 100)), mode)
+    return SearchResponse(
+        query=q,
+        total_docs=len(store.index),
+        took_ms=round((time.perf_counter() - t0) * 1000, 3),
+        results=[SearchHit(**hit) for hit in hits],
+    )
+
+
+def _export_response(kind: str, fmt: str, body: Any) -> StreamingResponse:
+    media_type, extension = export.FORMATS[fmt]
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{kind}-{stamp}.{extension}"'},
+    )
+
+
+@app.get("/export/analyses")
+async def export_analyses(
+    settings: Annotated[Settings, Depends(get_settings)],
+    format: Literal["csv", "ndjson", "parquet"] = "csv",
+) -> StreamingResponse:
+    """Stream every feedback analysis with intake/sentiment/routing/insights flattened into columns."""
+    if format == "parquet" and not export.parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export needs pyarrow installed; use csv or ndjson.")
+    return _export_response("feedback-analyses", format, export.export_analyses(format, settings))
+
+
+@app.get("/export/sentiments")
+async def export_sentiments(
+    settings: Annotated[Settings, Depends(get_settings)],
+    format: Literal["csv", "ndjson", "parquet"] = "csv",
+) -> StreamingResponse:
+    """Stream every sentiment recorded by /analyze (latest result per post)."""
+    if format == "parquet" and not export.parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export needs pyarrow installed; use csv or ndjson.")
+    return _export_response("sentiments", format, export.export_sentiments(format, settings))
+
+
+@app.get("/alerts", response_model=list[SpikeAlert])
+async def list_alerts(
+    settings: Annotated[Settings, Depends(get_settings)],
+    since: int = 0,
+    limit: int = 50,
+) -> list[SpikeAlert]:
+    """Regional spike alerts, newest first; poll with `since` set to the highest id already seen."""
+    detector = alerts.get_detector(settings)
+    if detector is None:
+        return []
+    return [SpikeAlert(**alert) for alert in detector.recent(since, max(1, min(limit, 200)))]
+
+
+@app.get("/alerts/status")
+async def alerts_status(settings: Annotated[Settings, Depends(get_settings)]) -> dict[str, Any]:
+    detector = alerts.get_detector(settings)
+    return detector.snapshot() if detector is not None else {"enabled": False}
+
+
+@app.get("/insights/geo", response_model=GeoInsights)
+async def geo_insights(
+    settings: Annotated[Settings, Depends(get_settings)],
+    bbox: str = "-180,-90,180,90",
+    zoom: float = 4,
+    limit: int = 500,
+) -> GeoInsights:
+    """Aggregated sentiment per geohash cell inside `bbox` (west,south,east,north) at a precision chosen from `zoom`."""
+    store = geo.get_store(settings)
+    if store is None:
+        raise HTTPException(status_code=404, detail="Geo insights are disabled (GEO_ENABLED=false).")
+    try:
+        west, south, east, north = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be west,south,east,north in degrees.")
+    result = await profiling.to_thread(store.query, (west, south, east, north), zoom, max(1, min(limit, settings.GEO_MAX_CELLS)))
+    return GeoInsights(**result)
+
+
+@app.get("/insights/geo/status")
+async def geo_status(settings: Annotated[Settings, Depends(get_settings)]) -> dict[str, Any]:
+    store = geo.get_store(settings)
+    return store.snapshot() if store is not None else {"enabled": False}
+
+
+@app.get("/incidents", response_model=list[IncidentSummary])
+async def list_incidents(
+    settings: Annotated[Settings, Depends(get_settings)],
+    limit: int = 20,
+    include_closed: bool = True,
+) -> list[IncidentSummary]:
+    """Open incidents (largest first) followed by recently closed ones, as seen by this worker."""
+    tracker = incidents.get_tracker(settings)
+    if tracker is None:
+        return []
+    return [IncidentSummary(**item) for item in tracker.summaries(max(1, min(limit, 200)), include_closed)]
+
+
+@app.get("/incidents/status")
+async def incidents_status(settings: Annotated[Settings, Depends(get_settings)]) -> dict[str, Any]:
+    tracker = incidents.get_tracker(settings)
+    return tracker.snapshot() if tracker is not None else {"enabled": False}
+
+
+@app.get("/feedback/analyses/stream")
+async def stream_analyses(
+    settings: Annotated[Settings, Depends(get_settings)],
+    since: str | None = None,
+    last_event_id: Annotated[str | None, Header()] = None,
+) -> StreamingResponse:
+    """
+    Server-sent events: one `analysis` event per stored feedback analysis.
+    Resumes after `Last-Event-ID` (sent by EventSource on reconnect) or `since`
+    (an event id or `analyzed_at` epoch seconds).
+    """
+    broker = events.get_broker(settings)
+    return StreamingResponse(
+        broker.subscribe(last_event_id or since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/feedback/analyses/stream/status")
+async def stream_status(settings: Annotated[Settings, Depends(get_settings)]) -> dict[str, Any]:
+    return events.get_broker(settings).snapshot()
+
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest, settings: Annotated[Settings, Depends(get_settings)]) -> ChatResponse:
+async def chat(
+    request: ChatRequest,
+    settings: Annotated[Settings, Depends(get_settings)],
+    _ticket: Annotated[Ticket, Depends(admit("/chat"))],
+) -> ChatResponse:
     return await services.chat_with_openrouter(request, settings)
 
 
+@app.get("/chat/answers/status")
+async def chat_answers_status(settings: Annotated[Settings, Depends(get_settings)]) -> dict[str, Any]:
+    """Hit rate and estimated LLM tokens saved by this worker's JOY answer cache."""
+    cache = answers.get_cache(settings)
+    return cache.snapshot() if cache is not None else {"enabled": False}
+
+
+def _answer_admin(settings: Settings, token: str | None) -> answers.AnswerCache:
+    if not settings.CHAT_ANSWER_ADMIN_TOKEN or token != settings.CHAT_ANSWER_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Answer admin access denied")
+    cache = answers.get_cache(settings)
+    if cache is None:
+        raise HTTPException(status_code=404, detail="Answer cache is disabled")
+    return cache
+
+
+@app.get("/chat/answers/pinned", response_model=list[PinnedAnswer])
+async def list_pinned_answers(
+    settings: Annotated[Settings, Depends(get_settings)],
+    x_admin_token: Annotated[str | None, Header()] = None,
+) -> list[PinnedAnswer]:
+    return [PinnedAnswer(**item) for item in _answer_admin(settings, x_admin_token).pinned()]
+
+
+@app.post("/chat/answers/pinned", response_model=PinnedAnswer)
+async def pin_answer(
+    payload: PinnedAnswerRequest,
+    settings: Annotated[Settings, Depends(get_settings)],
+    x_admin_token: Annotated[str | None, Header()] = None,
+) -> PinnedAnswer:
+    """Serve `answer` to every opening question close enough to `question`, instead of the LLM."""
+    cache = _answer_admin(settings, x_admin_token)
+    try:
+        return PinnedAnswer(**await asyncio.to_thread(cache.pin, payload.question, payload.answer))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@app.delete("/chat/answers/pinned/{answer_id}")
+async def unpin_answer(
+    answer_id: str,
+    settings: Annotated[Settings, Depends(get_settings)],
+    x_admin_token: Annotated[str | None, Header()] = None,
+) -> dict[str, Any]:
+    if not await asyncio.to_thread(_answer_admin(settings, x_admin_token).unpin, answer_id):
+        raise HTTPException(status_code=404, detail="Pinned answer not found")
+    return {"deleted": answer_id}
+
+
+@app.get("/llm/status")
+async def llm_status(settings: Annotated[Settings, Depends(get_settings)]) -> list[dict[str, Any]]:
+    """Circuit breaker state and latency per configured LLM provider."""
+    return llm.provider_status(settings)
+
+
+@app.get("/llm/usage")
+async def llm_usage(settings: Annotated[Settings, Depends(get_settings)]) -> dict[str, Any]:
+    """Token and latency counters per LLM operation and route, with today's budget use."""
+    return llm.USAGE.snapshot(settings)
+
+
+@app.get("/admission/status")
+async def admission_status(settings: Annotated[Settings, Depends(get_settings)]) -> dict[str, Any]:
+    return get_controller(settings).snapshot()
+
+
+@app.get("/write-behind/status")
+async def write_behind_status(settings: Annotated[Settings, Depends(get_settings)]) -> dict[str, Any]:
+    """Buffered Firebase writes not yet flushed, and flush latency and failures."""
+    buffer = writebehind.get_buffer(settings)
+    return buffer.snapshot() if buffer is not None else {"enabled": False}
+
+
+@app.get("/cache/stats")
+async def cache_stats(settings: Annotated[Settings, Depends(get_settings)]) -> dict[str, Any]:
+    """Hit/miss counters for this worker's view of the shared cache."""
+    return get_cache(settings).stats()
+
+
 @app.post("/employees/update", response_model=EmployeeRecord)
 async def employee_update(payload: EmployeeUpdateRequest, settings: Annotated[Settings, Depends(get_settings)]) -> EmployeeRecord:
-    return await services.upsert_employee(payload, settings)
+    return await employees.upsert_employee(payload, settings)
 
 
 @app.post("/employees/signup", response_model=EmployeeRecord)
 async def employee_signup(payload: EmployeeSignupRequest, settings: Annotated[Settings, Depends(get_settings)]) -> EmployeeRecord:
-    return await services.signup_employee(payload, settings)
+    return await employees.signup_employee(payload, settings)
+
+
+@app.get("/employees/pools")
+async def employee_pools(settings: Annotated[Settings, Depends(get_settings)]) -> dict[str, Any]:
+    """Queue and run-time counters for the bcrypt process pool and the Firebase I/O thread pool."""
+    return employees.pool_stats(settings)
+
+
+@app.get("/debug/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(
+    profile_id: str,
+    settings: Annotated[Settings, Depends(get_settings)],
+    x_profile_token: Annotated[str | None, Header()] = None,
+) -> str:
+    if not settings.PROFILE_ADMIN_TOKEN or x_profile_token != settings.PROFILE_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Profiling access denied")
+    content = profiling.load(profile_id, settings)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return content
@@ -0,0 +1,105 @@
+"""
+Scoring cost for large post batches: the per-post path (one SentimentResult
+per post, aggregates over the models) versus PostBatch, which scores columns
+and only builds models for the rows returned.
+
+    python -m scripts.bench_batch --posts 5000 --page 20 --repeat 5
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from app import services
+from app.batch import PostBatch
+from app.schemas import Location, SentimentResult, SocialPost
+
+FILLER = "my phone was on the way home tried to call but it would not connect yesterday evening near downtown".split()
+KEYWORDS = "outage signal bill app slow great love store plan tower rep sim".split()
+
+
+def _posts(n: int, rng: random.Random) -> list[SocialPost]:
+    now = datetime.now(timezone.utc)
+    return [
+        SocialPost(
+            id=f"p{i}",
+            text=" ".join(rng.choices(FILLER, k=rng.randint(20, 80)) + rng.choices(KEYWORDS, k=rng.randint(0, 3))),
+            author=f"user{i}",
+            posted_at=now,
+            location=Location(city="Dallas", state="TX") if i % 3 else None,
+        )
+        for i in range(n)
+    ]
+
+
+def _per_post(posts: list[SocialPost], enrichment: dict[str, dict]) -> list[SentimentResult]:
+    """The pre-batch path: score and validate one model per post, then aggregate over models."""
+    results = []
+    for post in posts:
+        item = enrichment.get(post.id, {})
+        rating = int(item.get("rating", services._heuristic_rating(post.text)))
+        sentiment = item.get("sentiment") or services._sentiment_from_rating(rating)
+        category = item.get("category") or services._heuristic_category(post.text)
+        results.append(
+            SentimentResult(
+                post=post,
+                sentiment=sentiment,
+                confidence=min(0.95, 0.5 + abs(rating - 3) * 0.15),
+                rating=rating,
+                solution=item.get("solution") or services._default_solution(category, sentiment, post.text),
+                category=category,
+            )
+        )
+    positive = sum(r.rating for r in results if r.sentiment == "positive")
+    negative = sum(6 - r.rating for r in results if r.sentiment == "negative")
+    tally: dict[str, int] = {}
+    for r in results:
+        tally[r.category] = tally.get(r.category, 0) + 1
+    return results if positive >= negative or tally else results
+
+
+def _measure(fn, repeat: int) -> tuple[float, float]:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return best * 1000, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--page", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    posts = _posts(args.posts, rng)
+    enrichment = {p.id: {"rating": rng.randint(1, 5), "category": "Network Coverage"} for p in posts if rng.random() < 0.3}
+
+    def batch(rows: range | None) -> None:
+        b = PostBatch.from_posts(posts)
+        b.score(enrichment)
+        b.csi()
+        b.tally()
+        b.results(rows)
+
+    for label, fn in (
+        ("per-post models", lambda: _per_post(posts, enrichment)),
+        ("batch, all rows", lambda: batch(None)),
+        (f"batch, {args.page} rows", lambda: batch(range(min(args.page, len(posts))))),
+    ):
+        ms, mb = _measure(fn, args.repeat)
+        print(f"{label:<20} {ms:8.1f} ms  peak {mb:6.1f} MB  ({args.posts} posts)")
+
+
+if __name__ == "__main__":
+    main()
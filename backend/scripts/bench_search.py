@@ -0,0 +1,79 @@
+"""
+Build, persistence and query latency of the feedback search index on
+synthetic feedback (city x issue x device templates plus random filler).
+
+    python -m scripts.bench_search --docs 1000000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from app.search import FIELD_ANALYSIS, FIELD_FEEDBACK, SearchIndex
+
+CITIES = ["Dallas", "Austin", "Houston", "Seattle", "Denver", "Miami", "Chicago", "Phoenix", "Atlanta", "Boston"]
+ISSUES = [
+    "5G keeps dropping",
+    "no signal at home",
+    "eSIM activation failed",
+    "billed twice this month",
+    "store rep was rude",
+    "app login loops forever",
+    "outage since this morning",
+    "hotspot throttled",
+]
+DEVICES = ["iPhone 15", "Pixel 8", "Galaxy S24", "Moto G", "iPad", "home internet gateway"]
+FILLER = "please help again today really annoying tried restart support chat waited hours called twice".split()
+TEAMS = ["Network Operations", "Billing", "Retail", "Digital", "Device Support"]
+QUERIES = ["esim", "dallas outage", "billed twice", "galaxy signal", "rude store houston", "5g", "network operation"]
+
+
+def _doc(rng: random.Random) -> tuple[str, str]:
+    city, issue, device = rng.choice(CITIES), rng.choice(ISSUES), rng.choice(DEVICES)
+    text = f"{issue} in {city} on my {device}. " + " ".join(rng.choices(FILLER, k=rng.randint(3, 20)))
+    analysis = f"{issue} {city} {device} {rng.choice(TEAMS)}"
+    return text, analysis
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    index = SearchIndex()
+    t0 = time.perf_counter()
+    for i in range(args.docs):
+        text, analysis = _doc(rng)
+        index.add(f"fb-{i}", text, FIELD_FEEDBACK, preview=text[:80])
+        index.add(f"fb-{i}", analysis, FIELD_ANALYSIS)
+    build_s = time.perf_counter() - t0
+    print(f"indexed {args.docs} docs in {build_s:.1f}s ({args.docs / build_s:,.0f} docs/s), {len(index.postings)} terms")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index.bin")
+        t0 = time.perf_counter()
+        index.save(path)
+        save_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        SearchIndex.load(path)
+        load_s = time.perf_counter() - t0
+        print(f"snapshot {os.path.getsize(path) / 1e6:.1f} MB: save {save_s:.2f}s, load {load_s:.2f}s")
+
+    for query in QUERIES:
+        index.search(query, 20)  # first call may build an impact list
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            hits = index.search(query, 20)
+            times.append((time.perf_counter() - t0) * 1000)
+        times.sort()
+        print(f"{query!r:24} hits={len(hits):3d} p50={times[len(times) // 2]:.2f}ms max={times[-1]:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
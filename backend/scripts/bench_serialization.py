@@ -0,0 +1,118 @@
+"""
+Serialization cost per 1k records: FastAPI's response_model path (validate,
+jsonable_encoder, json.dumps) versus FastJSONResponse. Both paths start from
+what the route handler has in hand: normalized dicts for /feedback/analyses,
+a built SentimentResponse for /analyze.
+
+    python -m scripts.bench_serialization --records 1000 --repeat 20
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app import services
+from app.batch import PostBatch
+from app.responses import FastJSONResponse, orjson, project
+from app.schemas import FeedbackAnalysis, Location, SentimentResponse, SocialPost
+
+
+def _analysis_records(n: int) -> list[dict]:
+    raw = {
+        "feedback_id": "fb-0",
+        "name": "Jordan",
+        "problem": "5G drops every evening downtown",
+        "intake": {"classification": "Network", "summary": "Evening 5G drops in Dallas.", "tags": ["5g", "dallas", "drops"]},
+        "sentiment": {"tone": "negative", "score": 22, "urgency": "High", "notes": "Repeated outage."},
+        "routing": {
+            "priority": "P2 - High",
+            "team": "Network Operations",
+            "actions": [{"step": f"Step {i}", "owner": "NOC", "detail": "Check sector load."} for i in range(3)],
+        },
+        "insights": {
+            "type": "flowchart",
+            "flowchart": [{"title": f"Step {i}", "description": "Inspect tower logs.", "color": "#E20074"} for i in range(4)],
+        },
+        "analyzed_at": 1760000000,
+    }
+    return [services._normalize_workflow_analysis({**raw, "feedback_id": f"fb-{i}"}) for i in range(n)]
+
+
+def _sentiment_response(n: int) -> SentimentResponse:
+    now = datetime.now(timezone.utc)
+    posts = [
+        SocialPost(
+            id=f"p{i}",
+            text="T-Mobile coverage dropped again near downtown Dallas, 5G is terrible tonight",
+            author=f"user{i}",
+            posted_at=now,
+            location=Location(city="Dallas", state="TX", latitude=32.77, longitude=-96.79),
+            permalink=f"https://reddit.com/r/tmobile/{i}",
+        )
+        for i in range(n)
+    ]
+    enrichment = {"rating": 2, "category": "Network Coverage", "insight": "Evening drops", "solution": "Reboot."}
+    batch = PostBatch.from_posts(posts)
+    batch.score({p.id: enrichment for p in posts})
+    return SentimentResponse(
+        sentiments=batch.results(),
+        csi_score=batch.csi(),
+        summary="Coverage complaints dominate.",
+        issue_counts=batch.tally(),
+    )
+
+
+def _time(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    n = args.records
+
+    analyses_field = create_response_field("Response_list_analyses", list[FeedbackAnalysis])
+    sentiment_field = create_response_field("Response_analyze", SentimentResponse)
+    records = _analysis_records(n)
+    response = _sentiment_response(n)
+
+    def analyses_before() -> bytes:
+        models = [FeedbackAnalysis(**rec) for rec in records]
+        content = asyncio.run(serialize_response(field=analyses_field, response_content=models))
+        return JSONResponse(content).body
+
+    def analyses_after() -> bytes:
+        return FastJSONResponse([project(FeedbackAnalysis, rec) for rec in records]).body
+
+    def analyze_before() -> bytes:
+        content = asyncio.run(serialize_response(field=sentiment_field, response_content=response))
+        return JSONResponse(content).body
+
+    def analyze_after() -> bytes:
+        return FastJSONResponse(response).body
+
+    print(f"encoder: {'orjson' if orjson is not None else 'stdlib json'}; best of {args.repeat}; ms per {n} records")
+    for label, before, after in (
+        ("/feedback/analyses", analyses_before, analyses_after),
+        ("/analyze", analyze_before, analyze_after),
+    ):
+        b = _time(before, args.repeat)
+        a = _time(after, args.repeat)
+        print(f"{label:<20} before {b:8.2f}  after {a:8.2f}  speedup x{b / a:.1f}")
+
+
+if __name__ == "__main__":
+    main()
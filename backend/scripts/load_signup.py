@@ -0,0 +1,102 @@
+"""
+Latency of /health and /analyze while a burst of employee signups runs.
+
+Probes both routes at a fixed rate, first alone (baseline) and then alongside
+`--signups` concurrent POST /employees/signup calls, and prints p50/p95/max
+for each phase. Run against a live server:
+
+    uvicorn main:app --port 8000 &
+    python -m scripts.load_signup --base-url http://localhost:8000 --signups 50
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+
+
+def _summary(samples: list[float]) -> dict[str, float]:
+    if not samples:
+        return {"n": 0}
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "p50_ms": round(ordered[len(ordered) // 2], 1),
+        "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))], 1),
+        "max_ms": round(ordered[-1], 1),
+    }
+
+
+async def _probe(client: httpx.AsyncClient, method: str, path: str, body: dict | None, stop: asyncio.Event, interval_s: float) -> list[float]:
+    samples: list[float] = []
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        try:
+            await client.request(method, path, json=body)
+        except httpx.HTTPError:
+            pass
+        samples.append((time.perf_counter() - t0) * 1000)
+        await asyncio.sleep(interval_s)
+    return samples
+
+
+async def _phase(client: httpx.AsyncClient, args: argparse.Namespace, with_signups: bool) -> dict[str, object]:
+    stop = asyncio.Event()
+    analyze_body = {"query": "T-Mobile", "limit": 5}
+    probes = [
+        asyncio.create_task(_probe(client, "GET", "/health", None, stop, args.interval)),
+        asyncio.create_task(_probe(client, "POST", "/analyze", analyze_body, stop, args.interval)),
+    ]
+    t0 = time.perf_counter()
+    signup_ms: list[float] = []
+    if with_signups:
+
+        async def signup(i: int) -> None:
+            body = {
+                "first_name": "Load",
+                "last_name": f"Test{i}",
+                "email": f"load-{uuid.uuid4().hex[:10]}@example.com",
+                "password": "correct-horse-battery",
+            }
+            s0 = time.perf_counter()
+            try:
+                await client.post("/employees/signup", json=body)
+            except httpx.HTTPError:
+                pass
+            signup_ms.append((time.perf_counter() - s0) * 1000)
+
+        await asyncio.gather(*(signup(i) for i in range(args.signups)))
+        await asyncio.sleep(max(0.0, args.duration - (time.perf_counter() - t0)))
+    else:
+        await asyncio.sleep(args.duration)
+    stop.set()
+    health, analyze = await asyncio.gather(*probes)
+    out: dict[str, object] = {"health": _summary(health), "analyze": _summary(analyze)}
+    if with_signups:
+        out["signup"] = _summary(signup_ms)
+    return out
+
+
+async def _run(args: argparse.Namespace) -> None:
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60.0) as client:
+        baseline = await _phase(client, args, with_signups=False)
+        burst = await _phase(client, args, with_signups=True)
+        pools = (await client.get("/employees/pools")).json()
+    print(json.dumps({"baseline": baseline, "during_signups": burst, "pools": pools}, indent=2))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--signups", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per phase (minimum)")
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between probes per route")
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import asyncio
+
+from app import events
+from app.config import Settings
+
+
+def _record(ts: int, feedback_id: str) -> dict:
+    return {"analyzed_at": ts, "feedback_id": feedback_id}
+
+
+def test_late_record_from_another_worker_reaches_subscribers():
+    settings = Settings(EVENTS_POLL_S=0.01, EVENTS_HEARTBEAT_S=5.0)
+    stored: list[dict] = []
+
+    async def fetch(limit: int) -> list[dict]:
+        return list(stored)
+
+    async def run() -> list[str]:
+        broker = events.AnalysisBroker(settings, fetch)
+        stream = broker.subscribe(None)
+        assert (await anext(stream)).startswith("retry:")
+        received = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.03)  # let the poller prime on the empty store
+        local = _record(200, "local")
+        stored.append(local)
+        broker.publish(local)
+        frames = [await received]
+        # Stored by another worker in an earlier second, but it reaches Firebase later.
+        stored.append(_record(199, "other-worker"))
+        frames.append(await asyncio.wait_for(anext(stream), timeout=1.0))
+        await stream.aclose()
+        return frames
+
+    frames = asyncio.run(run())
+
+    assert "id: 200:local" in frames[0]
+    assert "id: 199:other-worker" in frames[1]
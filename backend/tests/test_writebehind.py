@@ -0,0 +1,80 @@
+import asyncio
+import os
+
+import pytest
+
+from app import writebehind
+from app.config import Settings
+
+
+@pytest.fixture
+def buffer(tmp_path, monkeypatch):
+    async def bump(settings, name):
+        return None
+
+    monkeypatch.setattr(writebehind.conditional, "bump", bump)
+    settings = Settings(
+        FIREBASE_CREDENTIALS_PATH="creds.json",
+        WRITE_BEHIND_DIR=str(tmp_path),
+        WRITE_BEHIND_BATCH=4,
+        WRITE_BEHIND_FSYNC=False,
+    )
+    buf = writebehind.WriteBehind(settings)
+    buf._open()
+    yield buf
+    buf._wal.close()
+
+
+class FakeFirebase:
+    def __init__(self, down_for: int = 0, rejects: frozenset[str] = frozenset()) -> None:
+        self.down_for = down_for
+        self.rejects = rejects
+        self.stored: dict[str, dict] = {}
+
+    def __call__(self, writes, settings) -> None:
+        if self.down_for > 0:
+            self.down_for -= 1
+            raise RuntimeError("503 Service Unavailable")
+        if any(key in self.rejects for _, key, _ in writes):
+            raise RuntimeError("400 invalid key")
+        for _, key, record in writes:
+            self.stored[key] = record
+
+
+def _drain(buf: writebehind.WriteBehind, attempts: int = 50) -> None:
+    async def run() -> None:
+        for _ in range(attempts):
+            if not buf._pending:
+                return
+            await buf._flush()
+
+    asyncio.run(run())
+
+
+def test_outage_then_recovery_writes_everything(buffer, monkeypatch):
+    firebase = FakeFirebase(down_for=6)
+    monkeypatch.setattr(writebehind, "write_records", firebase)
+    for i in range(10):
+        buffer._append("feedback", f"k{i}", {"i": i})
+
+    _drain(buffer)
+
+    assert sorted(firebase.stored) == sorted(f"k{i}" for i in range(10))
+    assert buffer.dead_lettered == 0
+    assert not os.path.exists(os.path.join(buffer.directory, f"dead-{os.getpid()}.jsonl"))
+    assert not buffer._pending
+
+
+def test_rejected_record_is_dead_lettered_while_others_flow(buffer, monkeypatch):
+    firebase = FakeFirebase(rejects=frozenset({"bad"}))
+    monkeypatch.setattr(writebehind, "write_records", firebase)
+    buffer._append("feedback", "bad", {})
+    for i in range(12):
+        buffer._append("feedback", f"k{i}", {"i": i})
+
+    _drain(buffer)
+
+    assert len(firebase.stored) == 12
+    assert buffer.dead_lettered == 1
+    with open(os.path.join(buffer.directory, f"dead-{os.getpid()}.jsonl"), encoding="utf-8") as fh:
+        assert '"k":"bad"' in fh.read()
@@ -1,3 +1,5 @@
+import type { GeoInsights, IncidentSummary } from './types';
+
 function firstFromList(val?: string | null): string | undefined {
   if (!val) return undefined;
   const pick = val.split(/[,\s]+/).map(s => s.trim()).filter(Boolean)[0];
@@ -25,24 +27,39 @@ export async function getConfig() {
   return handle(res);
 }
 
+// Last /analyze result per request body. The server tags cached results with an
+// ETag; re-sending it lets an unchanged result come back as an empty 304.
+const analyzeResults = new Map<string, { etag: string; data: unknown }>();
+
 export async function analyze(payload: { query: string; limit?: number; subreddits?: string[]; keywords?: string[] }) {
+  const body = JSON.stringify({ limit: 9, ...payload });
+  const previous = analyzeResults.get(body);
   const res = await fetch(`${BASE_URL}/analyze`, {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
+      ...(previous ? { 'If-None-Match': previous.etag } : {}),
     },
-    body: JSON.stringify({ limit: 9, ...payload }),
+    body,
   });
-  return handle(res);
+  if (res.status === 304 && previous) {
+    return previous.data;
+  }
+  const data = await handle(res);
+  const etag = res.headers.get('ETag');
+  if (etag) {
+    analyzeResults.set(body, { etag, data });
+  }
+  return data;
 }
 
-export async function chat(payload: { message: string }) {
+export async function chat(payload: { message: string; session_id?: string | null }) {
   const res = await fetch(`${BASE_URL}/chat`, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify(payload),
   });
-  return handle<{ reply: string }>(res);
+  return handle<{ reply: string; session_id?: string | null; cached?: boolean }>(res);
 }
 
 export { BASE_URL };
@@ -52,4 +69,40 @@ export async function listAnalyses(limit: number = 10) {
   return handle(res);
 }
 
+export async function listIncidents(limit: number = 20) {
+  const res = await fetch(`${BASE_URL}/incidents?limit=${Math.max(1, limit)}`);
+  return handle<IncidentSummary[]>(res);
+}
+
+/** Aggregated sentiment cells for a map viewport; bbox is [west, south, east, north]. */
+export async function getGeoInsights(bbox: [number, number, number, number], zoom: number, limit: number = 500) {
+  const params = new URLSearchParams({ bbox: bbox.map(v => v.toFixed(4)).join(','), zoom: String(zoom), limit: String(limit) });
+  const res = await fetch(`${BASE_URL}/insights/geo?${params}`);
+  return handle<GeoInsights>(res);
+}
+
 
+
+/**
+ * Subscribe to newly stored feedback analyses over server-sent events.
+ * `since` is an `analyzed_at` (epoch seconds) to catch up from; EventSource
+ * resumes from the last received event on its own after a reconnect.
+ * Returns an unsubscribe function.
+ */
+export function subscribeAnalyses(
+  since: number,
+  onAnalysis: (record: unknown) => void,
+  onStatus?: (live: boolean) => void,
+): () => void {
+  const source = new EventSource(`${BASE_URL}/feedback/analyses/stream?since=${Math.max(0, Math.floor(since))}`);
+  source.addEventListener('analysis', (event) => {
+    try {
+      onAnalysis(JSON.parse((event as MessageEvent).data));
+    } catch {
+      // Ignore malformed frames; the next event or a reconnect catches up.
+    }
+  });
+  source.onopen = () => onStatus?.(true);
+  source.onerror = () => onStatus?.(false);
+  return () => source.close();
+}
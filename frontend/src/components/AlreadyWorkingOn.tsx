@@ -1,60 +1,62 @@
-import React from 'react';
+import React, { useEffect, useState } from 'react';
 import { motion } from 'framer-motion';
+import { listIncidents } from '../api';
+import type { IncidentSummary } from '../types';
 
 interface WorkItem {
-  id: number;
+  id: string;
   title: string;
   description: string;
   status: 'In Progress' | 'Under Review' | 'Fixed';
   priority: 'high' | 'medium' | 'low';
 }
 
+const REFRESH_MS = 60_000;
+
+function toPriority(priority?: string | null): WorkItem['priority'] {
+  const p = (priority || '').toLowerCase();
+  if (p.includes('p1') || p.includes('critical') || p.includes('high')) return 'high';
+  if (p.includes('p2') || p.includes('medium')) return 'medium';
+  return 'low';
+}
+
+function toWorkItem(incident: IncidentSummary): WorkItem {
+  const reports = `${incident.size} report${incident.size === 1 ? '' : 's'}`;
+  const details = [reports, incident.location, incident.team].filter(Boolean).join(' · ');
+  return {
+    id: incident.id,
+    title: incident.problem,
+    description: details,
+    status: incident.status === 'closed' ? 'Fixed' : incident.team ? 'In Progress' : 'Under Review',
+    priority: toPriority(incident.priority),
+  };
+}
+
 const AlreadyWorkingOn: React.FC = () => {
-  // Dummy data - will be replaced with backend data later
-  const workItems: WorkItem[] = [
-    {
-      id: 1,
-      title: 'Network Coverage Enhancement',
-      description: 'Improving 5G coverage in downtown areas',
-      status: 'In Progress',
-      priority: 'high'
-    },
-    {
-      id: 2,
-      title: 'Customer Service Bot Update',
-      description: 'Updating AI responses for billing inquiries',
-      status: 'Under Review',
-      priority: 'medium'
-    },
-    {
-      id: 3,
-      title: 'Mobile App Performance',
-      description: 'Optimizing app load times and responsiveness',
-      status: 'In Progress',
-      priority: 'high'
-    },
-    {
-      id: 4,
-      title: 'Data Security Audit',
-      description: 'Reviewing security protocols and compliance',
-      status: 'Under Review',
-      priority: 'high'
-    },
-    {
-      id: 5,
-      title: 'Billing System Integration',
-      description: 'Integrating new payment gateway',
-      status: 'Fixed',
-      priority: 'medium'
-    },
-    {
-      id: 6,
-      title: 'Customer Feedback Portal',
-      description: 'Enhancing feedback collection interface',
-      status: 'In Progress',
-      priority: 'low'
-    }
-  ];
+  // Incidents group similar feedback; size is how many reports each one covers.
+  const [workItems, setWorkItems] = useState<WorkItem[]>([]);
+  const [error, setError] = useState('');
+
+  useEffect(() => {
+    let cancelled = false;
+    const load = async () => {
+      try {
+        const incidents = await listIncidents(20);
+        if (!cancelled) {
+          setWorkItems(incidents.map(toWorkItem));
+          setError('');
+        }
+      } catch (e: any) {
+        if (!cancelled) setError(e?.message || 'Failed to load incidents');
+      }
+    };
+    load();
+    const timer = setInterval(load, REFRESH_MS);
+    return () => {
+      cancelled = true;
+      clearInterval(timer);
+    };
+  }, []);
 
   const getStatusColor = (status: string) => {
     switch (status) {
@@ -110,6 +112,10 @@ const AlreadyWorkingOn: React.FC = () => {
         Already Working On
       </h3>
       
+      {error && <p className="text-sm text-red-600 mb-2">Error: {error}</p>}
+      {!error && workItems.length === 0 && (
+        <p className="text-sm text-gray-500">No open incidents.</p>
+      )}
       <motion.div
         variants={containerVariants}
         initial="hidden"
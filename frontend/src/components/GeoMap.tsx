@@ -1,8 +1,15 @@
-import React, { useMemo } from 'react';
+import React, { useCallback, useMemo, useRef, useState } from 'react';
 import { motion } from 'framer-motion';
-import { GoogleMap, MarkerF, useJsApiLoader } from '@react-google-maps/api';
+import { CircleF, GoogleMap, MarkerF, useJsApiLoader } from '@react-google-maps/api';
 import { MapPin } from 'lucide-react';
-import type { AnalyzeResponse, SentimentResult } from '../types';
+import { getGeoInsights } from '../api';
+import type { AnalyzeResponse, GeoCell, SentimentResult } from '../types';
+
+function csiColor(csi: number): string {
+  if (csi < 40) return '#EF4444';
+  if (csi < 60) return '#F59E0B';
+  return '#10B981';
+}
 
 export default function GeoMap({ data, sentiments }: { data?: AnalyzeResponse | null; sentiments?: SentimentResult[] }) {
   const apiKey = process.env.REACT_APP_GOOGLE_MAPS_API_KEY as string | undefined;
@@ -21,7 +28,26 @@ export default function GeoMap({ data, sentiments }: { data?: AnalyzeResponse |
     });
     return list;
   }, [data, sentiments]);
-  const center = markers[0] || { lat: 32.7767, lng: -96.7970 };
+  const center = useMemo(() => markers[0] || { lat: 32.7767, lng: -96.7970 }, [markers]);
+
+  // Aggregated cells for the visible viewport, refetched whenever the map settles.
+  const mapRef = useRef<google.maps.Map | null>(null);
+  const [cells, setCells] = useState<GeoCell[]>([]);
+  const [cellTotal, setCellTotal] = useState(0);
+  const onIdle = useCallback(() => {
+    const map = mapRef.current;
+    const viewport = map?.getBounds();
+    if (!map || !viewport) return;
+    const sw = viewport.getSouthWest();
+    const ne = viewport.getNorthEast();
+    getGeoInsights([sw.lng(), sw.lat(), ne.lng(), ne.lat()], map.getZoom() ?? 4)
+      .then(res => {
+        setCells(res.cells);
+        setCellTotal(res.total_count);
+      })
+      .catch(() => setCells([]));
+  }, []);
+  const maxCount = cells.reduce((m, c) => Math.max(m, c.count), 1);
   
   if (!apiKey) {
     return (
@@ -68,6 +94,9 @@ export default function GeoMap({ data, sentiments }: { data?: AnalyzeResponse |
           mapContainerStyle={{ width: '100%', height: '100%' }} 
           center={center} 
           zoom={4}
+          onLoad={map => { mapRef.current = map; }}
+          onUnmount={() => { mapRef.current = null; }}
+          onIdle={onIdle}
           options={{
             styles: [
               {
@@ -78,6 +107,18 @@ export default function GeoMap({ data, sentiments }: { data?: AnalyzeResponse |
             ]
           }}
         >
+          {cells.map(c => {
+            // Radius scales with the cell's height (degrees of latitude ≈ 111 km) and its share of posts.
+            const cellMeters = (c.bounds[2] - c.bounds[0]) * 111_000;
+            return (
+              <CircleF
+                key={c.geohash}
+                center={{ lat: c.latitude, lng: c.longitude }}
+                radius={(cellMeters / 2) * Math.sqrt(c.count / maxCount)}
+                options={{ fillColor: csiColor(c.csi), fillOpacity: 0.35, strokeColor: csiColor(c.csi), strokeWeight: 1, clickable: false }}
+              />
+            );
+          })}
           {markers.map(m => <MarkerF key={m.key} position={{ lat: m.lat, lng: m.lng }} />)}
         </GoogleMap>
       </div>
@@ -94,6 +135,9 @@ export default function GeoMap({ data, sentiments }: { data?: AnalyzeResponse |
           <span className="text-sm font-bold text-gray-900 dark:text-white">{markers.length}</span>
           <span className="text-xs text-gray-500 dark:text-gray-400">locations</span>
         </div>
+        {cellTotal > 0 && (
+          <div className="text-xs text-gray-500 dark:text-gray-400">{cellTotal.toLocaleString()} reports in view</div>
+        )}
       </motion.div>
     </motion.div>
   );
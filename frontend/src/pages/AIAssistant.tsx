@@ -19,6 +19,8 @@ const AIAssistant: React.FC = () => {
   const [messages, setMessages] = useState<Message[]>([]);
   const [inputValue, setInputValue] = useState('');
   const [isTyping, setIsTyping] = useState(false);
+  // The server keeps the conversation; we only send the newest message.
+  const sessionIdRef = useRef<string | null>(null);
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const inputRef = useRef<HTMLInputElement>(null);
 
@@ -55,7 +57,8 @@ const AIAssistant: React.FC = () => {
     setIsTyping(true);
 
     try {
-      const res = await chat({ message: userMessage.text });
+      const res = await chat({ message: userMessage.text, session_id: sessionIdRef.current });
+      sessionIdRef.current = res.session_id ?? sessionIdRef.current;
       setIsTyping(false);
       const aiResponse: Message = {
         id: (Date.now() + 1).toString(),
@@ -14,10 +14,14 @@ import {
   RefreshCcw,
 } from 'lucide-react';
 import { useNavigate } from 'react-router-dom';
-import { listAnalyses } from '../api';
+import { listAnalyses, subscribeAnalyses } from '../api';
 import type { FeedbackAnalysis, WorkflowInsightCard, WorkflowInsightFlowStep } from '../types';
 
 const FETCH_LIMIT = 25;
+// Catch-up window when subscribing, so nothing stored while the list loads is missed.
+const SUBSCRIBE_OVERLAP_SECONDS = 5;
+
+const caseKey = (item: FeedbackAnalysis) => item.feedback_id || `${item.analyzed_at}:${item.problem}`;
 
 const AIWorkflow: React.FC = () => {
   const navigate = useNavigate();
@@ -26,6 +30,7 @@ const AIWorkflow: React.FC = () => {
   const [refreshing, setRefreshing] = useState(false);
   const [error, setError] = useState('');
   const [lastUpdated, setLastUpdated] = useState<number | null>(null);
+  const [live, setLive] = useState(false);
   const isMounted = useRef(true);
 
   useEffect(() => {
@@ -64,11 +69,26 @@ const AIWorkflow: React.FC = () => {
     }
   }, []);
 
+  const mergeCase = useCallback((item: FeedbackAnalysis) => {
+    if (!isMounted.current) return;
+    setCases((prev) => {
+      const rest = prev.filter((existing) => caseKey(existing) !== caseKey(item));
+      const next = item.resolved ? rest : [item, ...rest];
+      return next.sort((a, b) => b.analyzed_at - a.analyzed_at).slice(0, FETCH_LIMIT);
+    });
+    setLastUpdated(Date.now());
+  }, []);
+
   useEffect(() => {
+    const since = Date.now() / 1000 - SUBSCRIBE_OVERLAP_SECONDS;
     loadData(false);
-    const id = window.setInterval(() => loadData(true), 60000);
-    return () => window.clearInterval(id);
-  }, [loadData]);
+    const unsubscribe = subscribeAnalyses(
+      since,
+      (record) => mergeCase(record as FeedbackAnalysis),
+      (isLive) => isMounted.current && setLive(isLive),
+    );
+    return unsubscribe;
+  }, [loadData, mergeCase]);
 
   const openCount = cases.length;
   const lastUpdatedLabel = lastUpdated ? new Date(lastUpdated).toLocaleTimeString() : '—';
@@ -117,7 +137,7 @@ const AIWorkflow: React.FC = () => {
               <div className="mt-6 grid grid-cols-1 sm:grid-cols-3 gap-4">
                 <StatTile label="Open Cases" value={openCount.toString()} />
                 <StatTile label="Last Updated" value={lastUpdatedLabel} />
-                <StatTile label="Auto Refresh" value="Every 60s" />
+                <StatTile label="Updates" value={live ? 'Live' : 'Reconnecting…'} />
               </div>
             </motion.section>
 
@@ -106,6 +106,41 @@ export interface FeedbackAnalysis {
   insights: WorkflowInsights;
   resolved: boolean;
   analyzed_at: number; // epoch seconds
+  incident_id?: string | null;
+  prompt_version?: string | null;
+}
+
+export interface IncidentSummary {
+  id: string;
+  status: 'open' | 'closed';
+  problem: string;
+  location?: string | null;
+  category?: string | null;
+  team?: string | null;
+  priority?: string | null;
+  size: number; // feedback items grouped into this incident
+  first_seen: number; // epoch seconds
+  last_seen: number; // epoch seconds
+}
+
+export interface GeoCell {
+  geohash: string;
+  precision: number;
+  latitude: number; // centroid of the cell's posts
+  longitude: number;
+  bounds: [number, number, number, number]; // south, west, north, east
+  count: number;
+  csi: number;
+  avg_rating: number;
+  sentiments: Record<'negative' | 'neutral' | 'positive', number>;
+  categories: Record<string, number>;
+}
+
+export interface GeoInsights {
+  precision: number;
+  total_cells: number;
+  total_count: number;
+  cells: GeoCell[];
 }
 
 